@@ -12,7 +12,16 @@ interface ApiService {
     suspend fun login(@Body credentials: Map<String, String>): Response<Map<String, Any>>
 
     @GET("posts")
-    suspend fun getPosts(): Response<List<Post>>
+    suspend fun getPosts(
+        @Query("cursor") cursor: String? = null,
+        @Query("limit") limit: Int? = null
+    ): Response<PostsPage>
+
+    @GET("timeline")
+    suspend fun getTimeline(
+        @Query("cursor") cursor: String? = null,
+        @Query("limit") limit: Int? = null
+    ): Response<PostsPage>
 
     @POST("posts")
     suspend fun createPost(@Body post: Map<String, String>): Response<Map<String, Any>>
@@ -39,10 +48,24 @@ interface ApiService {
     suspend fun addFriend(@Path("userId") userId: Int): Response<Map<String, Any>>
 
     @GET("messages")
-    suspend fun getConversations(): Response<List<Conversation>>
+    suspend fun getConversations(
+        @Query("cursor") cursor: String? = null,
+        @Query("limit") limit: Int? = null
+    ): Response<ConversationsPage>
 
     @GET("messages/{userId}")
-    suspend fun getMessages(@Path("userId") userId: Int): Response<List<Message>>
+    suspend fun getMessages(
+        @Path("userId") userId: Int,
+        @Query("before_id") beforeId: Int? = null,
+        @Query("after_id") afterId: Int? = null,
+        @Query("limit") limit: Int? = null
+    ): Response<MessagesPage>
+
+    @POST("messages/{userId}/read")
+    suspend fun markMessagesRead(
+        @Path("userId") userId: Int,
+        @Body body: Map<String, Int>
+    ): Response<Map<String, Any>>
 
     @POST("messages/{userId}")
     suspend fun sendMessage(
@@ -50,6 +73,12 @@ interface ApiService {
         @Body message: Map<String, String>
     ): Response<Map<String, Any>>
 
+    @GET("events")
+    suspend fun pollEvents(
+        @Query("last_event_id") lastEventId: Int? = null,
+        @Query("timeout") timeout: Int? = null
+    ): Response<EventsPage>
+
     @GET("profile")
     suspend fun getProfile(): Response<User>
 
@@ -28,6 +28,11 @@ data class Post(
     @SerializedName("is_liked") val isLiked: Boolean
 )
 
+data class PostsPage(
+    @SerializedName("posts") val posts: List<Post>,
+    @SerializedName("next_cursor") val nextCursor: String?
+)
+
 data class Comment(
     @SerializedName("id") val id: Int,
     @SerializedName("content") val content: String,
@@ -43,9 +48,31 @@ data class Message(
     @SerializedName("is_sender") val isSender: Boolean
 )
 
+data class MessagesPage(
+    @SerializedName("messages") val messages: List<Message>,
+    @SerializedName("has_more") val hasMore: Boolean
+)
+
 data class Conversation(
     @SerializedName("user") val user: User,
-    @SerializedName("last_message") val lastMessage: Message
+    @SerializedName("last_message") val lastMessage: Message,
+    @SerializedName("unread_count") val unreadCount: Int
+)
+
+data class ConversationsPage(
+    @SerializedName("conversations") val conversations: List<Conversation>,
+    @SerializedName("next_cursor") val nextCursor: String?
+)
+
+data class Event(
+    @SerializedName("id") val id: Int,
+    @SerializedName("type") val type: String,
+    @SerializedName("data") val data: Map<String, Any>
+)
+
+data class EventsPage(
+    @SerializedName("events") val events: List<Event>,
+    @SerializedName("last_event_id") val lastEventId: Int
 )
 
 data class Friend(
@@ -28,9 +28,15 @@ class Repository {
         }
     }
 
-    suspend fun getPosts(): Response<List<Post>> {
+    suspend fun getPosts(cursor: String? = null, limit: Int? = null): Response<PostsPage> {
         return withContext(Dispatchers.IO) {
-            apiService.getPosts()
+            apiService.getPosts(cursor, limit)
+        }
+    }
+
+    suspend fun getTimeline(cursor: String? = null, limit: Int? = null): Response<PostsPage> {
+        return withContext(Dispatchers.IO) {
+            apiService.getTimeline(cursor, limit)
         }
     }
 
@@ -79,15 +85,21 @@ class Repository {
         }
     }
 
-    suspend fun getConversations(): Response<List<Conversation>> {
+    suspend fun getConversations(cursor: String? = null, limit: Int? = null): Response<ConversationsPage> {
+        return withContext(Dispatchers.IO) {
+            apiService.getConversations(cursor, limit)
+        }
+    }
+
+    suspend fun getMessages(userId: Int, beforeId: Int? = null, afterId: Int? = null): Response<MessagesPage> {
         return withContext(Dispatchers.IO) {
-            apiService.getConversations()
+            apiService.getMessages(userId, beforeId, afterId)
         }
     }
 
-    suspend fun getMessages(userId: Int): Response<List<Message>> {
+    suspend fun markMessagesRead(userId: Int, upToId: Int): Response<Map<String, Any>> {
         return withContext(Dispatchers.IO) {
-            apiService.getMessages(userId)
+            apiService.markMessagesRead(userId, mapOf("up_to_id" to upToId))
         }
     }
 
@@ -97,6 +109,13 @@ class Repository {
         }
     }
 
+    // Long-poll: запрос висит до появления события или таймаута
+    suspend fun pollEvents(lastEventId: Int?, timeout: Int = 25): Response<EventsPage> {
+        return withContext(Dispatchers.IO) {
+            apiService.pollEvents(lastEventId, timeout)
+        }
+    }
+
     suspend fun getProfile(): Response<User> {
         return withContext(Dispatchers.IO) {
             apiService.getProfile()
@@ -1,17 +1,47 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, request, current_app
 from flask_login import login_required, current_user
-from models import db, User, Post, Comment, Like, Follow, Friendship, PrivateMessage
+from models import db, User, Post, Comment, Friendship, FriendEdge, PrivateMessage, Notification
+from pagination import paginate_posts, get_limit, InvalidCursor
+from feed import load_liked_post_ids
+from counters import increment
+from conversations import mark_messages_read, inbox_page, history_page
+from events import broker, publish, format_sse
+from timeline import timeline_page, refresh_edge
+from friends import add_friend_edges, remove_friend_edges, mutual_friends_page, count_mutual_friends
+from suggestions import suggestions_for, mark_graph_changed
+from notifications import notify, mark_read as mark_notifications_read, unread_count, notifications_page
+from database import use_replica
+from query_stats import route_stats
+from response_cache import cached_response, bump, USERS_SCOPE
+from images import store_upload, media_url, image_url, image_variants, InvalidImage
+from search import SEARCH_INDEXES, search_available, match_query, search_page
+from tokens import ACCESS, REFRESH, issue_tokens, verify_token, revoke_token, bearer_token, InvalidToken
+from batch import parse_batch, run_batch, InvalidBatch
+from write_queue import submit_write
+from jobs import defer
+from writes import write_like_toggle, write_comment, write_message, write_follow_toggle
+from serializer import (
+    render, stream_array, USER_BRIEF, SUGGESTION, NOTIFICATION, MESSAGE_RESULT, CONVERSATION, PROFILE, USER_RESULT, InvalidFieldset,
+    POST_FIELDS, COMMENT_FIELDS, MESSAGE_FIELDS, FRIEND_FIELDS, FRIEND_REQUEST_FIELDS
+)
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from werkzeug.utils import secure_filename
-import os
 
 api = Blueprint('api', __name__)
 
+SSE_HEARTBEAT_SECONDS = 15
+STREAM_BATCH_ROWS = 500  # строк за одно чтение курсора в потоковых списках
+LONG_POLL_MAX_SECONDS = 30
+
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@api.before_request
+def route_reads():
+    # Чтение в GET-запросах уходит на реплику, если она настроена
+    use_replica(request.method == 'GET')
+
 # Аутентификация
 @api.route('/auth/register', methods=['POST'])
 def register():
@@ -54,38 +84,109 @@ def login():
             'user_id': user.id,
             'username': user.username,
             'email': user.email,
-            'avatar': user.avatar
+            'avatar': user.avatar,
+            **issue_tokens(user)
         })
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
+@api.route('/auth/refresh', methods=['POST'])
+def refresh_token():
+    data = request.get_json(silent=True) or {}
+    try:
+        claims = verify_token(data.get('refresh_token'), REFRESH)
+    except InvalidToken as e:
+        return jsonify({'error': str(e)}), 401
+    
+    user = db.session.get(User, claims['sub'])
+    if user is None:
+        return jsonify({'error': 'User not found'}), 401
+    
+    # Refresh-токен одноразовый: старый отзывается, клиент получает новую пару
+    revoke_token(claims)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Token revoked'}), 401
+    
+    return jsonify(issue_tokens(user))
+
+@api.route('/auth/logout', methods=['POST'])
+def logout():
+    # Отзываем access-токен из заголовка и refresh-токен из тела, если они переданы
+    data = request.get_json(silent=True) or {}
+    revoked = 0
+    for token, kind in ((bearer_token(request), ACCESS), (data.get('refresh_token'), REFRESH)):
+        try:
+            claims = verify_token(token, kind)
+        except InvalidToken:
+            continue
+        revoke_token(claims)
+        revoked += 1
+    
+    if not revoked:
+        return jsonify({'error': 'No valid token'}), 400
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Тот же токен параллельно отозвал другой запрос
+        db.session.rollback()
+    return jsonify({'message': 'Logged out'})
+
 # Посты
 @api.route('/posts', methods=['GET'])
 @login_required
+@cached_response('posts')
 def get_posts():
-    # Сначала получаем закрепленные посты
-    pinned_posts = Post.query.filter_by(is_pinned=True).order_by(Post.created_at.desc()).all()
-    # Затем получаем обычные посты
-    regular_posts = Post.query.filter_by(is_pinned=False).order_by(Post.created_at.desc()).all()
-    
-    # Объединяем посты, сначала закрепленные, затем обычные
-    all_posts = pinned_posts + regular_posts
-    
-    return jsonify([{
-        'id': post.id,
-        'content': post.content,
-        'image_url': post.image_url,
-        'created_at': post.created_at.isoformat(),
-        'is_pinned': post.is_pinned,
-        'author': {
-            'id': post.author.id,
-            'username': post.author.username,
-            'avatar': post.author.avatar
-        },
-        'likes_count': len(post.likes),
-        'comments_count': len(post.comments),
-        'is_liked': any(like.user_id == current_user.id for like in post.likes)
-    } for post in all_posts])
+    try:
+        selection = POST_FIELDS.select(request.args)
+        posts, next_cursor = paginate_posts(
+            Post.query.options(*selection.options),
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return render({
+        'posts': dump_posts(selection, posts),
+        'next_cursor': next_cursor
+    })
+
+def dump_posts(selection, posts):
+    # Лайки зрителя читаются, только если поле is_liked запрошено
+    liked_ids = load_liked_post_ids(posts, current_user.id) if 'is_liked' in selection else set()
+    return list(selection.schema.dump_many(posts, liked_ids=liked_ids))
+
+@api.route('/timeline', methods=['GET'])
+@login_required
+def get_timeline():
+    try:
+        selection = POST_FIELDS.select(request.args)
+        post_ids, next_cursor = timeline_page(
+            current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    posts_by_id = {
+        post.id: post
+        for post in Post.query.options(*selection.options).filter(Post.id.in_(post_ids)).all()
+    }
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    
+    return render({
+        'posts': dump_posts(selection, posts),
+        'next_cursor': next_cursor
+    })
 
 @api.route('/posts', methods=['POST'])
 @login_required
@@ -100,42 +201,43 @@ def create_post():
             return jsonify({'error': 'Содержание поста обязательно'}), 400
             
         # Обрабатываем изображение, если оно есть
-        image_url = None
+        stored_image_url = None
         if image and image.filename:
             if not allowed_file(image.filename):
                 return jsonify({'error': 'Недопустимый формат файла'}), 400
                 
-            # Создаем уникальное имя файла
-            filename = secure_filename(f"{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-            
-            # Создаем директорию для изображений, если её нет
-            upload_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'posts')
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            # Сохраняем файл
-            image_path = os.path.join(upload_folder, filename)
-            image.save(image_path)
+            # Файл хранится под хешем содержимого, уменьшенные варианты строятся в фоне
+            try:
+                digest = store_upload(image)
+            except InvalidImage:
+                return jsonify({'error': 'Недопустимый формат файла'}), 400
             
-            # Сохраняем относительный путь для URL
-            image_url = f'/static/uploads/posts/{filename}'
+            # В посте храним ссылку на полный вариант, остальные выводятся из нее
+            stored_image_url = media_url(digest, 'full')
         
         # Создаем пост
         post = Post(
             content=content,
-            image_url=image_url,
+            image_url=stored_image_url,
             author_id=current_user.id,
             is_pinned=False
         )
         
         db.session.add(post)
+        increment(User, current_user.id, User.posts_count)
+        db.session.flush()
+        # Рассылка по лентам аудитории уходит воркеру, если очередь задач включена
+        defer('fan_out_post', post.id, priority=10)
         db.session.commit()
+        bump('posts', f'profile:{current_user.id}')
         
         return jsonify({
             'message': 'Пост успешно создан',
             'post': {
                 'id': post.id,
                 'content': post.content,
-                'image_url': post.image_url,
+                'image_url': image_url(post.image_url, 'feed'),
+                'image': image_variants(post.image_url),
                 'created_at': post.created_at.isoformat(),
                 'author': {
                     'id': current_user.id,
@@ -152,18 +254,18 @@ def create_post():
 # Комментарии
 @api.route('/posts/<int:post_id>/comments', methods=['GET'])
 @login_required
+@cached_response('comments:{post_id}')
 def get_comments(post_id):
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
-    return jsonify([{
-        'id': comment.id,
-        'content': comment.content,
-        'created_at': comment.created_at.isoformat(),
-        'author': {
-            'id': comment.author.id,
-            'username': comment.author.username,
-            'avatar': comment.author.avatar
-        }
-    } for comment in comments])
+    try:
+        selection = COMMENT_FIELDS.select(request.args)
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Список не ограничен по длине: строки читаются порциями и сразу кодируются
+    comments = Comment.query.options(*selection.options).filter_by(
+        post_id=post_id
+    ).order_by(Comment.created_at.desc()).yield_per(STREAM_BATCH_ROWS)
+    return stream_array(selection.schema, comments)
 
 @api.route('/posts/<int:post_id>/comments', methods=['POST'])
 @login_required
@@ -171,67 +273,79 @@ def create_comment(post_id):
     data = request.get_json()
     content = data.get('content')
     
-    comment = Comment(
-        content=content,
-        user_id=current_user.id,
-        post_id=post_id
-    )
-    
-    db.session.add(comment)
-    db.session.commit()
+    comment_id = submit_write(write_comment, current_user.id, post_id, content)
+    bump('posts', f'comments:{post_id}')
+    publish_post_activity('comment', post_id, Post.comments_count)
     
     return jsonify({
         'message': 'Comment added successfully',
-        'comment_id': comment.id
+        'comment_id': comment_id
     }), 201
 
 # Лайки
 @api.route('/posts/<int:post_id>/like', methods=['POST'])
 @login_required
 def toggle_like(post_id):
-    like = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first()
+    is_liked = submit_write(write_like_toggle, current_user.id, post_id)
+    bump('posts')
+    publish_post_activity('like', post_id, Post.likes_count)
     
-    if like:
-        db.session.delete(like)
-        db.session.commit()
-        return jsonify({'message': 'Post unliked', 'is_liked': False})
+    return jsonify({'message': 'Post liked' if is_liked else 'Post unliked', 'is_liked': is_liked})
+
+def publish_post_activity(event_type, post_id, counter):
+    # Счетчик публикуем уже закоммиченным, клиенты просто выставляют его значение
+    row = db.session.query(Post.author_id, counter).filter(Post.id == post_id).first()
+    if row is None:
+        return
+    author_id, count = row
+    publish(event_type, {
+        'post_id': post_id,
+        'author_id': author_id,
+        'user_id': current_user.id,
+        counter.key: count
+    })
+
+# Друзья
+@api.route('/users/<int:user_id>/follow', methods=['POST'])
+@login_required
+def follow_user(user_id):
+    if current_user.id == user_id:
+        return jsonify({'message': 'Cannot follow yourself'})
     
-    like = Like(user_id=current_user.id, post_id=post_id)
-    db.session.add(like)
-    db.session.commit()
+    is_following = submit_write(write_follow_toggle, current_user.id, user_id)
+    bump(f'profile:{current_user.id}', f'profile:{user_id}')
     
-    return jsonify({'message': 'Post liked', 'is_liked': True})
+    return jsonify({'message': 'User followed' if is_following else 'User unfollowed'})
 
-# Друзья
 @api.route('/friends', methods=['GET'])
 @login_required
+@cached_response('friends:{viewer}')
 def get_friends():
-    friends = Friendship.query.filter(
-        ((Friendship.user_id == current_user.id) | (Friendship.friend_id == current_user.id)) &
-        (Friendship.status == 'accepted')
-    ).all()
-    
-    return jsonify([{
-        'id': friend.friend.id if friend.user_id == current_user.id else friend.user.id,
-        'username': friend.friend.username if friend.user_id == current_user.id else friend.user.username,
-        'avatar': friend.friend.avatar if friend.user_id == current_user.id else friend.user.avatar,
-        'status': friend.status
-    } for friend in friends])
+    try:
+        selection = FRIEND_FIELDS.select(request.args)
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    
+    friends = User.query.options(*selection.options).join(
+        FriendEdge, FriendEdge.friend_id == User.id
+    ).filter(FriendEdge.user_id == current_user.id).order_by(FriendEdge.friend_id).yield_per(STREAM_BATCH_ROWS)
+    
+    return stream_array(selection.schema, friends)
 
 @api.route('/friends/requests', methods=['GET'])
 @login_required
 def get_friend_requests():
-    requests = Friendship.query.filter(
+    try:
+        selection = FRIEND_REQUEST_FIELDS.select(request.args)
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    
+    requests = Friendship.query.options(*selection.options).filter(
         (Friendship.friend_id == current_user.id) &
         (Friendship.status == 'pending')
-    ).all()
+    ).yield_per(STREAM_BATCH_ROWS)
     
-    return jsonify([{
-        'id': request.user.id,
-        'username': request.user.username,
-        'avatar': request.user.avatar,
-        'request_id': request.id
-    } for request in requests])
+    return stream_array(selection.schema, requests)
 
 @api.route('/friends/<int:user_id>/add', methods=['POST'])
 @login_required
@@ -254,57 +368,177 @@ def add_friend(user_id):
     )
     
     db.session.add(friendship)
+    notify(user_id, 'friend_request', current_user.id, current_user.id)
     db.session.commit()
     
+    publish('friend_request', {
+        'request_id': friendship.id,
+        'user': {
+            'id': current_user.id,
+            'username': current_user.username,
+            'avatar': current_user.avatar
+        }
+    }, user_ids=[user_id])
+    
     return jsonify({'message': 'Friend request sent'})
 
+@api.route('/friends/<int:request_id>/accept', methods=['POST'])
+@login_required
+def accept_friend(request_id):
+    friendship = Friendship.query.get_or_404(request_id)
+    
+    if friendship.friend_id != current_user.id:
+        return jsonify({'message': 'Unauthorized'})
+    
+    if friendship.status != 'accepted':
+        friendship.status = 'accepted'
+        add_friend_edges(friendship.user_id, friendship.friend_id)
+        mark_graph_changed(friendship.user_id, friendship.friend_id)
+        increment(User, friendship.user_id, User.friends_count)
+        increment(User, friendship.friend_id, User.friends_count)
+        notify(friendship.user_id, 'friend_accept', friendship.friend_id, friendship.friend_id)
+        db.session.flush()
+        refresh_edge(friendship.user_id, friendship.friend_id)
+        refresh_edge(friendship.friend_id, friendship.user_id)
+    mark_friend_request_read(friendship)
+    db.session.commit()
+    bump_friendship(friendship)
+    
+    return jsonify({'message': 'Friend request accepted'})
+
+@api.route('/friends/<int:request_id>/reject', methods=['POST'])
+@login_required
+def reject_friend(request_id):
+    friendship = Friendship.query.get_or_404(request_id)
+    
+    if friendship.friend_id != current_user.id:
+        return jsonify({'message': 'Unauthorized'})
+    
+    # Отклонение принятой заявки удаляет пользователей из друзей
+    if friendship.status == 'accepted':
+        remove_friend_edges(friendship.user_id, friendship.friend_id)
+        mark_graph_changed(friendship.user_id, friendship.friend_id)
+        increment(User, friendship.user_id, User.friends_count, -1)
+        increment(User, friendship.friend_id, User.friends_count, -1)
+    friendship.status = 'rejected'
+    db.session.flush()
+    refresh_edge(friendship.user_id, friendship.friend_id)
+    refresh_edge(friendship.friend_id, friendship.user_id)
+    mark_friend_request_read(friendship)
+    db.session.commit()
+    bump_friendship(friendship)
+    
+    return jsonify({'message': 'Friend request rejected'})
+
+def bump_friendship(friendship):
+    # Изменение дружбы меняет списки друзей и счетчики в профилях обоих пользователей
+    bump(
+        f'friends:{friendship.user_id}', f'friends:{friendship.friend_id}',
+        f'profile:{friendship.user_id}', f'profile:{friendship.friend_id}'
+    )
+
+def mark_friend_request_read(friendship):
+    # Заявка обработана — уведомление о ней больше не висит непрочитанным
+    mark_notifications_read(
+        friendship.friend_id,
+        Notification.kind == 'friend_request',
+        Notification.target_id == friendship.user_id
+    )
+
+@api.route('/users/<int:user_id>/mutual_friends', methods=['GET'])
+@login_required
+def get_mutual_friends(user_id):
+    if db.session.get(User, user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    try:
+        users, next_cursor = mutual_friends_page(
+            current_user.id, user_id,
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return render({
+        'count': count_mutual_friends(current_user.id, user_id),
+        'users': list(USER_BRIEF.dump_many(users)),
+        'next_cursor': next_cursor
+    })
+
+@api.route('/suggestions', methods=['GET'])
+@login_required
+def get_suggestions():
+    # Список готовит `flask compute-suggestions`; маршрут только читает top-K
+    suggestions = suggestions_for(current_user.id, get_limit(request.args.get('limit')))
+    return render({'suggestions': list(SUGGESTION.dump_many(suggestions))})
+
 # Сообщения
 @api.route('/messages', methods=['GET'])
 @login_required
 def get_conversations():
-    conversations = db.session.query(
-        User, PrivateMessage
-    ).join(
-        PrivateMessage,
-        (User.id == PrivateMessage.sender_id) | (User.id == PrivateMessage.receiver_id)
-    ).filter(
-        (PrivateMessage.sender_id == current_user.id) | (PrivateMessage.receiver_id == current_user.id)
-    ).order_by(PrivateMessage.created_at.desc()).all()
-    
-    return jsonify([{
-        'user': {
-            'id': user.id,
-            'username': user.username,
-            'avatar': user.avatar
-        },
-        'last_message': {
-            'content': message.content,
-            'created_at': message.created_at.isoformat(),
-            'is_read': message.is_read
-        }
-    } for user, message in conversations])
+    try:
+        rows, next_cursor = inbox_page(
+            current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return render({
+        'conversations': list(CONVERSATION.dump_many(rows, viewer_id=current_user.id)),
+        'next_cursor': next_cursor
+    })
 
 @api.route('/messages/<int:user_id>', methods=['GET'])
 @login_required
 def get_messages(user_id):
-    messages = PrivateMessage.query.filter(
-        ((PrivateMessage.sender_id == current_user.id) & (PrivateMessage.receiver_id == user_id)) |
-        ((PrivateMessage.sender_id == user_id) & (PrivateMessage.receiver_id == current_user.id))
-    ).order_by(PrivateMessage.created_at.asc()).all()
-    
-    # Помечаем сообщения как прочитанные
-    for message in messages:
-        if message.receiver_id == current_user.id and not message.is_read:
-            message.is_read = True
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    try:
+        selection = MESSAGE_FIELDS.select(request.args)
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    
+    messages, has_more = history_page(
+        current_user.id, user_id,
+        before_id=before_id,
+        after_id=after_id,
+        limit=get_limit(request.args.get('limit')),
+        options=selection.options
+    )
+    
+    # Свежая страница (не прокрутка истории вверх) помечается прочитанной до последнего
+    # показанного сообщения. Уведомление снимаем, только если новее ничего нет:
+    # при after_id has_more означает, что клиент дочитал не все
+    if messages and before_id is None:
+        mark_messages_read(current_user.id, user_id, messages[-1].id)
+        if after_id is None or not has_more:
+            mark_notifications_read(current_user.id, Notification.kind == 'message', Notification.target_id == user_id)
+    
+    response = render({
+        'messages': list(selection.schema.dump_many(messages, viewer_id=current_user.id)),
+        'has_more': has_more
+    })
     db.session.commit()
     
-    return jsonify([{
-        'id': message.id,
-        'content': message.content,
-        'created_at': message.created_at.isoformat(),
-        'is_read': message.is_read,
-        'is_sender': message.sender_id == current_user.id
-    } for message in messages])
+    return response
+
+@api.route('/messages/<int:user_id>/read', methods=['POST'])
+@login_required
+def mark_read(user_id):
+    data = request.get_json()
+    up_to_id = data.get('up_to_id')
+    
+    if not isinstance(up_to_id, int):
+        return jsonify({'error': 'up_to_id is required'}), 400
+    
+    mark_messages_read(current_user.id, user_id, up_to_id)
+    mark_notifications_read(current_user.id, Notification.kind == 'message', Notification.target_id == user_id)
+    db.session.commit()
+    
+    return jsonify({'message': 'Messages marked as read'})
 
 @api.route('/messages/<int:user_id>', methods=['POST'])
 @login_required
@@ -312,36 +546,109 @@ def send_message(user_id):
     data = request.get_json()
     content = data.get('content')
     
-    message = PrivateMessage(
-        sender_id=current_user.id,
-        receiver_id=user_id,
-        content=content
-    )
-    
-    db.session.add(message)
-    db.session.commit()
+    message = submit_write(write_message, current_user.id, user_id, content)
+    publish('message', message, user_ids=[message['sender_id'], message['receiver_id']])
     
     return jsonify({
         'message': 'Message sent successfully',
-        'message_id': message.id
+        'message_id': message['id']
     }), 201
 
+# Уведомления
+@api.route('/notifications', methods=['GET'])
+@login_required
+def get_notifications():
+    try:
+        notifications, next_cursor = notifications_page(
+            current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return render({
+        'notifications': list(NOTIFICATION.dump_many(notifications)),
+        'next_cursor': next_cursor
+    })
+
+@api.route('/notifications/read', methods=['POST'])
+@login_required
+def read_notifications():
+    # {"ids": [...]} помечает выбранные уведомления, пустое тело — все
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    
+    if ids is None:
+        marked = mark_notifications_read(current_user.id)
+    elif isinstance(ids, list) and all(isinstance(i, int) for i in ids):
+        marked = mark_notifications_read(current_user.id, Notification.id.in_(ids)) if ids else 0
+    else:
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    db.session.commit()
+    
+    return jsonify({'marked': marked, 'unread_count': unread_count(current_user.id)})
+
+@api.route('/notifications/unread_count', methods=['GET'])
+@login_required
+def get_unread_count():
+    # Счетчик поддерживается при записи событий: одно чтение по первичному ключу
+    return jsonify({'unread_count': unread_count(current_user.id)})
+
+# События
+def last_event_id():
+    # EventSource присылает заголовок при переподключении, long-poll — параметр
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return broker.last_id
+
+@api.route('/events/stream', methods=['GET'])
+@login_required
+def event_stream():
+    user_id = current_user.id
+    cursor = last_event_id()
+    
+    def generate(cursor):
+        yield 'retry: 3000\n\n'
+        while True:
+            events, cursor = broker.wait(user_id, cursor, SSE_HEARTBEAT_SECONDS)
+            if not events:
+                yield ': keep-alive\n\n'
+            for event_id, event_type, data in events:
+                yield format_sse(event_id, event_type, data)
+    
+    return Response(generate(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@api.route('/events', methods=['GET'])
+@login_required
+def poll_events():
+    user_id = current_user.id
+    timeout = min(request.args.get('timeout', 25, type=float), LONG_POLL_MAX_SECONDS)
+    
+    # Не держим транзакцию (и блокировку SQLite) на время ожидания
+    db.session.close()
+    events, cursor = broker.wait(user_id, last_event_id(), max(timeout, 0))
+    
+    return jsonify({
+        'events': [{
+            'id': event_id,
+            'type': event_type,
+            'data': data
+        } for event_id, event_type, data in events],
+        'last_event_id': cursor
+    })
+
 # Профиль
 @api.route('/profile', methods=['GET'])
 @login_required
+@cached_response('profile:{viewer}')
 def get_profile():
-    return jsonify({
-        'id': current_user.id,
-        'username': current_user.username,
-        'email': current_user.email,
-        'avatar': current_user.avatar,
-        'bio': current_user.bio,
-        'created_at': current_user.created_at.isoformat(),
-        'posts_count': len(current_user.posts),
-        'friends_count': len(current_user.friends),
-        'followers_count': len(current_user.followers),
-        'following_count': len(current_user.following)
-    })
+    return render(PROFILE.dump(current_user))
 
 @api.route('/profile', methods=['PUT'])
 @login_required
@@ -358,6 +665,8 @@ def update_profile():
         current_user.avatar = data['avatar']
     
     db.session.commit()
+    # Имя и аватар встроены в посты, комментарии и списки друзей
+    bump(USERS_SCOPE, f'profile:{current_user.id}')
     
     return jsonify({'message': 'Profile updated successfully'})
 
@@ -372,8 +681,83 @@ def toggle_pin(post_id):
     
     post.is_pinned = not post.is_pinned
     db.session.commit()
+    bump('posts')
     
     return jsonify({
         'message': 'Post pinned successfully' if post.is_pinned else 'Post unpinned successfully',
         'is_pinned': post.is_pinned
-    }) 
\ No newline at end of file
+    })
+
+# Поиск
+@api.route('/search', methods=['GET'])
+@login_required
+def search():
+    kind = request.args.get('type', 'posts')
+    q = request.args.get('q', '')
+    
+    if kind not in SEARCH_INDEXES:
+        return jsonify({'error': 'type must be one of: users, posts, messages'}), 400
+    if not match_query(q):
+        return jsonify({'error': 'Query is required'}), 400
+    if not search_available():
+        return jsonify({'error': 'Search is not available'}), 501
+    
+    try:
+        # ?fields= и ?include= работают для постов, остальные типы отдаются целиком
+        selection = POST_FIELDS.select(request.args) if kind == 'posts' else None
+        ids, next_cursor = search_page(
+            kind, q, current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=get_limit(request.args.get('limit'))
+        )
+    except InvalidFieldset as e:
+        return jsonify({'error': str(e)}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    if kind == 'users':
+        users_by_id = {user.id: user for user in User.query.filter(User.id.in_(ids)).all()}
+        users = (users_by_id[user_id] for user_id in ids if user_id in users_by_id)
+        results = list(USER_RESULT.dump_many(users))
+    elif kind == 'posts':
+        posts_by_id = {
+            post.id: post
+            for post in Post.query.options(*selection.options).filter(Post.id.in_(ids)).all()
+        }
+        posts = [posts_by_id[post_id] for post_id in ids if post_id in posts_by_id]
+        results = dump_posts(selection, posts)
+    else:
+        messages_by_id = {message.id: message for message in PrivateMessage.query.filter(PrivateMessage.id.in_(ids)).all()}
+        messages = (messages_by_id[message_id] for message_id in ids if message_id in messages_by_id)
+        results = list(MESSAGE_RESULT.dump_many(messages, viewer_id=current_user.id))
+    
+    return render({'results': results, 'next_cursor': next_cursor})
+
+# Пакетные запросы
+@api.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    try:
+        items = parse_batch(request.get_json(silent=True))
+    except InvalidBatch as e:
+        return jsonify({'error': str(e)}), 400
+    
+    max_size = current_app.config['API_BATCH_MAX_SIZE']
+    if len(items) > max_size:
+        return jsonify({'error': f'Batch is limited to {max_size} requests'}), 413
+    
+    results, committed = run_batch(items)
+    return render({'committed': committed, 'responses': results})
+
+# Администрирование
+@api.route('/admin/query_stats', methods=['GET', 'DELETE'])
+@login_required
+def query_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if request.method == 'DELETE':
+        route_stats.reset()
+        return jsonify({'message': 'Query stats reset'})
+    
+    return jsonify({'routes': route_stats.snapshot()})
\ No newline at end of file
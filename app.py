@@ -1,32 +1,65 @@
-from flask import Flask, jsonify, request, render_template, redirect, url_for, flash, send_from_directory
+from flask import Flask, jsonify, request, render_template, redirect, url_for, flash, send_from_directory, abort
 from flask_login import LoginManager, login_required, current_user, login_user, logout_user
 from flask_migrate import Migrate
 import os
-from pathlib import Path
-from models import db, User, Post, Comment, Like, Follow, Friendship, PrivateMessage
+from models import db, User, Friendship, FriendEdge, Notification
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta
-from werkzeug.utils import secure_filename
 from api import api
+from pagination import paginate_posts
+from feed import posts_query, load_liked_post_ids
+from counters import repair_counters
+from conversations import mark_messages_read, inbox_page, history_page
+from pagination import InvalidCursor
+from timeline import rebuild_timeline
+from friends import rebuild_friend_edges
+from notifications import mark_read
+from jobs import defer, run_workers, requeue_dead_jobs, enqueue, TASKS
+import tasks  # регистрирует задачи очереди
+import click
+import json
+from config import Config
+from database import configure_engines
+from query_stats import init_query_stats
+from metrics import init_metrics
+from user_cache import load_cached_user
+from tokens import user_from_request
+from write_queue import init_write_queue
+from response_cache import bump, USERS_SCOPE
+from images import store_upload, ensure_variant, variant_name, media_digest, image_url, avatar_url, InvalidImage, MEDIA_NAME_RE
+from search import create_search_index, reindex, search_available, match_query, search_page
+from sqlalchemy.orm import joinedload
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Общий ключ нужен, чтобы сессии и токены API проверялись на любом воркере
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(24)
+# Подключение к БД и пул настраиваются переменными окружения, см. config.py
+app.config.from_object(Config)
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=30)
 app.config['UPLOAD_FOLDER'] = 'static/uploads/avatars'
+app.config['MEDIA_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads', 'media')  # загрузки по хешу содержимого и их варианты
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 
 # Создаем папку для загрузки аватаров, если она не существует
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+MEDIA_MAX_AGE = 365 * 24 * 3600
+USERS_SEARCH_LIMIT = 50
+
+# Ссылки на нужные варианты изображений в шаблонах
+app.jinja_env.globals.update(image_url=image_url, avatar_url=avatar_url, media_digest=media_digest)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 # Инициализация расширений
 db.init_app(app)
+configure_engines(app, db)
+init_query_stats(app, db)
+init_metrics(app, db)
+init_write_queue(app)
 migrate = Migrate(app, db)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -38,22 +71,106 @@ app.register_blueprint(api, url_prefix='/api')
 # Создаем базу данных, если она не существует
 with app.app_context():
     db.create_all()
+    # Виртуальные таблицы FTS5 и триггеры create_all не создает
+    create_search_index()
     print("База данных инициализирована!")
 
+@app.cli.command('repair-counters')
+def repair_counters_command():
+    """Пересчитать денормализованные счетчики постов и пользователей."""
+    repair_counters()
+    print("Счетчики пересчитаны!")
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """Перестроить полнотекстовые индексы пользователей, постов и сообщений."""
+    if not search_available():
+        print("Полнотекстовый поиск доступен только на SQLite")
+        return
+    reindex()
+    print("Поисковые индексы перестроены!")
+
+@app.cli.command('rebuild-friend-edges')
+def rebuild_friend_edges_command():
+    """Перестроить зеркальную таблицу друзей по принятым заявкам."""
+    rebuild_friend_edges()
+    print("Таблица друзей перестроена!")
+
+@app.cli.command('compute-suggestions')
+@click.option('--full', is_flag=True, help='Пересчитать всех пользователей, а не только изменившихся')
+def compute_suggestions_command(full):
+    """Пересчитать подсказки "Возможно, вы знакомы" по графу друзей и подписок."""
+    # NumPy и SciPy нужны только этой команде, веб-воркеры их не загружают
+    from suggestion_job import compute_suggestions
+    stats = compute_suggestions(full=full)
+    print(f"Подсказки пересчитаны: пользователей {stats['users']}, подсказок {stats['suggestions']}, "
+          f"ребер дружбы {stats['friend_edges']}, подписок {stats['follow_edges']}, {stats['seconds']} с")
+
+@app.cli.command('worker')
+@click.option('--processes', default=1, show_default=True, help='Число процессов-воркеров')
+def worker_command(processes):
+    """Запустить воркеры очереди задач."""
+    run_workers(app, processes)
+
+@app.cli.command('enqueue')
+@click.argument('name')
+@click.argument('args', nargs=-1)
+@click.option('--priority', default=0, help='Задачи с большим приоритетом берутся раньше')
+def enqueue_command(name, args, priority):
+    """Поставить задачу в очередь; аргументы разбираются как JSON."""
+    if name not in TASKS:
+        raise click.BadParameter(f"доступны: {', '.join(sorted(TASKS))}", param_hint='NAME')
+    values = []
+    for arg in args:
+        try:
+            values.append(json.loads(arg))
+        except ValueError:
+            values.append(arg)
+    job = enqueue(name, *values, priority=priority)
+    db.session.commit()
+    print(f"Задача {job.id} ({name}) поставлена в очередь")
+
+@app.cli.command('requeue-dead-jobs')
+@click.option('--name', help='Только задачи с этим именем')
+def requeue_dead_jobs_command(name):
+    """Вернуть в очередь задачи, исчерпавшие попытки."""
+    print(f"Возвращено задач: {requeue_dead_jobs(name)}")
+
+@app.cli.command('rebuild-timeline')
+@click.argument('user_id', type=int)
+def rebuild_timeline_command(user_id):
+    """Пересобрать материализованную ленту подписок пользователя."""
+    authors = rebuild_timeline(user_id)
+    print(f"Лента пользователя {user_id} пересобрана, авторов: {authors}")
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(int(user_id))
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    # Клиенты API передают access-токен в заголовке Authorization: Bearer ...
+    return user_from_request(request)
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    # API отвечает 401, чтобы клиент мог обновить токен, сайт — редиректит на вход
+    if request.blueprint == 'api':
+        return jsonify({'error': 'Unauthorized'}), 401
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(url_for('login', next=request.url))
 
 @app.route('/')
 def index():
-    # Получаем сначала закрепленные посты
-    pinned_posts = Post.query.filter_by(is_pinned=True).order_by(Post.created_at.desc()).all()
-    # Затем получаем обычные посты
-    regular_posts = Post.query.filter_by(is_pinned=False).order_by(Post.created_at.desc()).all()
-    # Объединяем посты
-    posts = pinned_posts + regular_posts
-    
-    return render_template('index.html', posts=posts)
+    # Рендерим одну страницу ленты: вошедшие подгружают следующие через /api/posts,
+    # гости переходят по ссылке с ?cursor=
+    try:
+        posts, next_cursor = paginate_posts(posts_query(), cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        return redirect(url_for('index'))
+    liked_ids = load_liked_post_ids(posts, current_user.id if current_user.is_authenticated else None)
+    
+    return render_template('index.html', posts=posts, liked_ids=liked_ids, next_cursor=next_cursor)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -106,86 +223,11 @@ def logout():
     logout_user()
     return redirect(url_for('index'))
 
-@app.route('/api/posts', methods=['GET'])
-@login_required
-def posts():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return jsonify([{
-        'id': post.id,
-        'content': post.content,
-        'image_url': post.image_url,
-        'created_at': post.created_at,
-        'author': post.author.username
-    } for post in posts])
-
-@app.route('/api/posts/<int:post_id>/comments', methods=['GET', 'POST'])
-@login_required
-def comments(post_id):
-    if request.method == 'POST':
-        content = request.form.get('content')
-        
-        comment = Comment(
-            content=content,
-            user_id=current_user.id,
-            post_id=post_id
-        )
-        
-        db.session.add(comment)
-        db.session.commit()
-        
-        return jsonify({'message': 'Comment added successfully'})
-    
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
-    return jsonify([{
-        'id': comment.id,
-        'content': comment.content,
-        'created_at': comment.created_at,
-        'author': comment.author.username
-    } for comment in comments])
-
-@app.route('/api/posts/<int:post_id>/like', methods=['POST'])
-@login_required
-def like_post(post_id):
-    like = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first()
-    
-    if like:
-        db.session.delete(like)
-        db.session.commit()
-        return jsonify({'message': 'Post unliked'})
-    
-    like = Like(user_id=current_user.id, post_id=post_id)
-    db.session.add(like)
-    db.session.commit()
-    
-    return jsonify({'message': 'Post liked'})
-
-@app.route('/api/users/<int:user_id>/follow', methods=['POST'])
-@login_required
-def follow_user(user_id):
-    if current_user.id == user_id:
-        return jsonify({'message': 'Cannot follow yourself'})
-    
-    follow = Follow.query.filter_by(follower_id=current_user.id, followed_id=user_id).first()
-    
-    if follow:
-        db.session.delete(follow)
-        db.session.commit()
-        return jsonify({'message': 'User unfollowed'})
-    
-    follow = Follow(follower_id=current_user.id, followed_id=user_id)
-    db.session.add(follow)
-    db.session.commit()
-    
-    return jsonify({'message': 'User followed'})
-
 @app.route('/friends')
 @login_required
 def friends():
     # Получаем список друзей и заявок в друзья
-    friends = Friendship.query.filter(
-        ((Friendship.user_id == current_user.id) | (Friendship.friend_id == current_user.id)) &
-        (Friendship.status == 'accepted')
-    ).all()
+    friends = FriendEdge.query.options(joinedload(FriendEdge.friend)).filter_by(user_id=current_user.id).all()
     
     friend_requests = Friendship.query.filter(
         (Friendship.friend_id == current_user.id) &
@@ -194,134 +236,68 @@ def friends():
     
     return render_template('friends.html', friends=friends, friend_requests=friend_requests)
 
-@app.route('/api/friends/<int:user_id>/add', methods=['POST'])
-@login_required
-def add_friend(user_id):
-    if current_user.id == user_id:
-        return jsonify({'message': 'Cannot add yourself as a friend'})
-    
-    # Проверяем, не существует ли уже заявка
-    existing_request = Friendship.query.filter(
-        ((Friendship.user_id == current_user.id) & (Friendship.friend_id == user_id)) |
-        ((Friendship.user_id == user_id) & (Friendship.friend_id == current_user.id))
-    ).first()
-    
-    if existing_request:
-        return jsonify({'message': 'Friend request already exists'})
-    
-    friendship = Friendship(
-        user_id=current_user.id,
-        friend_id=user_id,
-        status='pending'
-    )
-    
-    db.session.add(friendship)
-    db.session.commit()
-    
-    return jsonify({'message': 'Friend request sent'})
-
-@app.route('/api/friends/<int:request_id>/accept', methods=['POST'])
-@login_required
-def accept_friend(request_id):
-    friendship = Friendship.query.get_or_404(request_id)
-    
-    if friendship.friend_id != current_user.id:
-        return jsonify({'message': 'Unauthorized'})
-    
-    friendship.status = 'accepted'
-    db.session.commit()
-    
-    return jsonify({'message': 'Friend request accepted'})
-
-@app.route('/api/friends/<int:request_id>/reject', methods=['POST'])
-@login_required
-def reject_friend(request_id):
-    friendship = Friendship.query.get_or_404(request_id)
-    
-    if friendship.friend_id != current_user.id:
-        return jsonify({'message': 'Unauthorized'})
-    
-    friendship.status = 'rejected'
-    db.session.commit()
-    
-    return jsonify({'message': 'Friend request rejected'})
-
 @app.route('/messages')
 @login_required
 def messages():
-    # Получаем список диалогов
-    conversations = db.session.query(
-        User, PrivateMessage
-    ).join(
-        PrivateMessage,
-        (User.id == PrivateMessage.sender_id) | (User.id == PrivateMessage.receiver_id)
-    ).filter(
-        (PrivateMessage.sender_id == current_user.id) | (PrivateMessage.receiver_id == current_user.id)
-    ).order_by(PrivateMessage.created_at.desc()).all()
+    # Получаем страницу диалогов из сводной таблицы
+    try:
+        conversations, next_cursor = inbox_page(current_user.id, cursor=request.args.get('cursor'))
+    except InvalidCursor:
+        return redirect(url_for('messages'))
     
-    return render_template('messages.html', conversations=conversations)
+    return render_template('messages.html', conversations=conversations, next_cursor=next_cursor)
 
 @app.route('/messages/<int:user_id>')
 @login_required
 def chat(user_id):
     other_user = User.query.get_or_404(user_id)
     
-    # Получаем историю сообщений
-    messages = PrivateMessage.query.filter(
-        ((PrivateMessage.sender_id == current_user.id) & (PrivateMessage.receiver_id == user_id)) |
-        ((PrivateMessage.sender_id == user_id) & (PrivateMessage.receiver_id == current_user.id))
-    ).order_by(PrivateMessage.created_at.asc()).all()
-    
-    # Помечаем сообщения как прочитанные
-    for message in messages:
-        if message.receiver_id == current_user.id and not message.is_read:
-            message.is_read = True
-    db.session.commit()
-    
-    return render_template('chat.html', other_user=other_user, messages=messages)
-
-@app.route('/api/messages/<int:user_id>', methods=['POST'])
-@login_required
-def send_message(user_id):
-    content = request.form.get('content')
-    
-    if not content:
-        return jsonify({'message': 'Message content is required'}), 400
-    
-    message = PrivateMessage(
-        sender_id=current_user.id,
-        receiver_id=user_id,
-        content=content
-    )
+    # Получаем последнюю страницу истории, более старые сообщения подгружаются при прокрутке
+    messages, has_more = history_page(current_user.id, user_id)
     
-    db.session.add(message)
+    # Помечаем сообщения как прочитанные; рендерим до commit, чтобы не перечитывать истекшие объекты
+    if messages:
+        mark_messages_read(current_user.id, user_id, messages[-1].id)
+        mark_read(current_user.id, Notification.kind == 'message', Notification.target_id == user_id)
+    html = render_template('chat.html', other_user=other_user, messages=messages, has_more=has_more)
     db.session.commit()
     
-    return jsonify({
-        'id': message.id,
-        'content': message.content,
-        'created_at': message.created_at.strftime('%d.%m.%Y %H:%M'),
-        'sender': {
-            'id': current_user.id,
-            'username': current_user.username
-        }
-    })
+    return html
 
 @app.route('/users')
 @login_required
 def users():
-    users = User.query.filter(User.id != current_user.id).all()
-    return render_template('users.html', users=users)
+    search = request.args.get('search', '')
+    if match_query(search) and search_available():
+        ids, _ = search_page('users', search, current_user.id, limit=USERS_SEARCH_LIMIT)
+        users_by_id = {user.id: user for user in User.query.filter(User.id.in_(ids)).all()}
+        users = [users_by_id[user_id] for user_id in ids if user_id in users_by_id]
+    else:
+        query = User.query.filter(User.id != current_user.id)
+        if search.strip():
+            # Без FTS5 (не SQLite) ищем подстроку в имени
+            pattern = search.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(User.username.ilike(f'%{pattern}%', escape='\\')).order_by(
+                User.username
+            ).limit(USERS_SEARCH_LIMIT)
+        users = query.all()
+    return render_template('users.html', users=users, search=search)
 
 @app.route('/users/<int:user_id>')
 @login_required
 def user_profile(user_id):
     user = User.query.get_or_404(user_id)
-    # Получаем сначала закрепленные посты, затем обычные
-    pinned_posts = Post.query.filter_by(author_id=user_id, is_pinned=True).order_by(Post.created_at.desc()).all()
-    regular_posts = Post.query.filter_by(author_id=user_id, is_pinned=False).order_by(Post.created_at.desc()).all()
-    posts = pinned_posts + regular_posts
-    return render_template('user_profile.html', user=user, posts=posts)
+    # Сначала закрепленные посты, затем обычные — тем же keyset-курсором, что и лента
+    try:
+        posts, next_cursor = paginate_posts(
+            posts_query().filter_by(author_id=user_id), cursor=request.args.get('cursor')
+        )
+    except InvalidCursor:
+        return redirect(url_for('user_profile', user_id=user_id))
+    liked_ids = load_liked_post_ids(posts, current_user.id)
+    return render_template(
+        'user_profile.html', user=user, posts=posts, liked_ids=liked_ids, next_cursor=next_cursor
+    )
 
 @app.route('/upload_avatar', methods=['POST'])
 @login_required
@@ -336,17 +312,20 @@ def upload_avatar():
         return redirect(url_for('user_profile', user_id=current_user.id))
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{current_user.id}_{file.filename}")
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        try:
+            digest = store_upload(file)
+        except InvalidImage:
+            flash('Недопустимый формат файла')
+            return redirect(url_for('user_profile', user_id=current_user.id))
+        filename = variant_name(digest, 'full')
         
-        # Удаляем старый аватар, если он существует и не является дефолтным
-        if current_user.avatar != 'default_avatar.png':
-            old_avatar_path = os.path.join(app.config['UPLOAD_FOLDER'], current_user.avatar)
-            if os.path.exists(old_avatar_path):
-                os.remove(old_avatar_path)
+        # Удаляем старый аватар, если это старая загрузка; файлы по хешу могут быть общими
+        if current_user.avatar != 'default_avatar.png' and not media_digest(current_user.avatar):
+            defer('delete_upload', current_user.avatar)
         
         current_user.avatar = filename
         db.session.commit()
+        bump(USERS_SCOPE, f'profile:{current_user.id}')
         flash('Аватар успешно обновлен')
     else:
         flash('Недопустимый формат файла')
@@ -355,8 +334,24 @@ def upload_avatar():
 
 @app.route('/static/uploads/avatars/<filename>')
 def uploaded_avatar(filename):
+    # Клиенты собирают URL аватара из имени файла, обработанные аватары отдаем как media
+    if MEDIA_NAME_RE.match(filename):
+        return media(filename)
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+@app.route('/media/<name>')
+def media(name):
+    path = ensure_variant(name)
+    if path is None:
+        abort(404)
+    
+    # Имя файла — хеш содержимого, поэтому ответ можно кэшировать навсегда;
+    # conditional=True дает ETag/Last-Modified, 304 и Range-запросы
+    response = send_from_directory(app.config['MEDIA_FOLDER'], name, conditional=True, max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
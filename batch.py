@@ -0,0 +1,147 @@
+import logging
+
+from flask import current_app, g, jsonify, request
+from werkzeug.exceptions import BadRequest, HTTPException
+from werkzeug.test import EnvironBuilder
+
+from database import use_replica
+from models import db
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {'GET', 'HEAD'}
+
+# Сам пакет и долгие соединения (SSE, long polling) внутри пакета не вызываются
+EXCLUDED_ENDPOINTS = {'api.batch', 'api.event_stream', 'api.poll_events'}
+
+# Состояние запроса в g, общее для пакета и всех его элементов: пользователь,
+# выбор реплики, счетчики SQL и отложенные до commit действия
+SHARED_STATE = ('_login_user', 'db_read_only', 'sql_stats', 'after_commit')
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def parse_batch(data):
+    """Проверяет тело запроса {"requests": [{"method", "path", "body"|"form"}, ...]}."""
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise InvalidBatch('requests must be a non-empty list')
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise InvalidBatch('Each request needs a path')
+        method = str(item.get('method', 'GET')).upper()
+        if 'body' in item and 'form' in item:
+            raise InvalidBatch('Use either body or form')
+        if 'body' in item and not isinstance(item['body'], dict):
+            raise InvalidBatch('body must be an object')
+        if 'form' in item and not isinstance(item['form'], dict):
+            raise InvalidBatch('form must be an object')
+        parsed.append({'method': method, 'path': item['path'],
+                       **{key: item[key] for key in ('body', 'form') if key in item}})
+    return parsed
+
+
+def run_batch(items):
+    """Выполняет элементы пакета по порядку в одной транзакции.
+
+    Каждый элемент обрабатывается обычным обработчиком blueprint'а api в
+    своем контексте запроса, но в общей сессии БД: commit обработчиков
+    откладывается до конца пакета. Если запись завершилась ошибкой, вся
+    транзакция откатывается, а оставшиеся элементы не выполняются.
+    Необработанное исключение элемента дает ему статус 500 и тоже
+    откатывает пакет. Пакет только из чтений идет на реплику (если она
+    настроена) и держит одно соединение на все элементы.
+
+    Возвращает (результаты элементов, зафиксирован ли пакет).
+    """
+    session = db.session()
+    use_replica(all(item['method'] in READ_METHODS for item in items))
+    g.after_commit = []
+    shared = {key: g.get(key) for key in SHARED_STATE}
+
+    results = []
+    failed = False
+    session.info['deferred_commit'] = True
+    try:
+        for item in items:
+            if failed:
+                results.append({'status': 424, 'body': {'error': 'Not executed: batch rolled back'}})
+                continue
+            try:
+                response = run_item(item, session, shared)
+            except Exception:
+                logger.exception('Batch item %s %s failed', item['method'], item['path'])
+                session.rollback()
+                results.append({'status': 500, 'body': {'error': 'Internal server error'}})
+                failed = True
+                continue
+            results.append(item_result(response))
+            rolled_back = session.info.pop('batch_rolled_back', False)
+            if rolled_back or (item['method'] not in READ_METHODS and response.status_code >= 400):
+                failed = True
+    finally:
+        session.info.pop('deferred_commit', None)
+        session.info.pop('batch_rolled_back', None)
+        pending = g.pop('after_commit')
+        use_replica(shared['db_read_only'])
+
+    if failed:
+        session.rollback()
+        return results, False
+
+    session.commit()
+    for callback, args in pending:
+        callback(*args)
+    return results, True
+
+
+def run_item(item, session, shared):
+    kwargs = {}
+    if 'body' in item:
+        kwargs['json'] = item['body']
+    elif 'form' in item:
+        kwargs['data'] = item['form']
+    builder = EnvironBuilder(path=item['path'], method=item['method'], base_url=request.url_root, **kwargs)
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    # Отдельный контекст приложения дает элементу свой g (хуки метрик и
+    # статистики не путают его с самим пакетом), а сессия и общее состояние
+    # подставляются из пакета
+    with current_app.app_context():
+        db.session.registry.set(session)
+        for key, value in shared.items():
+            setattr(g, key, value)
+        try:
+            with current_app.request_context(environ):
+                return dispatch_item()
+        finally:
+            shared['db_read_only'] = g.get('db_read_only')
+            # Иначе teardown контекста закроет общую сессию
+            db.session.registry.clear()
+
+
+def dispatch_item():
+    try:
+        if request.routing_exception is not None:
+            raise request.routing_exception
+        if request.blueprint != 'api' or request.endpoint in EXCLUDED_ENDPOINTS:
+            raise BadRequest('This endpoint is not available in a batch')
+        view = current_app.view_functions[request.endpoint]
+        response = current_app.make_response(view(**request.view_args))
+        # Потоковый ответ дочитываем, пока контекст элемента еще активен
+        response.make_sequence()
+        return response
+    except HTTPException as e:
+        return current_app.make_response((jsonify({'error': e.description}), e.code))
+
+
+def item_result(response):
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    return {'status': response.status_code, 'body': body}
@@ -0,0 +1,484 @@
+"""Нагрузочный бенчмарк маршрутов app.py и api.py.
+
+Строит временную базу заданного масштаба, прогоняет каждый маршрут через
+тестовый клиент и для каждого считает p50/p95/p99 задержки, число
+SQL-запросов на запрос и пиковую память. Результат сохраняется в JSON;
+если передан --baseline, результаты сравниваются с ним и скрипт
+завершается с кодом 1 при регрессии.
+
+    python benchmark.py --scale small --output bench.json
+    python benchmark.py --scale small --baseline bench.json
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Бенчмарк идет на отдельной временной базе, рабочие данные не трогаем
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'benchmark.db')
+os.environ.pop('DATABASE_READ_URL', None)
+
+import sqlalchemy
+from flask import request, request_started
+from PIL import Image
+from sqlalchemy import event, insert, text
+from werkzeug.security import generate_password_hash
+
+from app import app
+from models import db, User, Post, Like, Follow, Friendship, PrivateMessage
+from counters import repair_counters
+from timeline import rebuild_timeline
+from friends import rebuild_friend_edges
+from suggestion_job import compute_suggestions
+from tokens import issue_tokens
+
+SCALES = {
+    'small': {'users': 200, 'posts': 2000, 'likes': 10000, 'follows': 2000, 'friendships': 500, 'messages': 5000},
+    'medium': {'users': 2000, 'posts': 20000, 'likes': 100000, 'follows': 20000, 'friendships': 5000, 'messages': 50000},
+    'large': {'users': 10000, 'posts': 200000, 'likes': 1000000, 'follows': 100000, 'friendships': 20000, 'messages': 500000},
+}
+
+# Маршруты, которые бенчмарк не гоняет: перекрыты blueprint'ом api или отдают файлы
+SKIPPED_ENDPOINTS = {'posts', 'comments', 'like_post', 'add_friend', 'send_message', 'static'}
+
+# Изменения задержки меньше этого порога считаем шумом
+MIN_DELTA_MS = 0.5
+
+BASE_TIME = datetime(2024, 1, 1)
+CHUNK_SIZE = 10000
+
+
+def sample_image():
+    # Фото среднего размера; повторные загрузки того же файла дедуплицируются
+    buffer = io.BytesIO()
+    Image.linear_gradient('L').resize((1200, 800)).convert('RGB').save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+SAMPLE_IMAGE = sample_image()
+SAMPLE_IMAGE_DIGEST = hashlib.sha1(SAMPLE_IMAGE).hexdigest()
+
+
+def bulk_insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def random_pairs(rng, left, right, count):
+    """count различных пар (a, b), a != b."""
+    pairs = set()
+    count = min(count, len(left) * len(right) - len(left))
+    while len(pairs) < count:
+        pair = (rng.choice(left), rng.choice(right))
+        if pair[0] != pair[1]:
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+def seed(scale, pool_size, rng):
+    """Заполняет базу и возвращает id, нужные сценариям.
+
+    Пользователь 1 — тот, от чьего имени идут запросы; пользователь 2 — его
+    основной собеседник. Для маршрутов, которые нельзя повторять (принять или
+    отклонить заявку, отправить заявку), заранее готовятся пулы на каждую итерацию.
+    """
+    users_total = scale['users'] + 3 * pool_size
+    password_hash = generate_password_hash('password')
+    bulk_insert(User, [{
+        'id': i,
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'password_hash': password_hash,
+        'created_at': BASE_TIME + timedelta(minutes=i),
+    } for i in range(1, users_total + 1)])
+
+    regular = list(range(1, scale['users'] + 1))
+    pool_start = scale['users'] + 1
+    accept_pool = list(range(pool_start, pool_start + pool_size))
+    reject_pool = list(range(pool_start + pool_size, pool_start + 2 * pool_size))
+    strangers = list(range(pool_start + 2 * pool_size, pool_start + 3 * pool_size))
+    me, partner = 1, 2
+
+    span = int(timedelta(days=30).total_seconds())
+    bulk_insert(Post, [{
+        'id': i,
+        'content': f'post {i}',
+        'author_id': rng.choice(regular),
+        'created_at': BASE_TIME + timedelta(seconds=rng.randrange(span)),
+        'is_pinned': rng.random() < 0.01,
+    } for i in range(1, scale['posts'] + 1)])
+    post_ids = list(range(1, scale['posts'] + 1))
+
+    bulk_insert(Like, [
+        {'user_id': user_id, 'post_id': post_id}
+        for user_id, post_id in random_pairs(rng, regular, post_ids, scale['likes'])
+    ])
+    follows = set(random_pairs(rng, regular, regular, scale['follows']))
+    follows.update((me, user_id) for user_id in regular[1:51])
+    bulk_insert(Follow, [{'follower_id': a, 'followed_id': b} for a, b in sorted(follows)])
+
+    friendships = [
+        (a, b) for a, b in random_pairs(rng, regular, regular, scale['friendships'])
+        if a < b
+    ]
+    friendships.append((me, partner))
+    bulk_insert(Friendship, [
+        {'user_id': a, 'friend_id': b, 'status': 'accepted'} for a, b in sorted(set(friendships))
+    ] + [
+        {'user_id': user_id, 'friend_id': me, 'status': 'pending'} for user_id in accept_pool + reject_pool
+    ])
+
+    messages = []
+    for i in range(scale['messages']):
+        # Заметная доля переписки — у пользователя 1, в основном с пользователем 2
+        roll = rng.random()
+        if roll < 0.1:
+            sender, receiver = (me, partner) if i % 2 else (partner, me)
+        elif roll < 0.2:
+            sender, receiver = rng.choice(regular[1:]), me
+        else:
+            sender, receiver = rng.sample(regular, 2)
+        messages.append({
+            'sender_id': sender,
+            'receiver_id': receiver,
+            'content': f'message {i}',
+            'is_read': rng.random() < 0.8,
+            'created_at': BASE_TIME + timedelta(seconds=span * i // max(scale['messages'], 1)),
+        })
+    bulk_insert(PrivateMessage, messages)
+
+    # Сводки переписок и счетчики строим так же, как миграции для старых данных
+    db.session.execute(text('''
+        INSERT INTO conversation (user_a_id, user_b_id, last_message_id, last_message_at, unread_count_a, unread_count_b)
+        SELECT pairs.user_a_id, pairs.user_b_id, pairs.last_message_id, m.created_at,
+               pairs.unread_count_a, pairs.unread_count_b
+        FROM (
+            SELECT
+                CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END AS user_a_id,
+                CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END AS user_b_id,
+                max(id) AS last_message_id,
+                sum(CASE WHEN receiver_id < sender_id AND NOT is_read THEN 1 ELSE 0 END) AS unread_count_a,
+                sum(CASE WHEN receiver_id > sender_id AND NOT is_read THEN 1 ELSE 0 END) AS unread_count_b
+            FROM private_message
+            GROUP BY 1, 2
+        ) AS pairs
+        JOIN private_message AS m ON m.id = pairs.last_message_id
+    '''))
+    # Уведомления о лайках, свернутые по постам; счетчики непрочитанных пересчитает repair_counters
+    db.session.execute(text('''
+        INSERT INTO notification (user_id, kind, target_id, actor_id, count, is_read, updated_at)
+        SELECT post.author_id, 'like', post.id, max("like".user_id), count(*), 0, max("like".created_at)
+        FROM "like" JOIN post ON post.id = "like".post_id
+        WHERE "like".user_id != post.author_id
+        GROUP BY post.id, post.author_id
+    '''))
+    db.session.commit()
+    rebuild_friend_edges()
+    repair_counters()
+    compute_suggestions(full=True)
+    rebuild_timeline(me)
+
+    accepts = {f.user_id: f.id for f in Friendship.query.filter_by(friend_id=me, status='pending')}
+    me_user = db.session.get(User, me)
+    return {
+        'me': me,
+        'partner': partner,
+        'post': post_ids[len(post_ids) // 2],
+        'my_post': Post.query.filter_by(author_id=me).first().id,
+        'accept_requests': [accepts[user_id] for user_id in accept_pool],
+        'reject_requests': [accepts[user_id] for user_id in reject_pool],
+        'strangers': strangers,
+        # Токены API одноразовые при обновлении и выходе — по паре на итерацию
+        'tokens': [issue_tokens(me_user) for _ in range(pool_size)],
+        'logout_tokens': [issue_tokens(me_user) for _ in range(pool_size)],
+    }
+
+
+def scenarios(ids):
+    """(название, метод, путь, аргументы, клиент).
+
+    Путь и аргументы могут быть функциями от номера итерации. Клиент:
+    'user' — общий клиент пользователя 1, 'guest' — новый клиент без входа,
+    'fresh' — новый клиент пользователя 1 (для маршрутов, меняющих сессию).
+    """
+    partner, post = ids['partner'], ids['post']
+    registrations = itertools.count()
+
+    def register_form(i):
+        n = next(registrations)
+        return {'data': {'username': f'bench{n}', 'email': f'bench{n}@example.com', 'password': 'password'}}
+
+    def register_json(i):
+        n = next(registrations)
+        return {'json': {'username': f'bench{n}', 'email': f'bench{n}@example.com', 'password': 'password'}}
+
+    return [
+        ('index', 'GET', '/', {}, 'user'),
+        ('register_page', 'GET', '/register', {}, 'guest'),
+        ('register', 'POST', '/register', register_form, 'guest'),
+        ('login_page', 'GET', '/login', {}, 'guest'),
+        ('login', 'POST', '/login', {'data': {'username': 'user1', 'password': 'password'}}, 'guest'),
+        ('api_register', 'POST', '/api/auth/register', register_json, 'guest'),
+        ('api_login', 'POST', '/api/auth/login', {'json': {'username': 'user1', 'password': 'password'}}, 'guest'),
+        ('api_refresh_token', 'POST', '/api/auth/refresh',
+         lambda i: {'json': {'refresh_token': ids['tokens'][i]['refresh_token']}}, 'guest'),
+        ('api_logout', 'POST', '/api/auth/logout', lambda i: {
+            'headers': {'Authorization': 'Bearer ' + ids['logout_tokens'][i]['access_token']},
+            'json': {'refresh_token': ids['logout_tokens'][i]['refresh_token']},
+        }, 'guest'),
+        ('api_posts', 'GET', '/api/posts', {}, 'user'),
+        ('api_posts_sparse', 'GET', '/api/posts?fields=content&include=author', {}, 'user'),
+        ('api_posts_msgpack', 'GET', '/api/posts', {'headers': {'Accept': 'application/msgpack'}}, 'user'),
+        ('api_posts_token', 'GET', '/api/posts',
+         {'headers': {'Authorization': 'Bearer ' + ids['tokens'][0]['access_token']}}, 'guest'),
+        ('api_timeline', 'GET', '/api/timeline', {}, 'user'),
+        ('api_create_post', 'POST', '/api/posts', {'data': {'content': 'benchmark post'}}, 'user'),
+        ('api_comments', 'GET', f'/api/posts/{post}/comments', {}, 'user'),
+        ('api_comments_sparse', 'GET', f'/api/posts/{post}/comments?fields=content&include=', {}, 'user'),
+        ('api_create_comment', 'POST', f'/api/posts/{post}/comments', {'json': {'content': 'comment'}}, 'user'),
+        ('api_toggle_like', 'POST', f'/api/posts/{post}/like', {}, 'user'),
+        ('api_pin_post', 'POST', f"/api/posts/{ids['my_post']}/pin", {}, 'user'),
+        ('follow', 'POST', f'/api/users/{partner}/follow', {}, 'user'),
+        ('friends', 'GET', '/friends', {}, 'user'),
+        ('api_friends', 'GET', '/api/friends', {}, 'user'),
+        ('api_friend_requests', 'GET', '/api/friends/requests', {}, 'user'),
+        ('api_mutual_friends', 'GET', f'/api/users/{partner}/mutual_friends', {}, 'user'),
+        ('api_suggestions', 'GET', '/api/suggestions', {}, 'user'),
+        ('api_add_friend', 'POST', lambda i: f"/api/friends/{ids['strangers'][i]}/add", {}, 'user'),
+        ('accept_friend', 'POST', lambda i: f"/api/friends/{ids['accept_requests'][i]}/accept", {}, 'user'),
+        ('reject_friend', 'POST', lambda i: f"/api/friends/{ids['reject_requests'][i]}/reject", {}, 'user'),
+        ('messages', 'GET', '/messages', {}, 'user'),
+        ('chat', 'GET', f'/messages/{partner}', {}, 'user'),
+        ('api_conversations', 'GET', '/api/messages', {}, 'user'),
+        ('api_chat', 'GET', f'/api/messages/{partner}', {}, 'user'),
+        ('api_mark_read', 'POST', f'/api/messages/{partner}/read', {'json': {'up_to_id': 2 ** 31}}, 'user'),
+        ('api_send_message', 'POST', f'/api/messages/{partner}', {'json': {'content': 'message'}}, 'user'),
+        ('api_notifications', 'GET', '/api/notifications', {}, 'user'),
+        ('api_unread_count', 'GET', '/api/notifications/unread_count', {}, 'user'),
+        ('api_read_notifications', 'POST', '/api/notifications/read', {}, 'user'),
+        ('api_poll_events', 'GET', '/api/events?timeout=0', {}, 'user'),
+        ('api_event_stream', 'GET', '/api/events/stream', {}, 'user'),
+        ('users', 'GET', '/users', {}, 'user'),
+        ('users_search', 'GET', '/users?search=user1', {}, 'user'),
+        ('api_search_posts', 'GET', '/api/search?q=post&type=posts', {}, 'user'),
+        ('api_search_messages', 'GET', '/api/search?q=message&type=messages', {}, 'user'),
+        ('user_profile', 'GET', f'/users/{partner}', {}, 'user'),
+        ('api_profile', 'GET', '/api/profile', {}, 'user'),
+        ('api_update_profile', 'PUT', '/api/profile', {'json': {'bio': 'bio'}}, 'user'),
+        ('api_batch_reads', 'POST', '/api/batch', {'json': {'requests': [
+            {'path': '/api/posts'},
+            {'path': f'/api/posts/{post}/comments'},
+            {'path': '/api/friends/requests'},
+        ]}}, 'user'),
+        ('api_batch_writes', 'POST', '/api/batch', {'json': {'requests': [
+            {'method': 'POST', 'path': f'/api/posts/{post}/like'},
+            {'method': 'POST', 'path': f'/api/posts/{post}/comments', 'body': {'content': 'comment'}},
+            {'method': 'POST', 'path': f'/api/messages/{partner}/read', 'body': {'up_to_id': 2 ** 31}},
+        ]}}, 'user'),
+        ('api_query_stats', 'GET', '/api/admin/query_stats', {}, 'user'),
+        ('metrics', 'GET', '/metrics', {}, 'guest'),
+        ('upload_avatar', 'POST', '/upload_avatar',
+         lambda i: {'data': {'avatar': (io.BytesIO(SAMPLE_IMAGE), 'avatar.jpg')}}, 'user'),
+        ('uploaded_avatar', 'GET', '/static/uploads/avatars/benchmark.gif', {}, 'user'),
+        ('media', 'GET', f'/media/{SAMPLE_IMAGE_DIGEST}_feed.webp', {}, 'user'),
+        ('logout', 'GET', '/logout', {}, 'fresh'),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def run(args):
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = TMP_DIR
+    app.config['MEDIA_FOLDER'] = os.path.join(TMP_DIR, 'media')
+    with open(os.path.join(TMP_DIR, 'benchmark.gif'), 'wb') as f:
+        f.write(b'GIF89a')
+    # Итерации прогрева, замеров и прогон для замера памяти
+    pool_size = args.warmup + args.iterations + 1
+
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        ids = seed(scale, pool_size, random.Random(args.seed))
+        engine = db.engine
+    print(f'База построена за {time.perf_counter() - started:.1f} с: {scale}')
+
+    query_count = [0]
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        query_count[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', on_execute)
+
+    hit_endpoints = set()
+
+    def on_request_started(sender, **extra):
+        hit_endpoints.add(request.endpoint)
+
+    request_started.connect(on_request_started, app)
+    user_client = logged_in_client(ids['me'])
+    results = {}
+
+    for name, method, path, kwargs, client_kind in scenarios(ids):
+        timings = []
+        queries = []
+        status = None
+        iteration = 0
+
+        def request_once(measure_memory=False):
+            nonlocal iteration, status
+            if client_kind == 'user':
+                client = user_client
+            elif client_kind == 'guest':
+                client = app.test_client()
+            else:
+                client = logged_in_client(ids['me'])
+            request_path = path(iteration) if callable(path) else path
+            request_kwargs = kwargs(iteration) if callable(kwargs) else kwargs
+            iteration += 1
+
+            query_count[0] = 0
+            if measure_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            response = client.open(request_path, method=method, **request_kwargs)
+            elapsed = time.perf_counter() - started
+            peak = None
+            if measure_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            response.close()
+            status = response.status_code
+            return elapsed, query_count[0], peak
+
+        for _ in range(args.warmup):
+            request_once()
+        for _ in range(args.iterations):
+            elapsed, count, _ = request_once()
+            timings.append(elapsed * 1000)
+            queries.append(count)
+        # Память меряем отдельным прогоном, чтобы tracemalloc не искажал задержки
+        _, _, peak = request_once(measure_memory=True)
+
+        results[name] = {
+            'method': method,
+            'path': path(0) if callable(path) else path,
+            'status': status,
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': max(queries),
+            'peak_memory_kib': round(peak / 1024, 1),
+        }
+        print(f"{name:22} {results[name]['p50_ms']:9.2f} {results[name]['p95_ms']:9.2f} "
+              f"{results[name]['p99_ms']:9.2f} ms  {results[name]['queries']:4} SQL  "
+              f"{results[name]['peak_memory_kib']:9.1f} KiB  HTTP {status}")
+
+    event.remove(engine, 'before_cursor_execute', on_execute)
+    request_started.disconnect(on_request_started, app)
+
+    missing = set(app.view_functions) - hit_endpoints - SKIPPED_ENDPOINTS
+    for endpoint in sorted(missing):
+        print(f'[{endpoint}] route is not covered by benchmark.py')
+
+    return {
+        'meta': {
+            'scale': scale,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        },
+        'routes': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Печатает разницу с базовым прогоном и возвращает число регрессий."""
+    if current['meta']['scale'] != baseline['meta']['scale']:
+        print('Внимание: масштаб базы отличается от базового прогона')
+
+    regressions = 0
+    for name, result in current['routes'].items():
+        base = baseline['routes'].get(name)
+        if base is None:
+            print(f'{name:22} новый маршрут')
+            continue
+        delta = result['p95_ms'] - base['p95_ms']
+        change = delta / base['p95_ms'] * 100 if base['p95_ms'] else 0
+        problems = []
+        if change > threshold and delta > MIN_DELTA_MS:
+            problems.append(f'p95 +{change:.0f}%')
+        if result['queries'] > base['queries']:
+            problems.append(f"SQL {base['queries']} -> {result['queries']}")
+        regressions += bool(problems)
+        print(f"{name:22} p95 {base['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms ({change:+.0f}%)  "
+              f"SQL {base['queries']} -> {result['queries']}  {'РЕГРЕССИЯ: ' + ', '.join(problems) if problems else ''}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк маршрутов приложения')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for key in SCALES['small']:
+        parser.add_argument(f'--{key}', type=int, help='переопределить размер из --scale')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='куда сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='допустимый рост p95 в процентах')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    current = run(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f'Результаты сохранены в {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        print(f'Регрессий: {regressions}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
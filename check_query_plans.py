@@ -0,0 +1,303 @@
+"""Регрессионная проверка планов запросов.
+
+Прогоняет все маршруты app.py и api.py через тестовый клиент на временной
+базе, для каждого выполненного SELECT/UPDATE/DELETE делает EXPLAIN QUERY PLAN
+и завершается с кодом 1, если какой-то запрос полностью сканирует «горячую»
+таблицу, если какой-то маршрут остался непроверенным или если маршрут /api/
+не принимает access-токен. Кроме маршрутов, проверяются запросы воркера
+очереди задач.
+
+    python check_query_plans.py
+    python -m pytest
+"""
+import io
+import os
+import re
+import sys
+import tempfile
+
+# Проверка идет на отдельной временной базе, рабочие данные не трогаем
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'query_plans.db')
+
+from flask import request, request_started
+from flask_login import current_user
+from sqlalchemy import event
+
+from app import app, login_manager
+from models import db, User, Post, Comment, Like, Follow, Friendship, PrivateMessage, Suggestion
+from pagination import post_cursor, encode_cursor
+from conversations import record_message, conversation_cursor
+from timeline import rebuild_timeline
+from friends import add_friend_edges
+from notifications import notify
+from tokens import issue_tokens
+from jobs import Worker, enqueue
+
+HOT_TABLES = {'post', 'comment', 'like', 'follow', 'friendship', 'friend_edge', 'private_message',
+              'conversation', 'timeline_entry', 'suggestion', 'notification', 'job'}
+
+# Маршруты, которые сценарии не обходят: встроенная раздача статики Flask
+UNREACHABLE_ENDPOINTS = {'static'}
+
+SCAN_RE = re.compile(r'^SCAN (\S+)(.*)$')
+
+
+def seed():
+    users = {}
+    for name in ('alice', 'bob', 'carol', 'dave', 'erin'):
+        user = User(username=name, email=f'{name}@example.com')
+        user.set_password('password')
+        db.session.add(user)
+        users[name] = user
+    db.session.flush()
+
+    alice, bob, carol, dave, erin = (users[name] for name in ('alice', 'bob', 'carol', 'dave', 'erin'))
+    posts = [
+        Post(content=f'post {i}', author_id=(alice if i % 2 else bob).id, is_pinned=(i == 0))
+        for i in range(5)
+    ]
+    db.session.add_all(posts)
+    db.session.flush()
+
+    db.session.add_all([
+        Like(user_id=bob.id, post_id=posts[1].id),
+        Comment(content='comment', user_id=bob.id, post_id=posts[1].id),
+        Follow(follower_id=bob.id, followed_id=alice.id),
+        Friendship(user_id=alice.id, friend_id=bob.id, status='accepted'),
+        Friendship(user_id=erin.id, friend_id=bob.id, status='accepted'),
+        Friendship(user_id=carol.id, friend_id=alice.id, status='pending'),
+        Friendship(user_id=dave.id, friend_id=alice.id, status='pending'),
+    ])
+    add_friend_edges(alice.id, bob.id)
+    add_friend_edges(erin.id, bob.id)
+    db.session.add_all([
+        Suggestion(user_id=alice.id, rank=0, suggested_id=erin.id, score=1.0, mutual_friends=1, common_follows=0),
+        Suggestion(user_id=alice.id, rank=1, suggested_id=dave.id, score=0.25, mutual_friends=0, common_follows=1),
+    ])
+    for sender, receiver in ((alice, bob), (bob, alice), (carol, alice)):
+        message = PrivateMessage(sender_id=sender.id, receiver_id=receiver.id, content='hi')
+        db.session.add(message)
+        conversation = record_message(message)
+    notify(alice.id, 'like', posts[1].id, bob.id)
+    notify(alice.id, 'comment', posts[1].id, bob.id)
+    notify(alice.id, 'message', carol.id, carol.id)
+    db.session.commit()
+    rebuild_timeline(alice.id)
+
+    requests_by_sender = {
+        f.user_id: f.id for f in Friendship.query.filter_by(friend_id=alice.id).all()
+    }
+    return {
+        'alice': alice.id,
+        'bob': bob.id,
+        'erin': erin.id,
+        'alice_post': posts[1].id,
+        'accept_request': requests_by_sender[carol.id],
+        'reject_request': requests_by_sender[dave.id],
+        'cursor': post_cursor(posts[2]),
+        'inbox_cursor': conversation_cursor(conversation),
+        'timeline_cursor': encode_cursor([posts[2].created_at.isoformat(), posts[2].id]),
+        'tokens': issue_tokens(alice),
+        'logout_tokens': issue_tokens(alice),
+    }
+
+
+def scenarios(ids):
+    # (метод, путь, аргументы тестового клиента); порядок важен для мутаций
+    return [
+        ('GET', '/', {}),
+        ('GET', f"/?cursor={ids['cursor']}", {}),
+        ('GET', '/register', {}),
+        ('POST', '/register', {'data': {'username': 'frank', 'email': 'frank@example.com', 'password': 'password'}}),
+        ('GET', '/login', {}),
+        ('POST', '/login', {'data': {'username': 'alice', 'password': 'password'}}),
+        ('POST', '/api/auth/register', {'json': {'username': 'grace', 'email': 'grace@example.com', 'password': 'password'}}),
+        ('POST', '/api/auth/login', {'json': {'username': 'alice', 'password': 'password'}}),
+        ('POST', '/api/auth/refresh', {'json': {'refresh_token': ids['tokens']['refresh_token']}}),
+        ('POST', '/api/auth/logout', {
+            'headers': {'Authorization': 'Bearer ' + ids['logout_tokens']['access_token']},
+            'json': {'refresh_token': ids['logout_tokens']['refresh_token']},
+        }),
+        ('GET', '/api/posts', {}),
+        ('GET', f"/api/posts?cursor={ids['cursor']}", {}),
+        ('GET', '/api/posts?fields=content,created_at&include=author', {}),
+        ('GET', f"/api/posts?fields=id&include=&cursor={ids['cursor']}", {}),
+        ('GET', '/api/timeline', {}),
+        ('GET', f"/api/timeline?cursor={ids['timeline_cursor']}", {}),
+        ('POST', '/api/posts', {'data': {'content': 'new post'}}),
+        ('GET', f"/api/posts/{ids['alice_post']}/comments", {}),
+        ('GET', f"/api/posts/{ids['alice_post']}/comments?fields=content&include=", {}),
+        ('POST', f"/api/posts/{ids['alice_post']}/comments", {'json': {'content': 'comment'}}),
+        ('POST', f"/api/posts/{ids['alice_post']}/like", {}),
+        ('POST', f"/api/posts/{ids['alice_post']}/like", {}),
+        ('POST', f"/api/posts/{ids['alice_post']}/pin", {}),
+        ('POST', f"/api/users/{ids['bob']}/follow", {}),
+        ('GET', '/friends', {}),
+        ('GET', '/api/friends', {}),
+        ('GET', '/api/friends?fields=username', {}),
+        ('GET', '/api/friends/requests', {}),
+        ('GET', f"/api/users/{ids['erin']}/mutual_friends", {}),
+        ('GET', '/api/suggestions', {}),
+        ('GET', f"/api/users/{ids['erin']}/mutual_friends?limit=1&cursor=WzBd", {}),
+        ('POST', f"/api/friends/{ids['erin']}/add", {}),
+        ('POST', f"/api/friends/{ids['accept_request']}/accept", {}),
+        ('POST', f"/api/friends/{ids['reject_request']}/reject", {}),
+        ('GET', '/messages', {}),
+        ('GET', f"/messages/{ids['bob']}", {}),
+        ('GET', '/api/messages', {}),
+        ('GET', f"/api/messages?cursor={ids['inbox_cursor']}", {}),
+        ('GET', f"/api/messages/{ids['bob']}", {}),
+        ('GET', f"/api/messages/{ids['bob']}?fields=content,is_sender", {}),
+        ('GET', f"/api/messages/{ids['bob']}?before_id=2", {}),
+        ('GET', f"/api/messages/{ids['bob']}?after_id=1", {}),
+        ('POST', f"/api/messages/{ids['bob']}/read", {'json': {'up_to_id': 2}}),
+        ('POST', f"/api/messages/{ids['bob']}", {'json': {'content': 'message'}}),
+        ('GET', '/api/notifications', {}),
+        ('GET', '/api/notifications?limit=1&cursor=WyIyMDI2LTAxLTAxVDAwOjAwOjAwIiwxXQ', {}),
+        ('GET', '/api/notifications/unread_count', {}),
+        ('POST', '/api/notifications/read', {'json': {'ids': [1]}}),
+        ('POST', '/api/notifications/read', {}),
+        ('GET', '/api/events?timeout=0', {}),
+        ('GET', '/api/events/stream', {}),
+        ('GET', '/users', {}),
+        ('GET', '/users?search=bob', {}),
+        ('GET', '/api/search?q=post&type=posts', {}),
+        ('GET', '/api/search?q=post&type=posts&limit=1&cursor=WzAsMF0', {}),
+        ('GET', '/api/search?q=bo&type=users', {}),
+        ('GET', '/api/search?q=message&type=messages', {}),
+        ('GET', f"/users/{ids['bob']}", {}),
+        ('GET', f"/users/{ids['alice']}?cursor={ids['cursor']}", {}),
+        ('GET', '/api/profile', {}),
+        ('PUT', '/api/profile', {'json': {'bio': 'bio'}}),
+        ('POST', '/api/batch', {'json': {'requests': [
+            {'path': '/api/posts'},
+            {'path': f"/api/posts/{ids['alice_post']}/comments"},
+        ]}}),
+        ('POST', '/api/batch', {'json': {'requests': [
+            {'method': 'POST', 'path': f"/api/posts/{ids['alice_post']}/like"},
+            {'method': 'POST', 'path': f"/api/posts/{ids['alice_post']}/comments", 'body': {'content': 'batch'}},
+            {'method': 'POST', 'path': f"/api/messages/{ids['bob']}/read", 'body': {'up_to_id': 2}},
+        ]}}),
+        ('GET', '/api/admin/query_stats', {}),
+        ('DELETE', '/api/admin/query_stats', {}),
+        ('GET', '/metrics', {}),
+        ('POST', '/upload_avatar', {'data': {'avatar': (io.BytesIO(b'GIF89a'), 'avatar.gif')}}),
+        ('GET', '/static/uploads/avatars/default_avatar.png', {}),
+        ('GET', '/media/' + '0' * 40 + '_feed.jpg', {}),
+        ('GET', '/logout', {}),
+    ]
+
+
+def full_scans(plan_rows):
+    scans = []
+    for row in plan_rows:
+        detail = row[-1]
+        match = SCAN_RE.match(detail)
+        if not match:
+            continue
+        table = re.sub(r'_\d+$', '', match.group(1).strip('"'))
+        if table in HOT_TABLES and 'USING' not in match.group(2):
+            scans.append(detail)
+    return scans
+
+
+def check_api_tokens(ids):
+    """Маршруты /api/ пускают по access-токену, а без входа отвечают 401, а не редиректом."""
+    with app.app_context():
+        token = issue_tokens(db.session.get(User, ids['alice']))['access_token']
+    urls = app.url_map.bind('localhost')
+    problems = []
+    for rule in app.url_map.iter_rules():
+        if not rule.rule.startswith('/api/') or rule.endpoint in UNREACHABLE_ENDPOINTS:
+            continue
+        path = urls.build(rule.endpoint, {name: ids['bob'] for name in rule.arguments})
+        method = sorted(rule.methods - {'HEAD', 'OPTIONS'})[0]
+        with app.test_request_context(path, method=method, headers={'Authorization': 'Bearer ' + token}):
+            if not current_user.is_authenticated:
+                problems.append(f'[{rule.endpoint}] bearer token is not accepted')
+        with app.test_request_context(path, method=method):
+            if app.make_response(login_manager.unauthorized()).status_code != 401:
+                problems.append(f'[{rule.endpoint}] unauthorized request is not answered with 401')
+    return problems
+
+
+def main():
+    app.config['TESTING'] = True
+    app.config['UPLOAD_FOLDER'] = TMP_DIR
+    app.config['MEDIA_FOLDER'] = os.path.join(TMP_DIR, 'media')
+
+    with app.app_context():
+        db.create_all()
+        ids = seed()
+        engine = db.engine
+
+    statements = []
+    hit_endpoints = set()
+    current = {'endpoint': None}
+
+    def on_request_started(sender, **extra):
+        current['endpoint'] = request.endpoint
+        hit_endpoints.add(request.endpoint)
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((current['endpoint'], statement, parameters))
+
+    request_started.connect(on_request_started, app)
+    event.listen(engine, 'before_cursor_execute', on_execute)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(ids['alice'])
+        session['_fresh'] = True
+
+    for method, path, kwargs in scenarios(ids):
+        response = client.open(path, method=method, **kwargs)
+        # Потоковые списки выполняют запросы по мере чтения тела; SSE бесконечен
+        if not path.startswith('/api/events/stream'):
+            response.get_data()
+        response.close()
+        if response.status_code >= 500:
+            print(f'{method} {path}: HTTP {response.status_code}')
+            return 1
+
+    # Воркер опрашивает job постоянно: взятие задачи и удаление выполненной
+    current['endpoint'] = 'worker'
+    with app.app_context():
+        enqueue('delete_upload', 'missing.jpg')
+        db.session.commit()
+        Worker(app).run_once()
+
+    event.remove(engine, 'before_cursor_execute', on_execute)
+
+    failures = 0
+    with engine.connect() as conn:
+        for endpoint, statement, parameters in statements:
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            scans = full_scans(plan)
+            if scans:
+                failures += 1
+                print(f'[{endpoint}] full scan: {"; ".join(scans)}')
+                print('    ' + ' '.join(statement.split()))
+
+    missing = set(app.view_functions) - hit_endpoints - UNREACHABLE_ENDPOINTS
+    for endpoint in sorted(missing):
+        failures += 1
+        print(f'[{endpoint}] route is not covered by check_query_plans.py')
+
+    for problem in check_api_tokens(ids):
+        failures += 1
+        print(problem)
+
+    print(f'Проверено запросов: {len(statements)}, проблем: {failures}')
+    return 1 if failures else 0
+
+
+def test_query_plans():
+    # Точка входа для pytest
+    assert main() == 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
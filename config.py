@@ -0,0 +1,146 @@
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    return value.lower() in ('1', 'true', 'yes', 'on') if value else default
+
+
+def database_url(name, default=None):
+    url = os.environ.get(name, default)
+    # Хостинги часто отдают postgres://, а SQLAlchemy понимает только postgresql://
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def is_sqlite_memory(url):
+    return is_sqlite(url) and (url in ('sqlite://', 'sqlite:///') or ':memory:' in url or 'mode=memory' in url)
+
+
+# Размер пула и время жизни соединений
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+
+# Настройки SQLite, применяются к каждому новому соединению
+SQLITE_BUSY_TIMEOUT = env_int('SQLITE_BUSY_TIMEOUT', 5000)  # мс ожидания блокировки вместо "database is locked"
+SQLITE_CACHE_SIZE = env_int('SQLITE_CACHE_SIZE', -64000)  # отрицательное значение — в КиБ, т.е. 64 МБ
+SQLITE_MMAP_SIZE = env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+
+# Кэш пользователя для load_user: число записей и время жизни, с
+USER_CACHE_SIZE = env_int('USER_CACHE_SIZE', 10000)
+USER_CACHE_TTL = env_int('USER_CACHE_TTL', 60)
+
+# Кэш JSON-ответов читающих маршрутов API: число записей и время жизни, с.
+# Инвалидация общая для всех процессов (таблица cache_version), время жизни
+# только освобождает память от неиспользуемых записей
+RESPONSE_CACHE_SIZE = env_int('RESPONSE_CACHE_SIZE', 10000)
+RESPONSE_CACHE_TTL = env_int('RESPONSE_CACHE_TTL', 30)
+# Потоковый ответ (длинный список) попадает в кэш, только если его тело не больше, байт
+RESPONSE_CACHE_MAX_BODY = env_int('RESPONSE_CACHE_MAX_BODY', 256 * 1024)
+
+# Лента подписок: посты авторов с таким числом подписчиков не раскладываются
+# по лентам при записи, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = env_int('TIMELINE_FANOUT_LIMIT', 1000)
+
+# Потоки, в которых строятся уменьшенные варианты загруженных изображений
+IMAGE_WORKERS = env_int('IMAGE_WORKERS', 2)
+
+# Токены API: время жизни access и refresh, с, и как часто подтягивать
+# из БД токены, отозванные другими воркерами
+API_ACCESS_TOKEN_TTL = env_int('API_ACCESS_TOKEN_TTL', 15 * 60)
+API_REFRESH_TOKEN_TTL = env_int('API_REFRESH_TOKEN_TTL', 30 * 24 * 3600)
+TOKEN_REVOCATION_SYNC = env_int('TOKEN_REVOCATION_SYNC', 30)
+
+# Наибольшее число элементов в одном запросе /api/batch
+API_BATCH_MAX_SIZE = env_int('API_BATCH_MAX_SIZE', 20)
+
+# Очередь записи с групповым commit для лайков, комментариев, сообщений и
+# подписок: commit после WRITE_QUEUE_MAX_BATCH операций или через
+# WRITE_QUEUE_MAX_DELAY_MS после первой операции группы
+WRITE_QUEUE_ENABLED = env_bool('WRITE_QUEUE')
+WRITE_QUEUE_MAX_BATCH = env_int('WRITE_QUEUE_MAX_BATCH', 100)
+WRITE_QUEUE_MAX_DELAY_MS = env_int('WRITE_QUEUE_MAX_DELAY_MS', 5)
+
+# "Возможно, вы знакомы": сколько подсказок хранить на пользователя, по
+# сколько пользователей считать за одно умножение матриц и с какого числа
+# друзей или подписчиков пользователь перестает связывать своих соседей
+SUGGESTIONS_TOP_K = env_int('SUGGESTIONS_TOP_K', 20)
+SUGGESTIONS_BLOCK_ROWS = env_int('SUGGESTIONS_BLOCK_ROWS', 1000)
+SUGGESTIONS_MAX_DEGREE = env_int('SUGGESTIONS_MAX_DEGREE', 1000)
+
+# Очередь задач в БД для `flask worker`: попытки, аренда задачи воркером, с,
+# задержка повтора (удваивается с каждой попыткой до JOB_RETRY_MAX), с, и
+# пауза опроса пустой очереди. Без JOB_QUEUE задачи выполняются в запросе
+JOB_QUEUE_ENABLED = env_bool('JOB_QUEUE')
+JOB_MAX_ATTEMPTS = env_int('JOB_MAX_ATTEMPTS', 5)
+JOB_VISIBILITY_TIMEOUT = env_int('JOB_VISIBILITY_TIMEOUT', 300)
+JOB_RETRY_BASE = env_int('JOB_RETRY_BASE', 10)
+JOB_RETRY_MAX = env_int('JOB_RETRY_MAX', 3600)
+JOB_POLL_INTERVAL_MS = env_int('JOB_POLL_INTERVAL_MS', 1000)
+
+
+def engine_options(url):
+    """Параметры create_engine для адреса базы данных."""
+    options = {}
+    if is_sqlite(url):
+        # Драйвер sqlite3 ждет снятия блокировки еще до PRAGMA busy_timeout
+        options['connect_args'] = {'timeout': SQLITE_BUSY_TIMEOUT / 1000}
+    else:
+        options['pool_pre_ping'] = True
+    if not is_sqlite_memory(url):
+        options['pool_size'] = DB_POOL_SIZE
+        options['max_overflow'] = DB_MAX_OVERFLOW
+        options['pool_recycle'] = DB_POOL_RECYCLE
+    return options
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL', 'sqlite:///app.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Отдельное подключение для чтения (реплика или тот же файл SQLite в WAL),
+    # на него уходят SELECT'ы GET-запросов к /api
+    DATABASE_READ_URL = database_url('DATABASE_READ_URL')
+    SQLALCHEMY_BINDS = {
+        'replica': {'url': DATABASE_READ_URL, **engine_options(DATABASE_READ_URL)}
+    } if DATABASE_READ_URL else {}
+
+    SQLITE_BUSY_TIMEOUT = SQLITE_BUSY_TIMEOUT
+    SQLITE_CACHE_SIZE = SQLITE_CACHE_SIZE
+    SQLITE_MMAP_SIZE = SQLITE_MMAP_SIZE
+
+    # Заголовки X-Query-Count / X-DB-Time в ответах и порог медленного запроса, мс
+    SQL_DEBUG_HEADERS = env_bool('SQL_DEBUG_HEADERS')
+    SLOW_QUERY_MS = env_int('SLOW_QUERY_MS', 100)
+
+    TIMELINE_FANOUT_LIMIT = TIMELINE_FANOUT_LIMIT
+    IMAGE_WORKERS = IMAGE_WORKERS
+
+    API_ACCESS_TOKEN_TTL = API_ACCESS_TOKEN_TTL
+    API_REFRESH_TOKEN_TTL = API_REFRESH_TOKEN_TTL
+    API_BATCH_MAX_SIZE = API_BATCH_MAX_SIZE
+
+    WRITE_QUEUE_ENABLED = WRITE_QUEUE_ENABLED
+    WRITE_QUEUE_MAX_BATCH = WRITE_QUEUE_MAX_BATCH
+    WRITE_QUEUE_MAX_DELAY_MS = WRITE_QUEUE_MAX_DELAY_MS
+    SUGGESTIONS_TOP_K = SUGGESTIONS_TOP_K
+    SUGGESTIONS_BLOCK_ROWS = SUGGESTIONS_BLOCK_ROWS
+    SUGGESTIONS_MAX_DEGREE = SUGGESTIONS_MAX_DEGREE
+    JOB_QUEUE_ENABLED = JOB_QUEUE_ENABLED
+    JOB_MAX_ATTEMPTS = JOB_MAX_ATTEMPTS
+    JOB_VISIBILITY_TIMEOUT = JOB_VISIBILITY_TIMEOUT
+    JOB_RETRY_BASE = JOB_RETRY_BASE
+    JOB_RETRY_MAX = JOB_RETRY_MAX
+    JOB_POLL_INTERVAL_MS = JOB_POLL_INTERVAL_MS
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from sqlalchemy import case, or_, tuple_
+
+from models import db, User, PrivateMessage, Conversation
+from pagination import encode_cursor, decode_cursor, InvalidCursor, DEFAULT_LIMIT
+
+
+def record_message(message):
+    """Обновляет сводку диалога в той же транзакции, что и новое сообщение."""
+    db.session.flush()
+    user_a_id, user_b_id = Conversation.pair(message.sender_id, message.receiver_id)
+    conversation = Conversation.query.filter_by(user_a_id=user_a_id, user_b_id=user_b_id).first()
+
+    if conversation is None:
+        conversation = Conversation(user_a_id=user_a_id, user_b_id=user_b_id)
+        db.session.add(conversation)
+        db.session.flush()
+
+    conversation.last_message_id = message.id
+    conversation.last_message_at = message.created_at
+
+    # Сообщение самому себе не считаем непрочитанным
+    if message.sender_id == message.receiver_id:
+        return conversation
+    if message.receiver_id == user_a_id:
+        conversation.unread_count_a = Conversation.unread_count_a + 1
+    else:
+        conversation.unread_count_b = Conversation.unread_count_b + 1
+    return conversation
+
+
+def mark_messages_read(user_id, other_id, up_to_id):
+    """Одним UPDATE помечает прочитанными входящие от other_id сообщения с id <= up_to_id."""
+    PrivateMessage.query.filter(
+        PrivateMessage.sender_id == other_id,
+        PrivateMessage.receiver_id == user_id,
+        PrivateMessage.id <= up_to_id,
+        PrivateMessage.is_read.is_(False)
+    ).update({PrivateMessage.is_read: True}, synchronize_session='evaluate')
+
+    # Непрочитанными остаются только более новые сообщения
+    remaining = PrivateMessage.query.filter(
+        PrivateMessage.sender_id == other_id,
+        PrivateMessage.receiver_id == user_id,
+        PrivateMessage.id > up_to_id,
+        PrivateMessage.is_read.is_(False)
+    ).count()
+
+    user_a_id, user_b_id = Conversation.pair(user_id, other_id)
+    column = Conversation.unread_count_a if user_id == user_a_id else Conversation.unread_count_b
+    Conversation.query.filter_by(user_a_id=user_a_id, user_b_id=user_b_id).update(
+        {column: remaining}, synchronize_session=False
+    )
+
+
+def history_page(user_id, other_id, before_id=None, after_id=None, limit=DEFAULT_LIMIT, options=()):
+    """Страница переписки двух пользователей в порядке возрастания id.
+
+    Без курсоров возвращает самые новые сообщения, с before_id — более старые,
+    с after_id — пришедшие позже. Каждое направление переписки читается
+    отдельным диапазоном индекса (sender_id, receiver_id), без сортировки всей истории.
+    options — опции загрузки (например, только нужные колонки).
+    Возвращает (сообщения, есть_ли_еще).
+    """
+    directions = {(user_id, other_id), (other_id, user_id)}
+    messages = []
+    for sender_id, receiver_id in directions:
+        query = PrivateMessage.query.options(*options).filter_by(sender_id=sender_id, receiver_id=receiver_id)
+        if after_id is not None:
+            query = query.filter(PrivateMessage.id > after_id).order_by(PrivateMessage.id.asc())
+        else:
+            if before_id is not None:
+                query = query.filter(PrivateMessage.id < before_id)
+            query = query.order_by(PrivateMessage.id.desc())
+        messages.extend(query.limit(limit + 1).all())
+
+    newest_first = after_id is None
+    messages.sort(key=lambda message: message.id, reverse=newest_first)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if newest_first:
+        messages.reverse()
+    return messages, has_more
+
+
+def conversation_cursor(conversation):
+    return encode_cursor([conversation.last_message_at.isoformat(), conversation.id])
+
+
+def inbox_page(user_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Страница входящих: (диалог, собеседник, последнее сообщение), новые сверху.
+
+    Один запрос по индексам conversation, число строк не зависит от истории сообщений.
+    """
+    other_user_id = case(
+        (Conversation.user_a_id == user_id, Conversation.user_b_id),
+        else_=Conversation.user_a_id
+    )
+    query = db.session.query(Conversation, User, PrivateMessage).join(
+        User, User.id == other_user_id
+    ).join(
+        PrivateMessage, PrivateMessage.id == Conversation.last_message_id
+    ).filter(
+        or_(Conversation.user_a_id == user_id, Conversation.user_b_id == user_id)
+    ).order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+
+    if cursor:
+        try:
+            last_message_at, conversation_id = decode_cursor(cursor)
+            key = (datetime.fromisoformat(last_message_at), int(conversation_id))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(tuple_(Conversation.last_message_at, Conversation.id) < key)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = conversation_cursor(rows[-1][0])
+
+    return rows, next_cursor
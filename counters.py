@@ -0,0 +1,36 @@
+from sqlalchemy import func, select
+
+from models import db, User, Post, Comment, Like, Follow, FriendEdge, Notification
+
+
+def increment(model, object_id, column, delta=1):
+    # Атомарный UPDATE в текущей транзакции, без чтения строки в Python
+    db.session.query(model).filter(model.id == object_id).update(
+        {column: column + delta}, synchronize_session=False
+    )
+
+
+def friends_count_query(user_id_column):
+    return select(func.count()).select_from(FriendEdge).where(
+        FriendEdge.user_id == user_id_column
+    ).scalar_subquery()
+
+
+def repair_counters():
+    """Пересчитывает все денормализованные счетчики двумя массовыми UPDATE."""
+    db.session.query(Post).update({
+        Post.likes_count: select(func.count(Like.id)).where(Like.post_id == Post.id).scalar_subquery(),
+        Post.comments_count: select(func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery()
+    }, synchronize_session=False)
+
+    db.session.query(User).update({
+        User.posts_count: select(func.count(Post.id)).where(Post.author_id == User.id).scalar_subquery(),
+        User.followers_count: select(func.count(Follow.id)).where(Follow.followed_id == User.id).scalar_subquery(),
+        User.following_count: select(func.count(Follow.id)).where(Follow.follower_id == User.id).scalar_subquery(),
+        User.friends_count: friends_count_query(User.id),
+        User.unread_notifications: select(func.count(Notification.id)).where(
+            Notification.user_id == User.id, Notification.is_read.is_(False)
+        ).scalar_subquery()
+    }, synchronize_session=False)
+
+    db.session.commit()
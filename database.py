@@ -0,0 +1,82 @@
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Сессия, отправляющая чтение в read-only запросах на реплику.
+
+    Запрос помечается как read-only через use_replica(). Первая же запись
+    (flush, UPDATE/DELETE/INSERT) переключает остаток запроса на основную
+    базу, чтобы не читать с реплики то, что только что записали.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('db_read_only'):
+            if not self._flushing and getattr(clause, 'is_select', False):
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    return engine
+            elif self._flushing or clause is not None:
+                g.db_read_only = False
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        # В пакете /api/batch обработчики только сбрасывают изменения в БД,
+        # а транзакцию фиксирует сам пакет после всех элементов
+        if self.info.get('deferred_commit'):
+            self.flush()
+            self.expire_all()
+            return
+        super().commit()
+
+    def rollback(self):
+        if self.info.get('deferred_commit'):
+            self.info['batch_rolled_back'] = True
+        super().rollback()
+
+
+def use_replica(read_only=True):
+    g.db_read_only = read_only
+
+
+def after_commit(callback, *args):
+    """Вызывает callback сразу, а внутри пакета /api/batch — после его commit.
+
+    Так инвалидация кэшей и рассылка событий не опережают фиксацию данных
+    и не происходят вовсе, если пакет откатился.
+    """
+    pending = g.get('after_commit') if has_app_context() else None
+    if pending is None:
+        return callback(*args)
+    pending.append((callback, args))
+
+
+def apply_sqlite_pragmas(dbapi_connection, config, read_only=False):
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        # WAL: читатели не блокируют писателя и наоборот; NORMAL безопасен в режиме WAL
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    else:
+        cursor.execute('PRAGMA query_only=ON')
+    cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.execute(f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    cursor.close()
+
+
+def configure_engines(app, db):
+    """Вешает настройку соединений на движки, созданные Flask-SQLAlchemy."""
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            read_only = bind_key == REPLICA_BIND
+
+            def on_connect(dbapi_connection, connection_record, read_only=read_only):
+                apply_sqlite_pragmas(dbapi_connection, app.config, read_only)
+
+            event.listen(engine, 'connect', on_connect)
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+from collections import deque
+
+from database import after_commit
+
+
+class EventBroker:
+    """Внутрипроцессный pub/sub для push-уведомлений клиентов.
+
+    События получают сквозной возрастающий id и хранятся в кольцевом буфере,
+    поэтому переподключившийся клиент по Last-Event-ID получает только
+    пропущенные события. Если клиент отстал больше, чем вмещает буфер
+    (или процесс перезапускался), он получает событие 'reset' и должен
+    перечитать данные обычными запросами.
+    """
+
+    def __init__(self, history_size=1000):
+        self._condition = threading.Condition()
+        self._history = deque(maxlen=history_size)
+        self._last_id = 0
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, event_type, data, user_ids=None):
+        # user_ids=None — событие для всех (активность в ленте)
+        with self._condition:
+            self._last_id += 1
+            recipients = frozenset(user_ids) if user_ids is not None else None
+            self._history.append((self._last_id, event_type, data, recipients))
+            self._condition.notify_all()
+            return self._last_id
+
+    def _events_since(self, user_id, last_id):
+        if (self._history and last_id < self._history[0][0] - 1) or last_id > self._last_id:
+            return [(self._last_id, 'reset', {})]
+        return [
+            (event_id, event_type, data)
+            for event_id, event_type, data, recipients in self._history
+            if event_id > last_id and (recipients is None or user_id in recipients)
+        ]
+
+    def wait(self, user_id, last_id, timeout):
+        """Ждет события для пользователя после last_id не дольше timeout секунд.
+
+        Возвращает (события, новый last_id).
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self._events_since(user_id, last_id)
+                if events:
+                    return events, events[-1][0]
+                # Чужие события двигают курсор, чтобы не пересматривать их повторно
+                last_id = self._last_id
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], last_id
+                self._condition.wait(remaining)
+
+
+def format_sse(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+broker = EventBroker()
+
+
+def publish(event_type, data, user_ids=None):
+    # Событие уходит клиентам только после фиксации данных, о которых оно сообщает
+    after_commit(broker.publish, event_type, data, user_ids)
\ No newline at end of file
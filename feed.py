@@ -0,0 +1,21 @@
+from sqlalchemy.orm import joinedload
+
+from models import db, Post, Like
+
+
+def posts_query():
+    # Автор подгружается тем же запросом, что и посты
+    return Post.query.options(joinedload(Post.author))
+
+
+def load_liked_post_ids(posts, user_id):
+    """Множество id постов страницы, которые лайкнул пользователь, одним запросом."""
+    post_ids = [post.id for post in posts]
+    if not post_ids or user_id is None:
+        return set()
+
+    rows = db.session.query(Like.post_id).filter(
+        Like.user_id == user_id,
+        Like.post_id.in_(post_ids)
+    ).all()
+    return {post_id for post_id, in rows}
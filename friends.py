@@ -0,0 +1,71 @@
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import aliased
+
+from models import db, User, FriendEdge, Friendship
+from pagination import encode_cursor, decode_cursor, InvalidCursor, DEFAULT_LIMIT
+
+# Заявки (кто кого пригласил, статус) хранятся в friendship, а принятая дружба
+# дублируется в friend_edge двумя зеркальными строками. Все чтения "друзья
+# пользователя" идут по friend_edge; функции ниже держат таблицы согласованными.
+
+
+def add_friend_edges(user_id, friend_id):
+    db.session.add_all([
+        FriendEdge(user_id=user_id, friend_id=friend_id),
+        FriendEdge(user_id=friend_id, friend_id=user_id),
+    ])
+
+
+def remove_friend_edges(user_id, friend_id):
+    db.session.query(FriendEdge).filter(or_(
+        and_(FriendEdge.user_id == user_id, FriendEdge.friend_id == friend_id),
+        and_(FriendEdge.user_id == friend_id, FriendEdge.friend_id == user_id)
+    )).delete(synchronize_session=False)
+
+
+def friend_ids_query(user_id):
+    return select(FriendEdge.friend_id).where(FriendEdge.user_id == user_id)
+
+
+def join_mutual(query, user_id, other_id):
+    """Ограничивает запрос по FriendEdge общими друзьями двух пользователей.
+
+    Друзья user_id читаются диапазоном ключа, а каждый проверяется точечным
+    поиском пары (other_id, friend_id) в том же ключе.
+    """
+    other = aliased(FriendEdge)
+    return query.join(
+        other, and_(other.user_id == other_id, other.friend_id == FriendEdge.friend_id)
+    ).where(FriendEdge.user_id == user_id)
+
+
+def count_mutual_friends(user_id, other_id):
+    return db.session.scalar(join_mutual(select(func.count()).select_from(FriendEdge), user_id, other_id))
+
+
+def mutual_friends_page(user_id, other_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Общие друзья по возрастанию id и курсор следующей страницы."""
+    query = join_mutual(User.query.join(FriendEdge, FriendEdge.friend_id == User.id), user_id, other_id)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(FriendEdge.friend_id > values[0])
+    users = query.order_by(FriendEdge.friend_id).limit(limit + 1).all()
+    next_cursor = encode_cursor([users[limit - 1].id]) if len(users) > limit else None
+    return users[:limit], next_cursor
+
+
+def rebuild_friend_edges():
+    """Заново строит friend_edge по принятым заявкам friendship (как миграция)."""
+    db.session.query(FriendEdge).delete(synchronize_session=False)
+    accepted = Friendship.status == 'accepted'
+    pairs = select(Friendship.user_id, Friendship.friend_id, Friendship.created_at).where(accepted).union_all(
+        select(Friendship.friend_id, Friendship.user_id, Friendship.created_at).where(accepted)
+    ).subquery()
+    user_id, friend_id, created_at = pairs.c
+    db.session.execute(FriendEdge.__table__.insert().from_select(
+        ['user_id', 'friend_id', 'created_at'],
+        select(user_id, friend_id, func.min(created_at)).group_by(user_id, friend_id)
+    ))
+    db.session.commit()
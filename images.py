@@ -0,0 +1,194 @@
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+from PIL.Image import DecompressionBombError
+
+from jobs import enqueue
+
+# Варианты изображения: (ширина, высота) — квадратная обрезка, ширина — вписывание
+VARIANTS = {
+    'thumb': (160, 160),
+    'feed': (720, None),
+    'full': (1600, None),
+}
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+QUALITY = 82
+
+MEDIA_NAME_RE = re.compile(r'^([0-9a-f]{40})_(thumb|feed|full)\.(jpg|webp)$')
+MEDIA_REF_RE = re.compile(r'([0-9a-f]{40})_(?:thumb|feed|full)\.(?:jpg|webp)$')
+
+# Изображения масштабируются в фоне; Pillow отпускает GIL при декодировании и сжатии
+_executor = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=current_app.config['IMAGE_WORKERS'], thread_name_prefix='images'
+        )
+    return _executor
+
+
+def media_folder():
+    return current_app.config['MEDIA_FOLDER']
+
+
+def original_path(digest):
+    return os.path.join(media_folder(), 'originals', digest)
+
+
+def failed_path(digest):
+    # Метка оригинала, который не удалось декодировать; общая для всех процессов
+    return original_path(digest) + '.failed'
+
+
+def variant_name(digest, variant, fmt='jpeg'):
+    return f'{digest}_{variant}.{FORMATS[fmt]}'
+
+
+def store_upload(file):
+    """Сохраняет загрузку под именем по SHA-1 содержимого и ставит в очередь варианты.
+
+    Одинаковые файлы хранятся один раз. Возвращает SHA-1 (hex).
+    """
+    os.makedirs(os.path.join(media_folder(), 'originals'), exist_ok=True)
+    hasher = hashlib.sha1()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.join(media_folder(), 'originals'))
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+                hasher.update(chunk)
+                tmp.write(chunk)
+        try:
+            # Проверяем только заголовок: полное декодирование идет в фоне.
+            # Слишком большие размеры в заголовке Pillow отвергает еще при открытии
+            with Image.open(tmp_path) as image:
+                image.verify()
+        except (UnidentifiedImageError, DecompressionBombError, OSError, SyntaxError) as e:
+            raise InvalidImage(str(e))
+
+        digest = hasher.hexdigest()
+        if os.path.exists(original_path(digest)):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, original_path(digest))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    queue_variants(digest)
+    return digest
+
+
+def queue_variants(digest):
+    # С очередью задач варианты строит `flask worker`, иначе — пул потоков процесса.
+    # Задача фиксируется вместе с транзакцией запроса, сохранившего загрузку
+    if current_app.config['JOB_QUEUE_ENABLED']:
+        enqueue('generate_variants', digest, priority=5)
+    else:
+        schedule_variants(digest)
+
+
+def schedule_variants(digest):
+    return executor().submit(generate_variants, media_folder(), digest)
+
+
+def generate_variants(folder, digest):
+    """Строит все варианты изображения; уже готовые файлы пропускаются."""
+    missing = [
+        (variant, fmt) for variant in VARIANTS for fmt in FORMATS
+        if not os.path.exists(os.path.join(folder, variant_name(digest, variant, fmt)))
+    ]
+    if not missing:
+        return
+
+    with Image.open(os.path.join(folder, 'originals', digest)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'L'):
+            # JPEG не умеет прозрачность — кладем на белый фон
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA'))
+            image = background
+        image = image.convert('RGB')
+
+        for variant, fmt in missing:
+            width, height = VARIANTS[variant]
+            if height:
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+
+            path = os.path.join(folder, variant_name(digest, variant, fmt))
+            fd, tmp_path = tempfile.mkstemp(dir=folder)
+            with os.fdopen(fd, 'wb') as tmp:
+                resized.save(tmp, format=fmt.upper(), quality=QUALITY, optimize=True)
+            os.replace(tmp_path, path)
+
+
+def ensure_variant(name):
+    """Путь к файлу варианта; если фон еще не успел его построить — строит сразу.
+
+    None, если варианта нет и построить его нельзя.
+    """
+    match = MEDIA_NAME_RE.match(name)
+    if not match:
+        return None
+    path = os.path.join(media_folder(), name)
+    if not os.path.exists(path):
+        digest = match.group(1)
+        if not os.path.exists(original_path(digest)) or os.path.exists(failed_path(digest)):
+            return None
+        try:
+            schedule_variants(digest).result()
+        except (DecompressionBombError, OSError, SyntaxError) as e:
+            # Заголовок прошел verify(), а само изображение не декодируется:
+            # запоминаем это, чтобы не повторять работу на каждый запрос
+            current_app.logger.warning('Cannot build variants of %s: %s', digest, e)
+            open(failed_path(digest), 'w').close()
+            return None
+    return path
+
+
+def media_digest(ref):
+    """SHA-1 из ссылки на обработанное изображение или None для старых загрузок."""
+    match = MEDIA_REF_RE.search(ref or '')
+    return match.group(1) if match else None
+
+
+def media_url(digest, variant='full', fmt='jpeg'):
+    return url_for('media', name=variant_name(digest, variant, fmt))
+
+
+def image_url(ref, variant='feed', fmt='jpeg'):
+    """URL нужного варианта картинки поста; старые ссылки возвращаются как есть."""
+    digest = media_digest(ref)
+    return media_url(digest, variant, fmt) if digest else ref
+
+
+def image_variants(ref):
+    digest = media_digest(ref)
+    if not digest:
+        return None
+    return {
+        fmt: {variant: media_url(digest, variant, fmt) for variant in VARIANTS}
+        for fmt in FORMATS
+    }
+
+
+def avatar_url(avatar, variant='thumb', fmt='jpeg'):
+    digest = media_digest(avatar)
+    if digest:
+        return media_url(digest, variant, fmt)
+    return url_for('uploaded_avatar', filename=avatar or 'default_avatar.png')
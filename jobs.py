@@ -0,0 +1,250 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, Job, DeadJob
+
+logger = logging.getLogger(__name__)
+
+# Сколько готовых задач воркер пробует взять за один запрос: если первую
+# перехватил другой воркер, берется следующая без нового SELECT
+CLAIM_CANDIDATES = 10
+
+TASKS = {}
+
+
+class Task:
+    def __init__(self, func, name, max_attempts=None, timeout=None):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+
+def task(name, max_attempts=None, timeout=None):
+    """Регистрирует функцию как задачу очереди под именем name.
+
+    Задача может выполниться повторно (после ошибки или истечения аренды),
+    поэтому должна быть идемпотентной. Изменения в БД она оставляет в сессии:
+    воркер фиксирует их одним commit вместе с удалением задачи из очереди.
+    timeout — время аренды, с; если воркер не уложился, задачу возьмет другой.
+    """
+    def register(func):
+        TASKS[name] = Task(func, name, max_attempts, timeout)
+        return func
+    return register
+
+
+def enqueue(name, *args, priority=0, delay=0, max_attempts=None):
+    """Ставит задачу в очередь в текущей транзакции: воркеры увидят ее после commit.
+
+    Аргументы сохраняются как JSON. Задачи с большим priority берутся раньше.
+    """
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    job = Job(
+        name=name,
+        args=json.dumps(args),
+        priority=priority,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or TASKS[name].max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+    )
+    db.session.add(job)
+    return job
+
+
+def defer(name, *args, **options):
+    """Отдает задачу воркерам, а если очередь выключена — выполняет ее сразу в текущей транзакции."""
+    if current_app.config['JOB_QUEUE_ENABLED']:
+        return enqueue(name, *args, **options)
+    TASKS[name].func(*args)
+
+
+def retry_delay(attempts):
+    # Экспоненциальная задержка с разбросом, чтобы упавшие вместе задачи не повторялись пачкой
+    delay = min(current_app.config['JOB_RETRY_BASE'] * 2 ** (attempts - 1), current_app.config['JOB_RETRY_MAX'])
+    return delay * random.uniform(0.75, 1.25)
+
+
+class Worker:
+    """Воркер очереди: берет готовые задачи по приоритету и выполняет их по одной.
+
+    Взятие задачи — условный UPDATE, сдвигающий run_at на время аренды
+    (visibility timeout), поэтому одну задачу не возьмут два воркера, а
+    задача упавшего воркера снова станет готовой, когда аренда истечет.
+    Ошибка откладывает повтор с экспоненциальной задержкой; после
+    max_attempts попыток задача переносится в dead_job.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def run(self):
+        poll_interval = self.app.config['JOB_POLL_INTERVAL_MS'] / 1000
+        logger.info('Worker %s started', self.name)
+        while not self.stopping:
+            with self.app.app_context():
+                worked = self.run_once()
+            if not worked:
+                time.sleep(poll_interval)
+        logger.info('Worker %s stopped', self.name)
+
+    def run_once(self):
+        """Выполняет одну готовую задачу; False, если очередь пуста."""
+        job = self.claim()
+        if job is None:
+            return False
+        self.execute(job)
+        return True
+
+    def claim(self):
+        now = datetime.utcnow()
+        candidates = db.session.query(Job.id, Job.name, Job.run_at).filter(Job.run_at <= now).order_by(
+            Job.priority.desc(), Job.run_at, Job.id
+        ).limit(CLAIM_CANDIDATES).all()
+        for job_id, name, run_at in candidates:
+            task = TASKS.get(name)
+            timeout = (task and task.timeout) or self.app.config['JOB_VISIBILITY_TIMEOUT']
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, Job.run_at == run_at).values(
+                    run_at=now + timedelta(seconds=timeout),
+                    attempts=Job.attempts + 1,
+                    locked_by=self.name
+                )
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    def execute(self, job):
+        if job.attempts > job.max_attempts:
+            # Последняя попытка не завершилась: воркер упал или не уложился в аренду
+            self.bury(job.id, job.last_error or 'Visibility timeout expired')
+            return
+
+        # После commit или отката строку мог удалить другой воркер, и объект
+        # job больше не читается
+        job_id, name, attempts, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+        task = TASKS.get(name)
+        started = time.monotonic()
+        try:
+            if task is None:
+                raise LookupError(f'Unknown task: {name}')
+            task.func(*json.loads(job.args))
+            # Если аренда истекла и задачу взял другой воркер, строку удалит он
+            db.session.query(Job).filter_by(id=job_id, locked_by=self.name).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.warning('Job %s (%s) failed, attempt %d of %d',
+                           job_id, name, attempts, max_attempts, exc_info=True)
+            self.fail(job_id, attempts, max_attempts, traceback.format_exc())
+        else:
+            logger.info('Job %s (%s) done in %.3f s', job_id, name, time.monotonic() - started)
+
+    def fail(self, job_id, attempts, max_attempts, error):
+        if attempts >= max_attempts:
+            self.bury(job_id, error)
+            return
+        # Если аренда истекла и задачу взял другой воркер, ее повтором распоряжается он
+        db.session.execute(
+            update(Job).where(Job.id == job_id, Job.locked_by == self.name).values(
+                run_at=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)),
+                locked_by=None,
+                last_error=error
+            )
+        )
+        db.session.commit()
+
+    def bury(self, job_id, error):
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return
+        dead = DeadJob(
+            name=job.name,
+            args=job.args,
+            priority=job.priority,
+            attempts=job.attempts,
+            error=error,
+            created_at=job.created_at
+        )
+        # Как и в fail, строку под чужой арендой не трогаем
+        buried = db.session.query(Job).filter_by(id=job_id, locked_by=self.name).delete(synchronize_session=False)
+        if not buried:
+            db.session.rollback()
+            return
+        logger.error('Job %s (%s) moved to dead_job after %d attempts', job_id, dead.name, dead.attempts)
+        db.session.add(dead)
+        db.session.commit()
+
+
+def run_workers(app, processes=1):
+    """Запускает воркеры и ждет их; по SIGTERM/SIGINT они дорабатывают текущую задачу."""
+    if processes <= 1:
+        worker = Worker(app)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        worker.run()
+        return
+
+    context = multiprocessing.get_context('fork')
+    children = [
+        context.Process(target=worker_process, args=(app,), name=f'worker-{i}')
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def shutdown(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for child in children:
+        child.join()
+
+
+def worker_process(app):
+    # Соединения, унаследованные от родителя, не используем: у процесса свой пул
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    run_workers(app, 1)
+
+
+def requeue_dead_jobs(name=None):
+    """Возвращает задачи из dead_job в очередь с новым счетчиком попыток."""
+    query = DeadJob.query
+    if name:
+        query = query.filter_by(name=name)
+    count = 0
+    for dead in query.all():
+        task = TASKS.get(dead.name)
+        db.session.add(Job(
+            name=dead.name,
+            args=dead.args,
+            priority=dead.priority,
+            max_attempts=(task and task.max_attempts) or current_app.config['JOB_MAX_ATTEMPTS']
+        ))
+        db.session.delete(dead)
+        count += 1
+    db.session.commit()
+    return count
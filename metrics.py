@@ -0,0 +1,119 @@
+"""Метрики приложения в формате Prometheus.
+
+Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR (до запуска
+воркеров), значения пишутся в общие файлы в этом каталоге и /metrics
+отдает сумму по всем процессам хоста. Каталог нужно очищать перед стартом
+сервера, а при завершении воркера вызывать mark_process_dead(pid)
+(например, из хука child_exit в gunicorn).
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+
+# Маршруты с загрузкой файлов, для которых считаем принятые байты
+UPLOAD_ENDPOINTS = {'api.create_post', 'upload_avatar'}
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса',
+    ['endpoint', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Число обработанных запросов',
+    ['endpoint', 'method', 'status']
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Запросы в обработке',
+    ['endpoint'], multiprocess_mode='livesum'
+)
+UPLOAD_BYTES = Counter(
+    'http_upload_bytes_total', 'Объем загруженных данных',
+    ['endpoint']
+)
+DB_POOL_SIZE = Gauge(
+    'db_pool_size', 'Размер пула соединений',
+    ['bind'], multiprocess_mode='livesum'
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'Соединения, выданные из пула',
+    ['bind'], multiprocess_mode='livesum'
+)
+DB_POOL_OVERFLOW = Gauge(
+    'db_pool_overflow', 'Соединения сверх размера пула',
+    ['bind'], multiprocess_mode='livesum'
+)
+
+USER_CACHE_REQUESTS = Counter(
+    'user_cache_requests_total', 'Обращения к кэшу пользователя в load_user',
+    ['result']
+)
+
+WRITE_QUEUE_GROUP_SIZE = Histogram(
+    'write_queue_group_size', 'Операций в одном групповом commit очереди записи',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+
+def mark_process_dead(pid):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def update_pool_stats(db):
+    for bind_key, engine in db.engines.items():
+        pool = engine.pool
+        # У StaticPool/SingletonThreadPool (SQLite в памяти) этих счетчиков нет
+        if not hasattr(pool, 'checkedout'):
+            continue
+        bind = bind_key or 'default'
+        DB_POOL_SIZE.labels(bind).set(pool.size())
+        DB_POOL_CHECKED_OUT.labels(bind).set(pool.checkedout())
+        DB_POOL_OVERFLOW.labels(bind).set(max(pool.overflow(), 0))
+
+
+def render_metrics():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def init_metrics(app, db):
+    """Подключает сбор метрик ко всем запросам и регистрирует маршрут /metrics."""
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = request.endpoint or '<unmatched>'
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = g.get('metrics_endpoint')
+        if endpoint is None:
+            return response
+        status = str(response.status_code)
+        REQUEST_LATENCY.labels(endpoint, status).observe(time.perf_counter() - g.metrics_started)
+        REQUEST_COUNT.labels(endpoint, request.method, status).inc()
+        if endpoint in UPLOAD_ENDPOINTS and request.content_length:
+            UPLOAD_BYTES.labels(endpoint).inc(request.content_length)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+            update_pool_stats(db)
+
+    def metrics():
+        update_pool_stats(db)
+        return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,59 @@
+"""add denormalized counter columns
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-18 09:12:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать схему с этими колонками
+    inspector = sa.inspect(op.get_bind())
+    if 'likes_count' not in {c['name'] for c in inspector.get_columns('post')}:
+        with op.batch_alter_table('post', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+
+    if 'posts_count' not in {c['name'] for c in inspector.get_columns('user')}:
+        with op.batch_alter_table('user', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('posts_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('friends_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Заполняем счетчики для уже существующих данных
+    op.execute(
+        'UPDATE post SET '
+        'likes_count = (SELECT count(*) FROM "like" WHERE "like".post_id = post.id), '
+        'comments_count = (SELECT count(*) FROM comment WHERE comment.post_id = post.id)'
+    )
+    op.execute(
+        'UPDATE "user" SET '
+        'posts_count = (SELECT count(*) FROM post WHERE post.author_id = "user".id), '
+        'followers_count = (SELECT count(*) FROM follow WHERE follow.followed_id = "user".id), '
+        'following_count = (SELECT count(*) FROM follow WHERE follow.follower_id = "user".id), '
+        "friends_count = (SELECT count(*) FROM friendship WHERE friendship.status = 'accepted' "
+        'AND (friendship.user_id = "user".id OR friendship.friend_id = "user".id))'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('friends_count')
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('followers_count')
+        batch_op.drop_column('posts_count')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('comments_count')
+        batch_op.drop_column('likes_count')
@@ -0,0 +1,39 @@
+"""add revoked API token table
+
+Revision ID: 3f6c1a8d52e4
+Revises: 9d3a7c5e21f8
+Create Date: 2026-10-18 20:14:09.532871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c1a8d52e4'
+down_revision = '9d3a7c5e21f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать пустую таблицу
+    if sa.inspect(op.get_bind()).has_table('revoked_token'):
+        return
+    op.create_table('revoked_token',
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    with op.batch_alter_table('revoked_token', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_revoked_token_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('revoked_token', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_revoked_token_expires_at'))
+
+    op.drop_table('revoked_token')
@@ -0,0 +1,63 @@
+"""add materialized timeline table
+
+Revision ID: 5b8e2f6a94d7
+Revises: e19b4f7a03c6
+Create Date: 2026-10-18 16:21:54.380917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2f6a94d7'
+down_revision = 'e19b4f7a03c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_post_author_created' not in {index['name'] for index in inspector.get_indexes('post')}:
+        op.create_index('ix_post_author_created', 'post', ['author_id', 'created_at'], unique=False)
+
+    # db.create_all() при запуске приложения мог уже создать пустую таблицу
+    if not inspector.has_table('timeline_entry'):
+        op.create_table('timeline_entry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['author_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'post_id', name='_timeline_user_post_uc')
+        )
+        op.create_index('ix_timeline_user_created', 'timeline_entry', ['user_id', 'created_at', 'post_id'], unique=False)
+        op.create_index('ix_timeline_user_author', 'timeline_entry', ['user_id', 'author_id'], unique=False)
+
+    # Раскладываем уже существующие посты по лентам: свои, подписки и друзья
+    op.execute('''
+        INSERT INTO timeline_entry (user_id, post_id, author_id, created_at)
+        SELECT sources.user_id, post.id, post.author_id, post.created_at
+        FROM (
+            SELECT id AS user_id, id AS author_id FROM "user"
+            UNION SELECT follower_id, followed_id FROM follow
+            UNION SELECT user_id, friend_id FROM friendship WHERE status = 'accepted'
+            UNION SELECT friend_id, user_id FROM friendship WHERE status = 'accepted'
+        ) AS sources
+        JOIN post ON post.author_id = sources.author_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM timeline_entry AS t
+            WHERE t.user_id = sources.user_id AND t.post_id = post.id
+        )
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_timeline_user_author', table_name='timeline_entry')
+    op.drop_index('ix_timeline_user_created', table_name='timeline_entry')
+    op.drop_table('timeline_entry')
+    op.drop_index('ix_post_author_created', table_name='post')
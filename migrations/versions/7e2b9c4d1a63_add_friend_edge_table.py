@@ -0,0 +1,50 @@
+"""add mirrored friend_edge table
+
+Revision ID: 7e2b9c4d1a63
+Revises: 3f6c1a8d52e4
+Create Date: 2026-10-18 21:36:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b9c4d1a63'
+down_revision = '3f6c1a8d52e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать пустую таблицу
+    if not sa.inspect(op.get_bind()).has_table('friend_edge'):
+        op.create_table('friend_edge',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('friend_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['friend_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'friend_id')
+        )
+
+    # Каждая принятая заявка дает две зеркальные строки; если заявки были
+    # встречными, пара берется один раз с более ранней датой
+    op.execute('''
+        INSERT INTO friend_edge (user_id, friend_id, created_at)
+        SELECT pairs.user_id, pairs.friend_id, min(pairs.created_at)
+        FROM (
+            SELECT user_id, friend_id, created_at FROM friendship WHERE status = 'accepted'
+            UNION ALL
+            SELECT friend_id, user_id, created_at FROM friendship WHERE status = 'accepted'
+        ) AS pairs
+        WHERE NOT EXISTS (
+            SELECT 1 FROM friend_edge AS e
+            WHERE e.user_id = pairs.user_id AND e.friend_id = pairs.friend_id
+        )
+        GROUP BY pairs.user_id, pairs.friend_id
+    ''')
+
+
+def downgrade():
+    op.drop_table('friend_edge')
@@ -0,0 +1,43 @@
+"""add lookup indexes
+
+Revision ID: 8a4e6d2c51f3
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 11:03:27.518840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6d2c51f3'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_post_feed', 'post', ['is_pinned', 'created_at']),
+    ('ix_post_author_feed', 'post', ['author_id', 'is_pinned', 'created_at']),
+    ('ix_comment_post_created', 'comment', ['post_id', 'created_at']),
+    ('ix_like_post', 'like', ['post_id']),
+    ('ix_follow_follower_followed', 'follow', ['follower_id', 'followed_id']),
+    ('ix_follow_followed', 'follow', ['followed_id']),
+    ('ix_friendship_user_status', 'friendship', ['user_id', 'status']),
+    ('ix_friendship_friend_status', 'friendship', ['friend_id', 'status']),
+    ('ix_message_sender_receiver', 'private_message', ['sender_id', 'receiver_id', 'created_at']),
+    ('ix_message_receiver_sender', 'private_message', ['receiver_id', 'sender_id', 'created_at']),
+]
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать часть индексов
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,40 @@
+"""add FTS5 search index for users, posts and messages
+
+Revision ID: 9d3a7c5e21f8
+Revises: 5b8e2f6a94d7
+Create Date: 2026-10-18 19:02:37.114529
+
+"""
+from alembic import op
+
+from search import SEARCH_INDEXES, index_ddl
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a7c5e21f8'
+down_revision = '5b8e2f6a94d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 есть только в SQLite; на других СУБД поиск отключен
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    # DDL индексов и триггеров — общий с create_search_index() в search.py
+    for fts, table, columns in SEARCH_INDEXES.values():
+        for statement in index_ddl(fts, table, columns):
+            op.execute(statement)
+        # Индексируем уже существующие данные
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for fts, table, columns in reversed(list(SEARCH_INDEXES.values())):
+        for suffix in ('au', 'ad', 'ai'):
+            op.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+        op.execute(f'DROP TABLE IF EXISTS {fts}')
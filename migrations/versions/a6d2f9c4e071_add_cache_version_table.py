@@ -0,0 +1,30 @@
+"""add cache version table
+
+Revision ID: a6d2f9c4e071
+Revises: f3c8a61d90e2
+Create Date: 2026-10-19 03:42:17.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2f9c4e071'
+down_revision = 'f3c8a61d90e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать таблицу
+    if not sa.inspect(op.get_bind()).has_table('cache_version'):
+        op.create_table('cache_version',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('scope')
+        )
+
+
+def downgrade():
+    op.drop_table('cache_version')
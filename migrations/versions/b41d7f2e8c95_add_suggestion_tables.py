@@ -0,0 +1,46 @@
+"""add suggestion tables
+
+Revision ID: b41d7f2e8c95
+Revises: 7e2b9c4d1a63
+Create Date: 2026-10-18 22:48:17.305964
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41d7f2e8c95'
+down_revision = '7e2b9c4d1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать пустые таблицы;
+    # заполняет их `flask compute-suggestions --full`
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('suggestion'):
+        op.create_table('suggestion',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('suggested_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('mutual_friends', sa.Integer(), nullable=False),
+        sa.Column('common_follows', sa.Integer(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['suggested_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'rank')
+        )
+    if not inspector.has_table('suggestion_change'):
+        op.create_table('suggestion_change',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('suggestion_change')
+    op.drop_table('suggestion')
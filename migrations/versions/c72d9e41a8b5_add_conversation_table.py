@@ -0,0 +1,69 @@
+"""add conversation summary table
+
+Revision ID: c72d9e41a8b5
+Revises: 8a4e6d2c51f3
+Create Date: 2026-10-18 13:47:09.661302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c72d9e41a8b5'
+down_revision = '8a4e6d2c51f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать пустую таблицу
+    if not sa.inspect(op.get_bind()).has_table('conversation'):
+        create_conversation_table()
+
+    # Строим сводки по уже существующей переписке
+    op.execute('''
+        INSERT INTO conversation (user_a_id, user_b_id, last_message_id, last_message_at, unread_count_a, unread_count_b)
+        SELECT pairs.user_a_id, pairs.user_b_id, pairs.last_message_id, m.created_at,
+               pairs.unread_count_a, pairs.unread_count_b
+        FROM (
+            SELECT
+                CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END AS user_a_id,
+                CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END AS user_b_id,
+                max(id) AS last_message_id,
+                sum(CASE WHEN receiver_id < sender_id AND NOT is_read THEN 1 ELSE 0 END) AS unread_count_a,
+                sum(CASE WHEN receiver_id > sender_id AND NOT is_read THEN 1 ELSE 0 END) AS unread_count_b
+            FROM private_message
+            GROUP BY 1, 2
+        ) AS pairs
+        JOIN private_message AS m ON m.id = pairs.last_message_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM conversation AS c
+            WHERE c.user_a_id = pairs.user_a_id AND c.user_b_id = pairs.user_b_id
+        )
+    ''')
+
+
+def create_conversation_table():
+    op.create_table('conversation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_a_id', sa.Integer(), nullable=False),
+    sa.Column('user_b_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('unread_count_a', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unread_count_b', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['last_message_id'], ['private_message.id'], ),
+    sa.ForeignKeyConstraint(['user_a_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_b_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_a_id', 'user_b_id', name='_conversation_pair_uc')
+    )
+    op.create_index('ix_conversation_a_last', 'conversation', ['user_a_id', 'last_message_at'], unique=False)
+    op.create_index('ix_conversation_b_last', 'conversation', ['user_b_id', 'last_message_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_conversation_b_last', table_name='conversation')
+    op.drop_index('ix_conversation_a_last', table_name='conversation')
+    op.drop_table('conversation')
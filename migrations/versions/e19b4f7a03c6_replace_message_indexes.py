@@ -0,0 +1,33 @@
+"""replace message indexes with a (sender, receiver, id) index
+
+Revision ID: e19b4f7a03c6
+Revises: c72d9e41a8b5
+Create Date: 2026-10-18 15:22:54.083176
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19b4f7a03c6'
+down_revision = 'c72d9e41a8b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() при запуске приложения мог уже создать новый индекс
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('private_message')}
+    if 'ix_message_sender_receiver' in indexes:
+        op.drop_index('ix_message_sender_receiver', table_name='private_message')
+    if 'ix_message_receiver_sender' in indexes:
+        op.drop_index('ix_message_receiver_sender', table_name='private_message')
+    if 'ix_message_pair' not in indexes:
+        op.create_index('ix_message_pair', 'private_message', ['sender_id', 'receiver_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_message_pair', table_name='private_message')
+    op.create_index('ix_message_receiver_sender', 'private_message', ['receiver_id', 'sender_id', 'created_at'], unique=False)
+    op.create_index('ix_message_sender_receiver', 'private_message', ['sender_id', 'receiver_id', 'created_at'], unique=False)
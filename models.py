@@ -2,8 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,6 +17,14 @@ class User(UserMixin, db.Model):
     avatar = db.Column(db.String(255), default='default_avatar.png')
     is_admin = db.Column(db.Boolean, default=False)
     
+    # Денормализованные счетчики, обновляются в тех же транзакциях, что и связи
+    posts_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followers_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    following_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    friends_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Непрочитанные уведомления: значок читается без подсчета строк notification
+    unread_notifications = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
     # Отношения
     posts = db.relationship('Post', back_populates='author', lazy=True)
     comments = db.relationship('Comment', backref='author', lazy=True)
@@ -42,9 +51,20 @@ class Post(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     is_pinned = db.Column(db.Boolean, default=False)
+    likes_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comments_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     author = db.relationship('User', back_populates='posts')
     comments = db.relationship('Comment', backref='post', lazy=True)
     likes = db.relationship('Like', backref='post', lazy=True)
+    
+    __table_args__ = (
+        # Лента: keyset-пагинация по (is_pinned, created_at, id)
+        db.Index('ix_post_feed', 'is_pinned', 'created_at'),
+        # Посты профиля
+        db.Index('ix_post_author_feed', 'author_id', 'is_pinned', 'created_at'),
+        # Посты автора по времени (слияние популярных авторов в ленту подписок)
+        db.Index('ix_post_author_created', 'author_id', 'created_at'),
+    )
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +72,8 @@ class Comment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    
+    __table_args__ = (db.Index('ix_comment_post_created', 'post_id', 'created_at'),)
 
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,13 +81,21 @@ class Like(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='_user_post_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='_user_post_uc'),
+        db.Index('ix_like_post', 'post_id'),
+    )
 
 class Follow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_follow_follower_followed', 'follower_id', 'followed_id'),
+        db.Index('ix_follow_followed', 'followed_id'),
+    )
 
 class Friendship(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -74,7 +104,20 @@ class Friendship(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'friend_id', name='_user_friend_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'friend_id', name='_user_friend_uc'),
+        db.Index('ix_friendship_user_status', 'user_id', 'status'),
+        db.Index('ix_friendship_friend_status', 'friend_id', 'status'),
+    )
+
+class FriendEdge(db.Model):
+    # Принятая дружба в обе стороны: строки (a, b) и (b, a). Друзья пользователя
+    # читаются одним диапазоном первичного ключа, без OR по двум колонкам friendship
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    friend_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    friend = db.relationship('User', foreign_keys=[friend_id])
 
 class PrivateMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -82,4 +125,124 @@ class PrivateMessage(db.Model):
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Переписка в одну сторону читается диапазоном индекса сразу в порядке id
+    __table_args__ = (db.Index('ix_message_pair', 'sender_id', 'receiver_id', 'id'),) 
+
+class Conversation(db.Model):
+    # Сводка диалога на пару пользователей: user_a_id всегда меньший id пары
+    id = db.Column(db.Integer, primary_key=True)
+    user_a_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_b_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('private_message.id'))
+    last_message_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unread_count_a = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    unread_count_b = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    last_message = db.relationship('PrivateMessage')
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_a_id', 'user_b_id', name='_conversation_pair_uc'),
+        db.Index('ix_conversation_a_last', 'user_a_id', 'last_message_at'),
+        db.Index('ix_conversation_b_last', 'user_b_id', 'last_message_at'),
+    )
+    
+    @staticmethod
+    def pair(user_id, other_id):
+        return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+    
+    def other_user_id(self, user_id):
+        return self.user_b_id if self.user_a_id == user_id else self.user_a_id
+    
+    def unread_count_for(self, user_id):
+        return self.unread_count_a if self.user_a_id == user_id else self.unread_count_b
+
+class TimelineEntry(db.Model):
+    # Материализованная лента подписок: пост автора, разосланный подписчикам и друзьям
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='_timeline_user_post_uc'),
+        db.Index('ix_timeline_user_created', 'user_id', 'created_at', 'post_id'),
+        db.Index('ix_timeline_user_author', 'user_id', 'author_id'),
+    )
+
+class Suggestion(db.Model):
+    # "Возможно, вы знакомы": top-K кандидатов пользователя по порядку rank.
+    # Таблицу заполняет `flask compute-suggestions` (suggestion_job.py)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    suggested_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    mutual_friends = db.Column(db.Integer, default=0, nullable=False)
+    common_follows = db.Column(db.Integer, default=0, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    suggested = db.relationship('User', foreign_keys=[suggested_id])
+
+class SuggestionChange(db.Model):
+    # Пользователи, у которых менялись друзья или подписки после расчета подсказок
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+
+class CacheVersion(db.Model):
+    # Версии областей кэша ответов (response_cache.py), общие для всех процессов
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class Notification(db.Model):
+    # Уведомление свернуто по цели: события одного вида об одном объекте
+    # ("12 человек лайкнули ваш пост") копятся в одной строке, пока она не
+    # прочитана; новое событие после прочтения снова делает ее непрочитанной
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # like, comment, message, friend_request, friend_accept
+    target_id = db.Column(db.Integer, nullable=False)  # пост или пользователь, к которому относится событие
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # автор последнего события
+    count = db.Column(db.Integer, default=1, nullable=False)  # событий с последнего прочтения
+    is_read = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    actor = db.relationship('User', foreign_keys=[actor_id])
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'target_id', name='_notification_target_uc'),
+        # Список уведомлений: keyset-пагинация по (updated_at, id)
+        db.Index('ix_notification_user_updated', 'user_id', 'updated_at', 'id'),
+    )
+
+class Job(db.Model):
+    # Отложенная задача для `flask worker` (jobs.py). Задача готова, когда
+    # run_at наступил; взятая воркером сдвигается на время аренды
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.Text, nullable=False)  # JSON-список аргументов
+    priority = db.Column(db.Integer, default=0, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    locked_by = db.Column(db.String(64))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DeadJob(db.Model):
+    # Задачи, исчерпавшие попытки; `flask requeue-dead-jobs` возвращает их в очередь
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    priority = db.Column(db.Integer, default=0, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    failed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RevokedToken(db.Model):
+    # Токены API, отозванные до истечения срока; после expires_at строка не нужна
+    jti = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
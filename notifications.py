@@ -0,0 +1,117 @@
+from datetime import datetime
+
+from sqlalchemy import insert, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from counters import increment
+from models import db, User, Notification
+from pagination import encode_cursor, decode_cursor, InvalidCursor, DEFAULT_LIMIT
+
+# Уведомления пишутся в транзакции самого события (writes.py, заявки в друзья),
+# поэтому не делают commit. User.unread_notifications меняется только при
+# переходе строки между "прочитано" и "не прочитано".
+
+
+def notify(user_id, kind, target_id, actor_id):
+    """Добавляет событие в уведомление user_id о target_id; о своих действиях не уведомляем."""
+    if user_id is None or user_id == actor_id:
+        return
+    key = (
+        Notification.user_id == user_id,
+        Notification.kind == kind,
+        Notification.target_id == target_id,
+    )
+    now = datetime.utcnow()
+
+    for _ in range(2):
+        # Обычно строка уже есть и не прочитана: один UPDATE без чтения
+        updated = db.session.execute(
+            update(Notification).where(*key, Notification.is_read.is_(False)).values(
+                count=Notification.count + 1, actor_id=actor_id, updated_at=now
+            )
+        ).rowcount
+        if updated:
+            return
+
+        reopened = db.session.execute(
+            update(Notification).where(*key, Notification.is_read.is_(True)).values(
+                count=1, is_read=False, actor_id=actor_id, updated_at=now
+            )
+        ).rowcount
+        if not reopened:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(Notification).values(
+                        user_id=user_id, kind=kind, target_id=target_id,
+                        actor_id=actor_id, count=1, is_read=False, updated_at=now
+                    ))
+            except IntegrityError:
+                # Строку только что вставила параллельная транзакция — дописываем в нее
+                continue
+        increment(User, user_id, User.unread_notifications)
+        return
+
+
+def retract(user_id, kind, target_id):
+    """Отменяет одно событие непрочитанного уведомления (лайк сняли до прочтения)."""
+    key = (
+        Notification.user_id == user_id,
+        Notification.kind == kind,
+        Notification.target_id == target_id,
+        Notification.is_read.is_(False),
+    )
+    updated = db.session.execute(
+        update(Notification).where(*key, Notification.count > 1).values(count=Notification.count - 1)
+    ).rowcount
+    if updated:
+        return
+    deleted = Notification.query.filter(*key, Notification.count == 1).delete(synchronize_session=False)
+    if deleted:
+        increment(User, user_id, User.unread_notifications, -deleted)
+
+
+def mark_read(user_id, *criteria):
+    """Помечает прочитанными уведомления user_id, подходящие под criteria; возвращает их число."""
+    marked = Notification.query.filter(
+        Notification.user_id == user_id,
+        Notification.is_read.is_(False),
+        *criteria
+    ).update({Notification.is_read: True}, synchronize_session=False)
+    if marked:
+        increment(User, user_id, User.unread_notifications, -marked)
+    return marked
+
+
+def unread_count(user_id):
+    # Точечное чтение счетчика по первичному ключу
+    return db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+
+
+def notification_cursor(notification):
+    return encode_cursor([notification.updated_at.isoformat(), notification.id])
+
+
+def notifications_page(user_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Страница уведомлений, новые сверху; keyset по (updated_at, id) из ix_notification_user_updated."""
+    query = Notification.query.options(
+        joinedload(Notification.actor).load_only(User.username, User.avatar)
+    ).filter(Notification.user_id == user_id).order_by(
+        Notification.updated_at.desc(), Notification.id.desc()
+    )
+
+    if cursor:
+        try:
+            updated_at, notification_id = decode_cursor(cursor)
+            key = (datetime.fromisoformat(updated_at), int(notification_id))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(tuple_(Notification.updated_at, Notification.id) < key)
+
+    notifications = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_cursor = notification_cursor(notifications[-1])
+
+    return notifications, next_cursor
@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import Post
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    # Курсор непрозрачен для клиента: base64 от JSON-списка значений ключа
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list):
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def get_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    # Ограничиваем размер страницы жестким максимумом
+    try:
+        limit = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def post_cursor(post):
+    return encode_cursor([
+        bool(post.is_pinned),
+        post.created_at.isoformat(),
+        post.id
+    ])
+
+
+def paginate_posts(query, cursor=None, limit=DEFAULT_LIMIT):
+    """Keyset-пагинация ленты по (is_pinned, created_at, id) в порядке убывания.
+
+    Возвращает список постов страницы и курсор следующей страницы (или None).
+    """
+    query = query.order_by(Post.is_pinned.desc(), Post.created_at.desc(), Post.id.desc())
+
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            is_pinned, created_at, post_id = values
+            key = (bool(is_pinned), datetime.fromisoformat(created_at), int(post_id))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(tuple_(Post.is_pinned, Post.created_at, Post.id) < key)
+
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    posts = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = post_cursor(posts[-1])
+
+    return posts, next_cursor
@@ -0,0 +1,133 @@
+import json
+import logging
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+slow_query_logger = logging.getLogger('slow_sql')
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Приводит SQL к шаблону: литералы заменяются на ?, списки IN сворачиваются."""
+    statement = STRING_RE.sub('?', statement)
+    statement = NUMBER_RE.sub('?', statement)
+    statement = IN_LIST_RE.sub('(?, ...)', statement)
+    return SPACE_RE.sub(' ', statement).strip()
+
+
+class RouteStats:
+    """Накопленная статистика запросов к БД по маршрутам (в пределах процесса)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, queries, db_time, slowest):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time_ms': 0.0,
+                'slowest_ms': 0.0,
+                'slowest_sql': None,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries
+            stats['max_queries'] = max(stats['max_queries'], queries)
+            stats['db_time_ms'] += db_time * 1000
+            if slowest and slowest[0] * 1000 > stats['slowest_ms']:
+                stats['slowest_ms'] = slowest[0] * 1000
+                stats['slowest_sql'] = normalize_sql(slowest[1])
+
+    def snapshot(self):
+        with self._lock:
+            routes = [
+                {
+                    'route': route,
+                    'requests': stats['requests'],
+                    'queries': stats['queries'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                    'max_queries': stats['max_queries'],
+                    'db_time_ms': round(stats['db_time_ms'], 3),
+                    'avg_db_time_ms': round(stats['db_time_ms'] / stats['requests'], 3),
+                    'slowest_ms': round(stats['slowest_ms'], 3),
+                    'slowest_sql': stats['slowest_sql'],
+                }
+                for route, stats in self._routes.items()
+            ]
+        return sorted(routes, key=lambda r: r['db_time_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_stats = RouteStats()
+
+
+def init_query_stats(app, db):
+    """Считает запросы к БД и время в БД для каждого HTTP-запроса приложения.
+
+    SQL_DEBUG_HEADERS включает заголовки X-Query-Count и X-DB-Time (мс),
+    запросы дольше SLOW_QUERY_MS пишутся в лог slow_sql. Статистика
+    записывается при закрытии ответа, поэтому включает запросы, сделанные при
+    отдаче потокового тела; у потоковых ответов заголовков нет — к моменту
+    их отправки тело еще не прочитано из БД.
+    """
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        if not has_request_context():
+            return
+        stats = g.get('sql_stats')
+        if stats is None:
+            return
+        stats['queries'] += 1
+        stats['db_time'] += elapsed
+        if stats['slowest'] is None or elapsed > stats['slowest'][0]:
+            stats['slowest'] = (elapsed, statement)
+        if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+            slow_query_logger.warning(json.dumps({
+                'route': request.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'duration_ms': round(elapsed * 1000, 3),
+                'sql': normalize_sql(statement),
+            }, ensure_ascii=False))
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_query_stats():
+        g.sql_stats = {'queries': 0, 'db_time': 0.0, 'slowest': None}
+
+    @app.after_request
+    def finish_query_stats(response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        route = request.endpoint or '<unmatched>'
+        # stream_with_context отдает тело в том же g, так что его запросы
+        # попадают в stats уже после after_request
+        response.call_on_close(
+            lambda: route_stats.record(route, stats['queries'], stats['db_time'], stats['slowest'])
+        )
+        if app.config['SQL_DEBUG_HEADERS'] and not response.is_streamed:
+            response.headers['X-Query-Count'] = str(stats['queries'])
+            response.headers['X-DB-Time'] = f"{stats['db_time'] * 1000:.3f}"
+        return response
@@ -0,0 +1,176 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from flask_login import current_user
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BODY
+from database import after_commit
+from models import db, CacheVersion
+from serializer import response_format
+
+# Общая версия для данных пользователей (имя, аватар), которые встроены почти во все ответы
+USERS_SCOPE = 'users'
+
+
+class ResponseCache:
+    """Кэш готовых JSON-ответов процесса с вытеснением по LRU и ttl.
+
+    Инвалидация — по версиям областей данных ('posts', 'comments:<id>',
+    'friends:<id>', ...) из таблицы cache_version: версии входят в ключ кэша,
+    поэтому после bump() в любом процессе старые записи перестают находиться
+    во всех процессах сразу. ttl лишь ограничивает, сколько живет неиспользуемая запись.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+
+def load_versions(scopes):
+    """Текущие версии областей одним запросом по ключу; новая область — версия 0."""
+    found = dict(db.session.execute(
+        select(CacheVersion.scope, CacheVersion.version).where(CacheVersion.scope.in_(scopes))
+    ).all())
+    return tuple(found.get(scope, 0) for scope in scopes)
+
+
+def bump_versions(*scopes):
+    # Отдельная короткая транзакция на основной базе: данные запроса уже
+    # зафиксированы, а сессию запроса (и ее загруженные объекты) не трогаем
+    scopes = sorted(set(scopes))
+    for attempt in range(2):
+        try:
+            with db.engine.begin() as conn:
+                existing = set(conn.scalars(select(CacheVersion.scope).where(CacheVersion.scope.in_(scopes))))
+                if existing:
+                    conn.execute(update(CacheVersion).where(CacheVersion.scope.in_(existing)).values(
+                        version=CacheVersion.version + 1
+                    ))
+                missing = [scope for scope in scopes if scope not in existing]
+                if missing:
+                    conn.execute(insert(CacheVersion), [{'scope': scope, 'version': 1} for scope in missing])
+            return
+        except IntegrityError:
+            # Ту же область только что создал другой процесс — повторяем как UPDATE
+            if attempt:
+                raise
+
+
+def bump(*scopes):
+    """Сбрасывает закэшированные ответы областей во всех процессах; вызывается после commit."""
+    after_commit(bump_versions, *scopes)
+
+
+def cached_response(*scopes):
+    """Кэширует успешный ответ GET-маршрута и отвечает 304 на If-None-Match.
+
+    Потоковые ответы (stream_array) не буферизуются: их слабый ETag выводится
+    из ключа, и 304 отдается до вызова маршрута. Тело такого ответа копится
+    по мере отдачи и кэшируется, если уместилось в RESPONSE_CACHE_MAX_BODY.
+
+    Ключ — маршрут, аргументы запроса, формат ответа, зритель и версии областей. Области
+    задаются шаблонами, которые подставляются из аргументов маршрута и
+    viewer (id текущего пользователя): 'comments:{post_id}', 'friends:{viewer}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if g.get('after_commit'):
+                # Пакет /api/batch уже что-то записал, но версии еще не сброшены
+                return view(**kwargs)
+            viewer = current_user.id if current_user.is_authenticated else None
+            resolved = [scope.format(viewer=viewer, **kwargs) for scope in scopes] + [USERS_SCOPE]
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                response_format(),
+                viewer,
+                load_versions(resolved)
+            )
+
+            entry = response_cache.get(key)
+            if entry is None:
+                # Версии в ключе общие для всех процессов, поэтому такой ETag
+                # меняется вместе с данными и не требует тела ответа
+                key_etag = hashlib.sha1(repr(key).encode()).hexdigest()
+                if request.if_none_match.contains_weak(key_etag):
+                    return revalidated(current_app.response_class(status=304), key_etag, weak=True)
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                # Потоковый ответ не собираем в память до отдачи: он для длинных списков
+                if response.is_streamed:
+                    response.response = tee_body(response.response, key, key_etag, response.mimetype)
+                    return revalidated(response, key_etag, weak=True)
+                body = response.get_data()
+                entry = (hashlib.sha1(body).hexdigest(), False, body, response.mimetype)
+                response_cache.set(key, entry)
+
+            etag, weak, body, mimetype = entry
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(body, mimetype=mimetype)
+            return revalidated(response, etag, weak=weak)
+        return wrapper
+    return decorator
+
+
+def tee_body(chunks, key, etag, mimetype):
+    # Отдает куски как есть; недочитанный клиентом ответ в кэш не попадает
+    body = bytearray()
+    try:
+        for chunk in chunks:
+            if body is not None:
+                body += chunk
+                if len(body) > RESPONSE_CACHE_MAX_BODY:
+                    body = None
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    if body is not None:
+        response_cache.set(key, (etag, True, bytes(body), mimetype))
+
+
+def revalidated(response, etag, weak=False):
+    response.set_etag(etag, weak=weak)
+    response.vary.add('Accept')
+    # Клиент может хранить ответ, но обязан перепроверять его по ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
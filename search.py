@@ -0,0 +1,113 @@
+import re
+
+from sqlalchemy import Float, Integer, text
+
+from models import db
+from pagination import encode_cursor, decode_cursor, InvalidCursor, DEFAULT_LIMIT
+
+# Индексы FTS5 поверх таблиц (external content): сами тексты хранятся только
+# в исходных таблицах, индекс поддерживается триггерами на INSERT/UPDATE/DELETE.
+# Для каждой колонки задан вес в bm25.
+SEARCH_INDEXES = {
+    'users': ('user_fts', 'user', {'username': 10.0, 'bio': 1.0}),
+    'posts': ('post_fts', 'post', {'content': 1.0}),
+    'messages': ('message_fts', 'private_message', {'content': 1.0}),
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def index_ddl(fts, table, columns):
+    names = ', '.join(columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END',
+    ]
+
+
+def create_search_index():
+    """Создает недостающие индексы и триггеры; новый индекс сразу заполняется."""
+    if not search_available():
+        return
+    with db.engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for fts, table, columns in SEARCH_INDEXES.values():
+            for statement in index_ddl(fts, table, columns):
+                conn.execute(text(statement))
+            if fts not in existing:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def reindex():
+    """Полностью перестраивает индексы из исходных таблиц."""
+    create_search_index()
+    with db.engine.begin() as conn:
+        for fts, table, columns in SEARCH_INDEXES.values():
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('optimize')"))
+
+
+def match_query(q):
+    """Запрос пользователя -> выражение FTS5: все слова, каждое как префикс."""
+    tokens = TOKEN_RE.findall(q or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_page(kind, q, viewer_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Страница результатов поиска по релевантности (bm25, затем id).
+
+    Возвращает список id найденных строк и курсор следующей страницы.
+    Сообщения ищутся только в переписке viewer_id, сам viewer_id среди
+    пользователей не находится (как и в списке /users без поиска).
+    """
+    fts, table, columns = SEARCH_INDEXES[kind]
+    weights = ', '.join(str(weight) for weight in columns.values())
+    params = {'match': match_query(q), 'limit': limit + 1}
+
+    source = f'SELECT {fts}.rowid AS id, bm25({fts}, {weights}) AS score FROM {fts}'
+    if kind == 'messages':
+        source += (
+            f' JOIN private_message ON private_message.id = {fts}.rowid'
+            f' WHERE {fts} MATCH :match'
+            ' AND (private_message.sender_id = :viewer OR private_message.receiver_id = :viewer)'
+        )
+        params['viewer'] = viewer_id
+    elif kind == 'users':
+        source += f' WHERE {fts} MATCH :match AND {fts}.rowid != :viewer'
+        params['viewer'] = viewer_id
+    else:
+        source += f' WHERE {fts} MATCH :match'
+
+    where = ''
+    if cursor:
+        try:
+            score, last_id = decode_cursor(cursor)
+            params['score'], params['last_id'] = float(score), int(last_id)
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        where = ' WHERE score > :score OR (score = :score AND id > :last_id)'
+
+    statement = text(
+        f'SELECT id, score FROM ({source}){where} ORDER BY score, id LIMIT :limit'
+    ).columns(id=Integer, score=Float)
+    rows = db.session.execute(statement, params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].score, rows[-1].id])
+    return [row.id for row in rows], next_cursor
@@ -0,0 +1,354 @@
+import tempfile
+from datetime import date
+from operator import attrgetter
+
+import msgpack
+import orjson
+from flask import current_app, request, stream_with_context
+from sqlalchemy.orm import joinedload, load_only
+
+from images import image_url, image_variants, avatar_url
+from models import User, Post, Comment, Friendship, PrivateMessage
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack')
+
+# Потоковый ответ отдается кусками примерно такого размера
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Schema:
+    """Описание полей ответа: имя -> атрибут объекта или функция (obj, context).
+
+    Атрибут задается строкой, можно через точку ('user.username'); вложенный
+    объект — другой схемой через nested(). Геттеры собираются один раз при
+    объявлении схемы. Значения не форматируются: даты остаются datetime и
+    кодируются энкодером ответа.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self._getters = [(name, field_getter(spec)) for name, spec in fields.items()]
+        self._subsets = {}
+
+    def only(self, names):
+        """Схема из части полей (в порядке объявления); собирается один раз."""
+        key = tuple(name for name in self.fields if name in names)
+        schema = self._subsets.get(key)
+        if schema is None:
+            schema = self._subsets[key] = Schema(**{name: self.fields[name] for name in key})
+        return schema
+
+    def dump(self, obj, **context):
+        return self.dump_with(obj, context)
+
+    def dump_with(self, obj, context):
+        return {name: get(obj, context) for name, get in self._getters}
+
+    def dump_many(self, objects, **context):
+        for obj in objects:
+            yield self.dump_with(obj, context)
+
+
+def field_getter(spec):
+    if isinstance(spec, str):
+        get = attrgetter(spec)
+        return lambda obj, context: get(obj)
+    return spec
+
+
+def nested(schema, attribute):
+    get = attrgetter(attribute)
+
+    def dump_nested(obj, context):
+        value = get(obj)
+        return schema.dump_with(value, context) if value is not None else None
+    return dump_nested
+
+
+USER_BRIEF = Schema(id='id', username='username', avatar='avatar')
+
+AUTHOR = Schema(
+    id='id',
+    username='username',
+    avatar='avatar',
+    avatar_url=lambda user, context: avatar_url(user.avatar)
+)
+
+PROFILE = Schema(
+    id='id',
+    username='username',
+    email='email',
+    avatar='avatar',
+    bio='bio',
+    created_at='created_at',
+    posts_count='posts_count',
+    friends_count='friends_count',
+    followers_count='followers_count',
+    following_count='following_count'
+)
+
+USER_RESULT = Schema(
+    id='id',
+    username='username',
+    avatar='avatar',
+    avatar_url=lambda user, context: avatar_url(user.avatar),
+    bio='bio'
+)
+
+# Контекст: liked_ids — id постов, лайкнутых зрителем
+POST = Schema(
+    id='id',
+    content='content',
+    image_url=lambda post, context: image_url(post.image_url, 'feed'),
+    image=lambda post, context: image_variants(post.image_url),
+    created_at='created_at',
+    is_pinned='is_pinned',
+    author=nested(AUTHOR, 'author'),
+    likes_count='likes_count',
+    comments_count='comments_count',
+    is_liked=lambda post, context: post.id in context['liked_ids']
+)
+
+COMMENT = Schema(
+    id='id',
+    content='content',
+    created_at='created_at',
+    author=nested(USER_BRIEF, 'author')
+)
+
+# Контекст: viewer_id — текущий пользователь
+MESSAGE = Schema(
+    id='id',
+    content='content',
+    created_at='created_at',
+    is_read='is_read',
+    is_sender=lambda message, context: message.sender_id == context['viewer_id']
+)
+
+MESSAGE_RESULT = Schema(
+    **MESSAGE.fields,
+    user_id=lambda message, context: (
+        message.receiver_id if message.sender_id == context['viewer_id'] else message.sender_id
+    )
+)
+
+# Строки inbox_page: (диалог, собеседник, последнее сообщение)
+CONVERSATION = Schema(
+    user=lambda row, context: USER_BRIEF.dump_with(row[1], context),
+    last_message=lambda row, context: MESSAGE.dump_with(row[2], context),
+    unread_count=lambda row, context: row[0].unread_count_for(context['viewer_id'])
+)
+
+# Друг — сам пользователь на другой стороне принятой заявки
+FRIEND = Schema(**USER_BRIEF.fields, status=lambda user, context: 'accepted')
+
+FRIEND_REQUEST = Schema(
+    id='user.id',
+    username='user.username',
+    avatar='user.avatar',
+    request_id='id'
+)
+
+
+SUGGESTION = Schema(
+    user=nested(AUTHOR, 'suggested'),
+    mutual_friends='mutual_friends',
+    common_follows='common_follows',
+    score='score'
+)
+
+# Клиент строит текст сам: "{actor} и еще {count - 1} лайкнули ваш пост"
+NOTIFICATION = Schema(
+    id='id',
+    kind='kind',
+    target_id='target_id',
+    count='count',
+    is_read='is_read',
+    updated_at='updated_at',
+    actor=nested(USER_BRIEF, 'actor')
+)
+
+
+class InvalidFieldset(ValueError):
+    pass
+
+
+class Selection:
+    """Результат разбора ?fields= и ?include=: схема ответа и опции запроса."""
+
+    def __init__(self, schema, options):
+        self.schema = schema
+        self.options = options
+
+    def __contains__(self, name):
+        return name in self.schema.fields
+
+
+class Fieldset:
+    """Белый список полей списка для ?fields= и ?include=.
+
+    fields: поле схемы -> колонки, без которых его не заполнить;
+    include: группа -> (поля схемы, колонки, опции загрузки связей);
+    required: колонки, нужные обработчику всегда (ключ пагинации).
+    load(columns) строит опции, ограничивающие SELECT этими колонками.
+    Поле id отдается всегда. Если параметр не передан, берутся все поля
+    или все группы — ответ без параметров не меняется.
+    """
+
+    def __init__(self, schema, fields, include=None, required=(), load=None):
+        self.schema = schema
+        self.fields = {'id': [], **fields}
+        self.include = include or {}
+        self.required = tuple(required)
+        self.load = load or (lambda columns: [load_only(*columns)])
+
+    def select(self, args):
+        fields = parse_names(args, 'fields', self.fields)
+        groups = parse_names(args, 'include', self.include)
+        names = {'id'} | fields
+        columns = list(self.required)
+        for name in fields:
+            columns.extend(self.fields[name])
+        options = []
+        for group in groups:
+            group_fields, group_columns, group_options = self.include[group]
+            names.update(group_fields)
+            columns.extend(group_columns)
+            options.extend(group_options)
+        # Повторы колонок load_only не мешают, но SELECT от них не меняется
+        columns = list(dict.fromkeys(columns))
+        return Selection(self.schema.only(names), self.load(columns) + options)
+
+
+def parse_names(args, param, allowed):
+    if param not in args:
+        return set(allowed)
+    names = {name.strip() for name in args.get(param, '').split(',') if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise InvalidFieldset(
+            f"Unknown {param}: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}"
+        )
+    return names
+
+
+POST_FIELDS = Fieldset(
+    POST,
+    fields={
+        'content': [Post.content],
+        'image_url': [Post.image_url],
+        'image': [Post.image_url],
+        'created_at': [Post.created_at],
+        'is_pinned': [Post.is_pinned],
+        'is_liked': [],
+    },
+    include={
+        'author': (['author'], [Post.author_id], [joinedload(Post.author).load_only(User.username, User.avatar)]),
+        'counts': (['likes_count', 'comments_count'], [Post.likes_count, Post.comments_count], []),
+    },
+    required=[Post.id, Post.is_pinned, Post.created_at]
+)
+
+COMMENT_FIELDS = Fieldset(
+    COMMENT,
+    fields={'content': [Comment.content], 'created_at': [Comment.created_at]},
+    include={
+        'author': (['author'], [Comment.user_id], [joinedload(Comment.author).load_only(User.username, User.avatar)]),
+    },
+    required=[Comment.id]
+)
+
+MESSAGE_FIELDS = Fieldset(
+    MESSAGE,
+    fields={
+        'content': [PrivateMessage.content],
+        'created_at': [PrivateMessage.created_at],
+        'is_read': [PrivateMessage.is_read],
+        'is_sender': [PrivateMessage.sender_id],
+    },
+    required=[PrivateMessage.id]
+)
+
+USER_COLUMNS = {'username': [User.username], 'avatar': [User.avatar]}
+
+FRIEND_FIELDS = Fieldset(FRIEND, fields={**USER_COLUMNS, 'status': []})
+
+FRIEND_REQUEST_FIELDS = Fieldset(
+    FRIEND_REQUEST,
+    fields={**USER_COLUMNS, 'request_id': []},
+    required=[User.id],
+    load=lambda columns: [
+        load_only(Friendship.id, Friendship.user_id),
+        joinedload(Friendship.user).load_only(*columns),
+    ]
+)
+
+
+def encode_default(value):
+    # msgpack не знает дат; в JSON orjson пишет их в том же формате ISO 8601
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def response_format():
+    """Формат ответа по заголовку Accept: MessagePack только по явному запросу."""
+    best = request.accept_mimetypes.best_match((JSON,) + MSGPACK_TYPES, default=JSON)
+    return MSGPACK if best in MSGPACK_TYPES else JSON
+
+
+def encode(payload, fmt):
+    if fmt == MSGPACK:
+        return msgpack.packb(payload, default=encode_default)
+    return orjson.dumps(payload)
+
+
+def render(payload, status=200):
+    """Ответ с payload в формате, который запросил клиент (JSON или MessagePack)."""
+    fmt = response_format()
+    response = current_app.response_class(encode(payload, fmt), status=status, mimetype=fmt)
+    response.vary.add('Accept')
+    return response
+
+
+def stream_array(schema, objects, **context):
+    """Ответ-массив, который кодируется по мере чтения objects.
+
+    JSON отдается кусками без промежуточного списка. В MessagePack длина
+    массива стоит в заголовке перед элементами, поэтому они сначала пишутся
+    во временный файл, который уходит на диск после STREAM_CHUNK_SIZE.
+    """
+    fmt = response_format()
+    generate = generate_msgpack_array if fmt == MSGPACK else generate_json_array
+    items = schema.dump_many(objects, **context)
+    response = current_app.response_class(stream_with_context(generate(items)), mimetype=fmt)
+    response.vary.add('Accept')
+    return response
+
+
+def generate_json_array(items):
+    chunk = bytearray(b'[')
+    for index, item in enumerate(items):
+        if index:
+            chunk += b','
+        chunk += orjson.dumps(item)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b']'
+    yield bytes(chunk)
+
+
+def generate_msgpack_array(items):
+    packer = msgpack.Packer(default=encode_default)
+    with tempfile.SpooledTemporaryFile(max_size=STREAM_CHUNK_SIZE) as spool:
+        count = 0
+        for item in items:
+            spool.write(packer.pack(item))
+            count += 1
+        yield packer.pack_array_header(count)
+        spool.seek(0)
+        while chunk := spool.read(STREAM_CHUNK_SIZE):
+            yield chunk
@@ -0,0 +1,192 @@
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+from sqlalchemy import delete, func, insert, select
+
+from models import db, User, Follow, FriendEdge, Suggestion, SuggestionChange
+
+# Вес общего друга и общей подписки в оценке кандидата
+FRIEND_WEIGHT = 1.0
+FOLLOW_WEIGHT = 0.25
+
+# Ребра читаются из БД порциями этого размера
+EDGE_CHUNK_ROWS = 100000
+
+
+def load_graph(source, target, size):
+    """Ребра source -> target в виде разреженной матрицы смежности size x size из единиц."""
+    # Пользователи, появившиеся после подсчета size, попадут в следующий прогон
+    result = db.session.execute(
+        select(source, target).where(source < size, target < size).execution_options(yield_per=EDGE_CHUNK_ROWS)
+    )
+    sources, targets = [], []
+    for chunk in result.partitions():
+        pairs = np.array(chunk, dtype=np.int32).reshape(-1, 2)
+        sources.append(pairs[:, 0])
+        targets.append(pairs[:, 1])
+    sources = np.concatenate(sources) if sources else np.empty(0, dtype=np.int32)
+    targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.int32)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(sources), dtype=np.float32), (sources, targets)), shape=(size, size)
+    )
+    # Повторные ребра при построении сложились; связь есть или нет
+    matrix.data[:] = 1
+    return matrix
+
+
+def without_hubs(matrix, max_degree):
+    """Копия матрицы без строк, в которых больше max_degree связей."""
+    degree = np.diff(matrix.indptr)
+    keep = sparse.diags((degree <= max_degree).astype(np.float32))
+    pruned = (keep @ matrix).tocsr()
+    pruned.eliminate_zeros()
+    return pruned
+
+
+class Graph:
+    """Граф друзей и подписок в памяти: по две матрицы CSR на оба направления.
+
+    Пути через пользователей с числом друзей или подписчиков больше
+    max_degree в оценках не учитываются: общая подписка на популярный
+    аккаунт почти ничего не говорит о знакомстве, а строки произведения
+    через такие узлы становятся плотными.
+    """
+
+    def __init__(self, size, max_degree):
+        self.size = size
+        self.friends = load_graph(FriendEdge.user_id, FriendEdge.friend_id, size)
+        self.follows = load_graph(Follow.follower_id, Follow.followed_id, size)
+        # Строка — пользователь, столбцы — его подписчики
+        self.followers = self.follows.T.tocsr()
+        self.friends_via = without_hubs(self.friends, max_degree)
+        self.followers_via = without_hubs(self.followers, max_degree)
+
+    def neighbours(self, user_ids):
+        """Пользователи, чьи подсказки меняются вместе со связями user_ids.
+
+        Число общих друзей меняется у друзей изменившегося пользователя, число
+        общих подписок — у подписчиков того, на кого подписались или отписались.
+        Через популярных пользователей пути не считаются, их соседи не затронуты.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int32)
+        return np.union1d(self.friends_via[user_ids].indices, self.followers_via[user_ids].indices)
+
+    def score_block(self, user_ids):
+        """Оценки кандидатов для строк user_ids: (оценки, общие друзья, общие подписки).
+
+        Общие друзья — строки A·A, общие подписки — F·Fᵀ. Сам пользователь,
+        его друзья и те, на кого он уже подписан, из оценок исключаются.
+        """
+        rows = len(user_ids)
+        friends = self.friends[user_ids]
+        follows = self.follows[user_ids]
+        mutual = (friends @ self.friends_via).tocsr()
+        common = (follows @ self.followers_via).tocsr()
+        scores = (mutual * FRIEND_WEIGHT + common * FOLLOW_WEIGHT).tocsr()
+
+        own = sparse.csr_matrix(
+            (np.ones(rows, dtype=np.float32), (np.arange(rows), user_ids)), shape=(rows, self.size)
+        )
+        known = (friends + follows + own).astype(bool)
+        scores = (scores - scores.multiply(known)).tocsr()
+        scores.eliminate_zeros()
+        mutual.sort_indices()
+        common.sort_indices()
+        return scores, mutual, common
+
+
+def row_values(matrix, row, columns):
+    """Значения строки CSR в столбцах columns (0, если элемента нет)."""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    if start == end:
+        return np.zeros(len(columns))
+    indices = matrix.indices[start:end]
+    positions = np.searchsorted(indices, columns).clip(max=end - start - 1)
+    return np.where(indices[positions] == columns, matrix.data[start:end][positions], 0)
+
+
+def top_candidates(scores, row, k):
+    """k лучших столбцов строки: оценка по убыванию, при равенстве — меньший id."""
+    start, end = scores.indptr[row], scores.indptr[row + 1]
+    columns = scores.indices[start:end]
+    values = scores.data[start:end]
+    if len(values) > k:
+        best = np.argpartition(-values, k - 1)[:k]
+        columns, values = columns[best], values[best]
+    order = np.lexsort((columns, -values))
+    return columns[order], values[order]
+
+
+def write_block(graph, user_ids, k, computed_at):
+    scores, mutual, common = graph.score_block(user_ids)
+    rows = []
+    for row, user_id in enumerate(user_ids.tolist()):
+        columns, values = top_candidates(scores, row, k)
+        friends = row_values(mutual, row, columns)
+        follows = row_values(common, row, columns)
+        for rank, (suggested_id, score, mutual_count, common_count) in enumerate(
+            zip(columns.tolist(), values.tolist(), friends.tolist(), follows.tolist())
+        ):
+            rows.append({
+                'user_id': user_id,
+                'rank': rank,
+                'suggested_id': suggested_id,
+                'score': score,
+                'mutual_friends': int(mutual_count),
+                'common_follows': int(common_count),
+                'computed_at': computed_at,
+            })
+
+    db.session.execute(delete(Suggestion).where(Suggestion.user_id.in_(user_ids.tolist())))
+    if rows:
+        db.session.execute(insert(Suggestion), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def compute_suggestions(full=False):
+    """Пересчитывает таблицу suggestion и возвращает статистику прогона.
+
+    Полный прогон считает всех пользователей, инкрементальный — только тех,
+    у кого менялись связи (suggestion_change), и их соседей по графу. Граф
+    держится в памяти целиком (несколько байт на ребро), а произведения
+    матриц считаются блоками по SUGGESTIONS_BLOCK_ROWS строк; вместе с
+    SUGGESTIONS_MAX_DEGREE это ограничивает память на промежуточные оценки.
+    """
+    started = time.monotonic()
+    k = current_app.config['SUGGESTIONS_TOP_K']
+    block_rows = current_app.config['SUGGESTIONS_BLOCK_ROWS']
+    max_degree = current_app.config['SUGGESTIONS_MAX_DEGREE']
+
+    # Изменения, пришедшие во время расчета, останутся до следующего прогона
+    last_change = db.session.scalar(select(func.max(SuggestionChange.id))) or 0
+    size = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    graph = Graph(size, max_degree)
+
+    if full:
+        user_ids = np.array(db.session.scalars(select(User.id).order_by(User.id)).all(), dtype=np.int32)
+    else:
+        changed = db.session.scalars(
+            select(SuggestionChange.user_id).where(SuggestionChange.id <= last_change).distinct()
+        ).all()
+        changed = np.array([user_id for user_id in changed if user_id < size], dtype=np.int32)
+        user_ids = np.union1d(changed, graph.neighbours(changed)) if len(changed) else changed
+
+    computed_at = datetime.utcnow()
+    written = 0
+    for start in range(0, len(user_ids), block_rows):
+        written += write_block(graph, user_ids[start:start + block_rows], k, computed_at)
+
+    db.session.execute(delete(SuggestionChange).where(SuggestionChange.id <= last_change))
+    db.session.commit()
+    return {
+        'users': len(user_ids),
+        'suggestions': written,
+        'friend_edges': graph.friends.nnz,
+        'follow_edges': graph.follows.nnz,
+        'seconds': round(time.monotonic() - started, 2),
+    }
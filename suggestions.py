@@ -0,0 +1,24 @@
+from sqlalchemy import exists
+from sqlalchemy.orm import joinedload
+
+from models import db, Follow, FriendEdge, Suggestion, SuggestionChange
+
+# Подсказки считаются офлайн (suggestion_job.py), здесь только чтение готовой
+# таблицы и учет изменений графа для инкрементального пересчета.
+
+
+def mark_graph_changed(*user_ids):
+    """Отмечает пользователей, чьи связи изменились, в текущей транзакции."""
+    db.session.add_all(SuggestionChange(user_id=user_id) for user_id in user_ids)
+
+
+def suggestions_for(user_id, limit):
+    """Подсказки пользователя по порядку; уже добавленные после расчета пропускаются.
+
+    Проверки друзей и подписок — точечные поиски по ключам friend_edge и follow.
+    """
+    return Suggestion.query.options(joinedload(Suggestion.suggested)).filter(
+        Suggestion.user_id == user_id,
+        ~exists().where(FriendEdge.user_id == user_id, FriendEdge.friend_id == Suggestion.suggested_id),
+        ~exists().where(Follow.follower_id == user_id, Follow.followed_id == Suggestion.suggested_id)
+    ).order_by(Suggestion.rank).limit(limit).all()
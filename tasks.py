@@ -0,0 +1,45 @@
+import os
+
+from flask import current_app
+
+from counters import repair_counters
+from images import generate_variants, media_folder
+from jobs import task
+from models import db, Post
+from timeline import fan_out_post
+
+# Задачи очереди (jobs.py). Аргументы — JSON-значения; изменения в БД
+# фиксирует воркер вместе с удалением задачи, поэтому после ошибки задача
+# повторяется с чистой транзакции.
+
+
+@task('generate_variants', timeout=120)
+def generate_variants_task(digest):
+    # Уже построенные варианты пропускаются
+    generate_variants(media_folder(), digest)
+
+
+@task('fan_out_post')
+def fan_out_post_task(post_id):
+    post = db.session.get(Post, post_id)
+    if post is not None:
+        fan_out_post(post)
+
+
+@task('delete_upload')
+def delete_upload_task(filename):
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@task('repair_counters', timeout=3600)
+def repair_counters_task():
+    repair_counters()
+
+
+@task('compute_suggestions', timeout=3600)
+def compute_suggestions_task():
+    # NumPy и SciPy загружаются только в воркере, который взял эту задачу
+    from suggestion_job import compute_suggestions
+    compute_suggestions()
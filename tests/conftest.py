@@ -0,0 +1,85 @@
+import os
+import tempfile
+
+import pytest
+
+# Тесты идут на отдельной временной базе: адрес нужен до импорта app.
+# Если app уже импортирован (check_query_plans.py в том же прогоне), база
+# у него своя временная, а схема все равно пересоздается перед каждым тестом
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(TMP_DIR, 'tests.db'))
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from app import app as flask_app
+from models import db, User
+from query_stats import route_stats
+from response_cache import response_cache
+from search import SEARCH_INDEXES, create_search_index
+from tokens import revocations
+from user_cache import user_cache
+
+PASSWORD = 'secret'
+
+
+def reset_database():
+    db.session.remove()
+    db.drop_all()
+    with db.engine.begin() as conn:
+        # Индексы FTS5 не входят в metadata, drop_all их не удаляет
+        for fts, table, columns in SEARCH_INDEXES.values():
+            conn.execute(text(f'DROP TABLE IF EXISTS {fts}'))
+    db.create_all()
+    create_search_index()
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(
+        TESTING=True,
+        UPLOAD_FOLDER=TMP_DIR,
+        MEDIA_FOLDER=os.path.join(TMP_DIR, 'media'),
+        JOB_QUEUE_ENABLED=False,
+    )
+    with flask_app.app_context():
+        reset_database()
+    # Кэши процесса не должны переносить состояние между тестами
+    response_cache.clear()
+    user_cache.clear()
+    revocations.clear()
+    route_stats.reset()
+    yield flask_app
+    with flask_app.app_context():
+        reset_database()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Создает пользователя с паролем PASSWORD и возвращает его id."""
+    def make(username, **fields):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', **fields)
+            # Дешевый хеш: стойкость в тестах не нужна, а scrypt заметно их замедляет
+            user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def login(app):
+    """Тестовый клиент с сессией Flask-Login пользователя user_id."""
+    def make(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return make
@@ -0,0 +1,91 @@
+from models import db, Comment, Post
+
+
+def make_post(app, author_id, content='post'):
+    with app.app_context():
+        post = Post(content=content, author_id=author_id)
+        db.session.add(post)
+        db.session.commit()
+        return post.id
+
+
+def run(client, *requests):
+    return client.post('/api/batch', json={'requests': list(requests)})
+
+
+def test_reads_run_in_order(app, make_user, login):
+    user_id = make_user('alice')
+    post_id = make_post(app, user_id)
+    client = login(user_id)
+
+    response = run(client, {'path': '/api/profile'}, {'path': f'/api/posts/{post_id}/comments'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['committed'] is True
+    assert [item['status'] for item in data['responses']] == [200, 200]
+    assert data['responses'][0]['body']['id'] == user_id
+    assert data['responses'][1]['body'] == []
+
+
+def test_writes_commit_together(app, make_user, login):
+    user_id = make_user('alice')
+    post_id = make_post(app, user_id)
+    client = login(user_id)
+
+    response = run(
+        client,
+        {'method': 'POST', 'path': f'/api/posts/{post_id}/comments', 'body': {'content': 'first'}},
+        {'method': 'POST', 'path': f'/api/posts/{post_id}/like'},
+        {'path': f'/api/posts/{post_id}/comments'},
+    )
+    data = response.get_json()
+    assert data['committed'] is True
+    assert [item['status'] for item in data['responses']] == [201, 200, 200]
+    # Чтение внутри пакета видит еще не зафиксированные записи пакета
+    assert [c['content'] for c in data['responses'][2]['body']] == ['first']
+
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        assert (post.comments_count, post.likes_count) == (1, 1)
+
+
+def test_failed_write_rolls_back_the_batch(app, make_user, login):
+    user_id = make_user('alice')
+    post_id = make_post(app, user_id)
+    client = login(user_id)
+
+    response = run(
+        client,
+        {'method': 'POST', 'path': f'/api/posts/{post_id}/comments', 'body': {'content': 'lost'}},
+        {'method': 'POST', 'path': f'/api/friends/{user_id}/add'},
+        {'path': '/api/profile'},
+    )
+    data = response.get_json()
+    assert data['committed'] is False
+    assert [item['status'] for item in data['responses']] == [201, 400, 424]
+
+    with app.app_context():
+        assert Comment.query.count() == 0
+        assert db.session.get(Post, post_id).comments_count == 0
+
+
+def test_invalid_batches_are_rejected(app, make_user, login):
+    client = login(make_user('alice'))
+
+    assert client.post('/api/batch', json=[]).status_code == 400
+    assert run(client).status_code == 400
+    assert run(client, {'method': 'GET'}).status_code == 400
+    assert run(client, {'method': 'POST', 'path': '/api/posts', 'body': []}).status_code == 400
+
+    app.config['API_BATCH_MAX_SIZE'], limit = 2, app.config['API_BATCH_MAX_SIZE']
+    try:
+        assert run(client, *[{'path': '/api/profile'}] * 3).status_code == 413
+    finally:
+        app.config['API_BATCH_MAX_SIZE'] = limit
+
+
+def test_batch_and_streams_cannot_be_nested(app, make_user, login):
+    client = login(make_user('alice'))
+
+    response = run(client, {'path': '/api/events/stream'}, {'method': 'POST', 'path': '/api/batch'})
+    assert [item['status'] for item in response.get_json()['responses']] == [400, 400]
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import Worker, enqueue, task
+from models import db, Job, DeadJob
+
+calls = []
+
+
+@task('test_record')
+def record_task(value):
+    calls.append(value)
+
+
+@task('test_broken')
+def broken_task():
+    raise RuntimeError('broken')
+
+
+@pytest.fixture
+def worker(app):
+    calls.clear()
+    with app.app_context():
+        yield Worker(app)
+
+
+def add_job(name, *args, max_attempts=3):
+    job = enqueue(name, *args, max_attempts=max_attempts)
+    db.session.commit()
+    return job.id
+
+
+def test_done_job_is_deleted(worker):
+    add_job('test_record', 42)
+
+    assert worker.run_once() is True
+    assert calls == [42]
+    assert Job.query.count() == 0
+    assert worker.run_once() is False
+
+
+def test_failed_job_is_retried_later(worker):
+    job_id = add_job('test_broken')
+
+    worker.run_once()
+    job = db.session.get(Job, job_id)
+    assert job.attempts == 1
+    assert job.locked_by is None
+    assert job.run_at > datetime.utcnow()
+    assert 'RuntimeError: broken' in job.last_error
+    # До run_at задача не берется повторно
+    assert worker.run_once() is False
+
+
+def test_job_is_buried_after_max_attempts(worker):
+    add_job('test_broken', max_attempts=1)
+
+    worker.run_once()
+    assert Job.query.count() == 0
+    dead = DeadJob.query.one()
+    assert (dead.name, dead.attempts) == ('test_broken', 1)
+    assert 'RuntimeError: broken' in dead.error
+
+
+def test_expired_lease_of_last_attempt_buries_the_job(worker):
+    job_id = add_job('test_record', 1, max_attempts=1)
+    # Воркер взял последнюю попытку и пропал, аренда истекла
+    db.session.get(Job, job_id).attempts = 1
+    db.session.commit()
+
+    worker.run_once()
+    assert calls == []
+    assert DeadJob.query.one().error == 'Visibility timeout expired'
+
+
+def test_lost_lease_leaves_the_job_to_its_new_owner(worker):
+    job_id = add_job('test_broken')
+    job = worker.claim()
+    assert job.locked_by == worker.name
+
+    # Аренда истекла, и задачу взял другой воркер
+    run_at = datetime.utcnow() + timedelta(minutes=5)
+    db.session.query(Job).filter_by(id=job_id).update({Job.locked_by: 'other', Job.run_at: run_at})
+    db.session.commit()
+
+    worker.fail(job_id, 1, 3, 'late failure')
+    job = db.session.get(Job, job_id)
+    db.session.refresh(job)
+    assert (job.locked_by, job.run_at, job.last_error) == ('other', run_at, None)
+
+    worker.bury(job_id, 'late failure')
+    assert db.session.get(Job, job_id) is not None
+    assert DeadJob.query.count() == 0
@@ -0,0 +1,125 @@
+import pytest
+
+from models import db, Notification, Post, User
+from notifications import notify, retract, mark_read, unread_count
+
+
+@pytest.fixture
+def users(make_user):
+    return [make_user(name) for name in ('alice', 'bob', 'carol')]
+
+
+@pytest.fixture
+def context(app):
+    # Для прямых вызовов notifications.py; запросы клиента идут без него,
+    # иначе они делили бы с тестом g и сессию
+    with app.app_context():
+        yield
+
+
+def only_notification(user_id):
+    return Notification.query.filter_by(user_id=user_id).one()
+
+
+def test_events_about_one_target_are_coalesced(users, context):
+    alice, bob, carol = users
+
+    notify(alice, 'like', 7, bob)
+    notify(alice, 'like', 7, carol)
+    db.session.commit()
+
+    notification = only_notification(alice)
+    assert (notification.count, notification.actor_id, notification.is_read) == (2, carol, False)
+    assert unread_count(alice) == 1
+
+
+def test_own_actions_are_not_notified(users, context):
+    alice = users[0]
+
+    notify(alice, 'like', 7, alice)
+    notify(None, 'like', 7, alice)
+    db.session.commit()
+
+    assert Notification.query.count() == 0
+    assert unread_count(alice) == 0
+
+
+def test_read_notification_is_reopened_by_a_new_event(users, context):
+    alice, bob, carol = users
+    notify(alice, 'comment', 7, bob)
+    notify(alice, 'comment', 7, bob)
+    db.session.commit()
+
+    assert mark_read(alice) == 1
+    db.session.commit()
+    assert unread_count(alice) == 0
+
+    notify(alice, 'comment', 7, carol)
+    db.session.commit()
+    notification = only_notification(alice)
+    assert (notification.count, notification.is_read) == (1, False)
+    assert unread_count(alice) == 1
+
+
+def test_retract_undoes_one_event(users, context):
+    alice, bob, carol = users
+    notify(alice, 'like', 7, bob)
+    notify(alice, 'like', 7, carol)
+    db.session.commit()
+
+    retract(alice, 'like', 7)
+    db.session.commit()
+    assert only_notification(alice).count == 1
+    assert unread_count(alice) == 1
+
+    retract(alice, 'like', 7)
+    db.session.commit()
+    assert Notification.query.count() == 0
+    assert unread_count(alice) == 0
+
+
+def test_likes_and_reads_through_the_api(app, users, login):
+    alice, bob, carol = users
+    with app.app_context():
+        post = Post(content='post', author_id=alice)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+
+    for user_id in (bob, carol):
+        assert login(user_id).post(f'/api/posts/{post_id}/like').status_code == 200
+
+    client = login(alice)
+    assert client.get('/api/notifications/unread_count').get_json() == {'unread_count': 1}
+    [notification] = client.get('/api/notifications').get_json()['notifications']
+    assert (notification['kind'], notification['target_id'], notification['count']) == ('like', post_id, 2)
+
+    # Снятый до прочтения лайк уменьшает уведомление
+    assert login(carol).post(f'/api/posts/{post_id}/like').status_code == 200
+    [notification] = client.get('/api/notifications').get_json()['notifications']
+    assert notification['count'] == 1
+
+    response = client.post('/api/notifications/read', json={'ids': [notification['id']]})
+    assert response.get_json() == {'marked': 1, 'unread_count': 0}
+    with app.app_context():
+        assert db.session.get(User, alice).unread_notifications == 0
+
+
+def test_chat_notification_is_cleared_once_caught_up(app, users, login):
+    alice, bob, carol = users
+    sender = login(bob)
+    for i in range(3):
+        assert sender.post(f'/api/messages/{alice}', json={'content': f'm{i}'}).status_code == 201
+
+    client = login(alice)
+    page = client.get(f'/api/messages/{bob}?after_id=0&limit=2').get_json()
+    assert page['has_more'] is True
+    with app.app_context():
+        assert only_notification(alice).is_read is False
+
+    last_id = page['messages'][-1]['id']
+    page = client.get(f'/api/messages/{bob}?after_id={last_id}&limit=2').get_json()
+    assert page['has_more'] is False
+    with app.app_context():
+        assert only_notification(alice).is_read is True
+        assert unread_count(alice) == 0
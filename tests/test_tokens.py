@@ -0,0 +1,80 @@
+from conftest import PASSWORD
+from models import db, User
+from tokens import ACCESS, revocations, verify_token
+
+
+def login_tokens(client, username):
+    response = client.post('/api/auth/login', json={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_access_token_authenticates_api_requests(client, make_user):
+    user_id = make_user('alice')
+    tokens = login_tokens(client, 'alice')
+
+    response = client.get('/api/profile', headers=bearer(tokens['access_token']))
+    assert response.status_code == 200
+    assert response.get_json()['id'] == user_id
+
+    assert client.get('/api/profile').status_code == 401
+    assert client.get('/api/profile', headers=bearer('garbage')).status_code == 401
+
+
+def test_refresh_token_is_single_use(client, make_user):
+    make_user('alice')
+    tokens = login_tokens(client, 'alice')
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 200
+    fresh = response.get_json()
+    assert fresh['access_token'] != tokens['access_token']
+    assert client.get('/api/profile', headers=bearer(fresh['access_token'])).status_code == 200
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 401
+
+
+def test_access_token_cannot_refresh(client, make_user):
+    make_user('alice')
+    tokens = login_tokens(client, 'alice')
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': tokens['access_token']})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_tokens_across_workers(app, client, make_user):
+    make_user('alice')
+    tokens = login_tokens(client, 'alice')
+
+    response = client.post(
+        '/api/auth/logout', headers=bearer(tokens['access_token']),
+        json={'refresh_token': tokens['refresh_token']}
+    )
+    assert response.status_code == 200
+    assert client.get('/api/profile', headers=bearer(tokens['access_token'])).status_code == 401
+
+    # Другой воркер не видел отзыва в памяти и подтягивает его из revoked_token
+    revocations.clear()
+    assert client.get('/api/profile', headers=bearer(tokens['access_token'])).status_code == 401
+    response = client.post('/api/auth/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 401
+
+
+def test_admin_rights_are_not_baked_into_the_token(app, client, make_user):
+    user_id = make_user('alice', is_admin=True)
+    tokens = login_tokens(client, 'alice')
+    with app.test_request_context():
+        assert 'is_admin' not in verify_token(tokens['access_token'], ACCESS)['usr']
+
+    headers = bearer(tokens['access_token'])
+    assert client.get('/api/admin/query_stats', headers=headers).status_code == 200
+
+    with app.app_context():
+        db.session.get(User, user_id).is_admin = False
+        db.session.commit()
+    assert client.get('/api/admin/query_stats', headers=headers).status_code == 403
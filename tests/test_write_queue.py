@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Like, Post
+from write_queue import WriteQueue
+from writes import write_like_toggle, write_comment
+
+
+@pytest.fixture
+def write_queue(app):
+    # Большая задержка: группу закрывает только max_batch, и состав группы предсказуем
+    queue = WriteQueue(app, max_batch=3, max_delay=5)
+    groups = []
+    commit_group = queue._commit_group
+
+    def record_group(group):
+        groups.append(len(group))
+        commit_group(group)
+
+    queue._commit_group = record_group
+    queue.groups = groups
+    yield queue
+    queue.close(timeout=5)
+
+
+@pytest.fixture
+def post_id(app, make_user):
+    with app.app_context():
+        post = Post(content='post', author_id=make_user('alice'))
+        db.session.add(post)
+        db.session.commit()
+        return post.id
+
+
+def test_group_is_committed_once_in_order(app, make_user, write_queue, post_id):
+    bob = make_user('bob')
+
+    futures = [
+        write_queue.submit(write_like_toggle, bob, post_id),
+        write_queue.submit(write_like_toggle, bob, post_id),
+        write_queue.submit(write_comment, bob, post_id, 'hi'),
+    ]
+    results = [future.result(timeout=5) for future in futures]
+
+    assert write_queue.groups == [3]
+    # Вторая операция видит лайк первой, хотя commit у них общий
+    assert results[:2] == [True, False]
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        assert (post.likes_count, post.comments_count) == (0, 1)
+        assert Like.query.count() == 0
+
+
+def test_failed_operation_does_not_cancel_the_group(app, make_user, write_queue, post_id):
+    bob = make_user('bob')
+
+    def broken(user_id):
+        db.session.add(Post(content=None, author_id=user_id))
+        db.session.flush()
+
+    futures = [
+        write_queue.submit(write_like_toggle, bob, post_id),
+        write_queue.submit(broken, bob),
+        write_queue.submit(write_comment, bob, post_id, 'hi'),
+    ]
+
+    assert futures[0].result(timeout=5) is True
+    with pytest.raises(IntegrityError):
+        futures[1].result(timeout=5)
+    assert isinstance(futures[2].result(timeout=5), int)
+    # Группа упала целиком и была повторена по одной операции
+    assert write_queue.groups == [3]
+
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        assert (post.likes_count, post.comments_count) == (1, 1)
+        assert Post.query.count() == 1
+
+
+def test_closed_queue_rejects_writes(write_queue, post_id):
+    write_queue.close(timeout=5)
+    with pytest.raises(RuntimeError):
+        write_queue.submit(write_like_toggle, 1, post_id)
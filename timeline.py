@@ -0,0 +1,141 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, literal, select, union, tuple_
+
+from friends import friend_ids_query
+from models import db, User, Post, Follow, TimelineEntry
+from pagination import encode_cursor, decode_cursor, InvalidCursor, DEFAULT_LIMIT
+
+# Сколько последних постов автора попадает в ленту при новой подписке или пересборке
+BACKFILL_POSTS = 50
+
+
+def fanout_limit():
+    # Авторы с таким числом подписчиков не рассылаются при записи, а подмешиваются при чтении
+    return current_app.config['TIMELINE_FANOUT_LIMIT']
+
+
+def audience_query(author_id):
+    """id пользователей, в чью ленту попадают посты автора: сам автор, подписчики и друзья."""
+    return union(
+        select(literal(author_id)),
+        select(Follow.follower_id).where(Follow.followed_id == author_id),
+        friend_ids_query(author_id)
+    )
+
+
+def sources_query(user_id):
+    """id авторов, чьи посты должны быть в ленте пользователя."""
+    return union(
+        select(literal(user_id)),
+        select(Follow.followed_id).where(Follow.follower_id == user_id),
+        friend_ids_query(user_id)
+    )
+
+
+def is_connected(user_id, author_id):
+    sources = sources_query(user_id).subquery()
+    return db.session.query(sources.c[0]).filter(sources.c[0] == author_id).first() is not None
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам аудитории автора в той же транзакции."""
+    author = db.session.get(User, post.author_id)
+    if author.followers_count >= fanout_limit():
+        return
+
+    db.session.flush()
+    audience = audience_query(post.author_id).subquery()
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'],
+        select(
+            audience.c[0],
+            literal(post.id),
+            literal(post.author_id),
+            literal(post.created_at)
+        )
+    ))
+
+
+def refresh_edge(user_id, author_id):
+    """Синхронизирует ленту user_id с автором после подписки, отписки или изменения дружбы."""
+    TimelineEntry.query.filter_by(user_id=user_id, author_id=author_id).delete(synchronize_session=False)
+
+    author = db.session.get(User, author_id)
+    if author is None or author.followers_count >= fanout_limit():
+        return
+    if not is_connected(user_id, author_id):
+        return
+
+    recent = select(
+        literal(user_id), Post.id, Post.author_id, Post.created_at
+    ).where(Post.author_id == author_id).order_by(Post.created_at.desc()).limit(BACKFILL_POSTS)
+    db.session.execute(insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'], recent
+    ))
+
+
+def rebuild_timeline(user_id):
+    """Пересобирает ленту пользователя с нуля из его подписок и друзей."""
+    TimelineEntry.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+    sources = sources_query(user_id).subquery()
+    authors = db.session.query(User.id).filter(
+        User.id.in_(select(sources.c[0])),
+        User.followers_count < fanout_limit()
+    ).all()
+    for author_id, in authors:
+        recent = select(
+            literal(user_id), Post.id, Post.author_id, Post.created_at
+        ).where(Post.author_id == author_id).order_by(Post.created_at.desc()).limit(BACKFILL_POSTS)
+        db.session.execute(insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'created_at'], recent
+        ))
+    db.session.commit()
+    return len(authors)
+
+
+def timeline_page(user_id, cursor=None, limit=DEFAULT_LIMIT):
+    """Страница ленты подписок: материализованные записи + посты популярных авторов.
+
+    Возвращает список id постов (новые сверху) и курсор следующей страницы.
+    """
+    key = None
+    if cursor:
+        try:
+            created_at, post_id = decode_cursor(cursor)
+            key = (datetime.fromisoformat(created_at), int(post_id))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+
+    entries = db.session.query(TimelineEntry.created_at, TimelineEntry.post_id).filter(
+        TimelineEntry.user_id == user_id
+    )
+    if key:
+        entries = entries.filter(tuple_(TimelineEntry.created_at, TimelineEntry.post_id) < key)
+    rows = entries.order_by(
+        TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()
+    ).limit(limit + 1).all()
+
+    # Популярные авторы не рассылаются при записи — читаем их посты напрямую,
+    # одним запросом на всех таких авторов
+    sources = sources_query(user_id).subquery()
+    celebrities = select(User.id).where(
+        User.id.in_(select(sources.c[0])),
+        User.followers_count >= fanout_limit()
+    )
+    posts = db.session.query(Post.created_at, Post.id).filter(Post.author_id.in_(celebrities))
+    if key:
+        posts = posts.filter(tuple_(Post.created_at, Post.id) < key)
+    rows.extend(posts.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all())
+
+    # Пост мог попасть и в материализованную ленту, пока автор был непопулярен
+    merged = sorted({tuple(row) for row in rows}, reverse=True)
+    next_cursor = None
+    if len(merged) > limit:
+        merged = merged[:limit]
+        created_at, post_id = merged[-1]
+        next_cursor = encode_cursor([created_at.isoformat(), post_id])
+
+    return [post_id for created_at, post_id in merged], next_cursor
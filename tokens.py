@@ -0,0 +1,153 @@
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from config import TOKEN_REVOCATION_SYNC
+from models import db, RevokedToken
+from user_cache import attach_user, user_cache
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+# Поля пользователя внутри access-токена: по ним current_user собирается без
+# обращения к БД. Остальные поля догружаются лениво, если маршрут их читает.
+# Права (is_admin) в токен не попадают: токен живет до API_ACCESS_TOKEN_TTL,
+# а снятые права должны действовать сразу
+TOKEN_USER_FIELDS = ('username', 'avatar')
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class RevocationList:
+    """Отозванные токены API (jti -> срок действия токена).
+
+    Проверка идет по памяти процесса. Каждый отзыв записывается в таблицу
+    revoked_token, и раз в sync_interval секунд список дополняется из нее,
+    поэтому токен, отозванный на другом воркере, перестает приниматься здесь
+    не позже чем через sync_interval секунд.
+    """
+
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._items = {}
+        self._synced_at = None
+
+    def is_revoked(self, jti):
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        with self._lock:
+            return jti in self._items
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._items[jti] = expires_at
+
+    def sync(self):
+        now = datetime.utcnow()
+        rows = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.expires_at > now
+        ).all()
+        with self._lock:
+            # Локальные записи сохраняем: реплика могла еще не получить их
+            items = {jti: expires_at for jti, expires_at in self._items.items() if expires_at > now}
+            items.update(rows)
+            self._items = items
+            self._synced_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._synced_at = None
+
+
+revocations = RevocationList(TOKEN_REVOCATION_SYNC)
+
+
+def serializer(kind):
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=f'api-{kind}-token')
+
+
+def token_ttl(kind):
+    return current_app.config['API_ACCESS_TOKEN_TTL' if kind == ACCESS else 'API_REFRESH_TOKEN_TTL']
+
+
+def issue_tokens(user):
+    """Новая пара токенов для ответа на вход или обновление."""
+    access_claims = {
+        'sub': user.id,
+        'jti': secrets.token_hex(16),
+        'usr': {name: getattr(user, name) for name in TOKEN_USER_FIELDS},
+    }
+    refresh_claims = {'sub': user.id, 'jti': secrets.token_hex(16)}
+    return {
+        'access_token': serializer(ACCESS).dumps(access_claims),
+        'refresh_token': serializer(REFRESH).dumps(refresh_claims),
+        'token_type': 'Bearer',
+        'expires_in': token_ttl(ACCESS),
+    }
+
+
+def verify_token(token, kind):
+    """Проверяет подпись, срок и отзыв токена; возвращает его claims.
+
+    К claims добавляется 'exp' — момент истечения (UTC), он нужен при отзыве.
+    """
+    if not token:
+        raise InvalidToken('Missing token')
+    ttl = token_ttl(kind)
+    try:
+        claims, issued_at = serializer(kind).loads(token, max_age=ttl, return_timestamp=True)
+    except BadSignature:
+        raise InvalidToken('Invalid or expired token')
+    if revocations.is_revoked(claims['jti']):
+        raise InvalidToken('Token revoked')
+    claims['exp'] = datetime.utcfromtimestamp(issued_at.timestamp() + ttl)
+    return claims
+
+
+def revoke_token(claims):
+    """Отзывает токен до конца срока; запись сохраняется вместе с commit сессии.
+
+    Повторный отзыв того же токена нарушает первичный ключ jti — так
+    одноразовый refresh-токен нельзя обменять дважды даже на разных воркерах.
+    """
+    db.session.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete(
+        synchronize_session=False
+    )
+    db.session.add(RevokedToken(jti=claims['jti'], user_id=claims['sub'], expires_at=claims['exp']))
+    revocations.add(claims['jti'], claims['exp'])
+
+
+def bearer_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+def user_from_request(request):
+    """Пользователь по access-токену для маршрутов /api или None.
+
+    Поля берутся из кэша пользователей, если он их знает (там они сбрасываются
+    при каждом изменении), иначе из токена.
+    """
+    if request.blueprint != 'api':
+        return None
+    token = bearer_token(request)
+    if not token:
+        return None
+    try:
+        claims = verify_token(token, ACCESS)
+    except InvalidToken:
+        return None
+    fields = user_cache.get(claims['sub'])
+    if fields is None:
+        # Токены, выданные до сужения TOKEN_USER_FIELDS, могут нести лишние поля
+        fields = {name: value for name, value in claims['usr'].items() if name in TOKEN_USER_FIELDS}
+        fields['id'] = claims['sub']
+    return attach_user(fields)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from database import RoutingSession
+from metrics import USER_CACHE_REQUESTS
+from models import db, User
+
+# Поля, которые нужны почти каждому запросу. Счетчики и хеш пароля не кэшируются:
+# они догружаются из БД только при обращении и поэтому никогда не бывают устаревшими
+CACHED_FIELDS = ('id', 'username', 'email', 'avatar', 'profile_picture', 'bio', 'is_admin', 'created_at')
+
+
+class UserCache:
+    """Ограниченный LRU-кэш с TTL для полей пользователя из load_user.
+
+    Кэш живет в памяти процесса: изменения, сделанные другим воркером,
+    видны здесь не позже чем через ttl секунд.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(user_id)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, fields):
+        with self._lock:
+            self._items[user_id] = (time.monotonic() + self.ttl, fields)
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def load_cached_user(user_id):
+    """Пользователь для Flask-Login без SELECT, если поля есть в кэше.
+
+    Из кэша собирается объект, прикрепленный к сессии как загруженный из БД,
+    поэтому изменения его полей сохраняются обычным commit, а некэшированные
+    поля и связи догружаются лениво.
+    """
+    session = db.session()
+    user = session.identity_map.get(session.identity_key(User, user_id))
+    if user is not None:
+        return user
+
+    fields = user_cache.get(user_id)
+    if fields is None:
+        USER_CACHE_REQUESTS.labels('miss').inc()
+        user = session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, {name: getattr(user, name) for name in CACHED_FIELDS})
+        return user
+
+    USER_CACHE_REQUESTS.labels('hit').inc()
+    return attach_user(fields)
+
+
+def attach_user(fields):
+    """Пользователь из уже известных полей, прикрепленный к сессии без SELECT."""
+    session = db.session()
+    user = session.identity_map.get(session.identity_key(User, fields['id']))
+    if user is not None:
+        return user
+    user = User()
+    for name, value in fields.items():
+        set_committed_value(user, name, value)
+    make_transient_to_detached(user)
+    session.add(user)
+    return user
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def invalidate_flushed_users(session, flush_context):
+    # Любая запись пользователя через ORM (профиль, аватар, права администратора)
+    # сбрасывает кэш; повторно — после commit, чтобы параллельный запрос не успел
+    # закэшировать еще не закоммиченную старую версию
+    user_ids = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+    session.info.setdefault('changed_user_ids', set()).update(user_ids)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def invalidate_committed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_rolled_back_users(session):
+    session.info.pop('changed_user_ids', None)
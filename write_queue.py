@@ -0,0 +1,146 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import is_sqlite_memory
+from metrics import WRITE_QUEUE_GROUP_SIZE
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Сколько запрос ждет подтверждения записи, с
+ACK_TIMEOUT = 30
+
+write_queue = None
+
+
+class WriteQueue:
+    """Очередь мелких записей с групповым commit.
+
+    Операции выполняет один поток-писатель строго в порядке поступления,
+    поэтому порядок операций каждого пользователя сохраняется. Группа
+    фиксируется одним commit, как только набралось max_batch операций или
+    прошло max_delay секунд с первой операции группы. submit() возвращает
+    Future, который завершается после commit группы результатом операции
+    или ее исключением. Если группа падает, она откатывается и операции
+    повторяются по одной, чтобы ошибка одной не отменила остальные.
+    """
+
+    def __init__(self, app, max_batch, max_delay):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def submit(self, operation, *args):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Write queue is closed')
+            # Поток запускается при первой записи: после fork воркера — заново
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            self._queue.put((operation, args, future))
+        return future
+
+    def close(self, timeout=None):
+        """Перестает принимать операции и дожидается записи уже принятых."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            group = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            while len(group) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit_group(group)
+            if stopping:
+                return
+
+    def _commit_group(self, group):
+        WRITE_QUEUE_GROUP_SIZE.observe(len(group))
+        with self.app.app_context():
+            try:
+                results = []
+                for operation, args, future in group:
+                    results.append(operation(*args))
+                    # Следующая операция видит БД так же, как если бы шла отдельным запросом
+                    db.session.flush()
+                    db.session.expire_all()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.warning('Write group of %d failed, retrying one by one', len(group), exc_info=True)
+                for operation, args, future in group:
+                    self._commit_single(operation, args, future)
+                return
+
+        for (operation, args, future), result in zip(group, results):
+            future.set_result(result)
+
+    def _commit_single(self, operation, args, future):
+        try:
+            result = operation(*args)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+
+def init_write_queue(app):
+    """Включает очередь записи, если WRITE_QUEUE задан в окружении."""
+    global write_queue
+    if not app.config['WRITE_QUEUE_ENABLED']:
+        return
+    if is_sqlite_memory(app.config['SQLALCHEMY_DATABASE_URI']):
+        # У каждого потока была бы своя база в памяти
+        logger.warning('Write queue is disabled for in-memory SQLite')
+        return
+    write_queue = WriteQueue(
+        app, app.config['WRITE_QUEUE_MAX_BATCH'], app.config['WRITE_QUEUE_MAX_DELAY_MS'] / 1000
+    )
+    atexit.register(write_queue.close)
+
+
+def submit_write(operation, *args):
+    """Выполняет запись из writes.py и возвращает ее результат после commit.
+
+    Если очередь выключена, а также внутри /api/batch (у пакета своя
+    транзакция) запись идет прямо в сессии запроса.
+    """
+    if write_queue is None or db.session.info.get('deferred_commit'):
+        result = operation(*args)
+        db.session.commit()
+        return result
+    return write_queue.submit(operation, *args).result(timeout=ACK_TIMEOUT)
@@ -0,0 +1,74 @@
+from counters import increment
+from conversations import record_message
+from models import db, User, Post, Comment, Like, Follow, PrivateMessage
+from notifications import notify, retract
+from suggestions import mark_graph_changed
+from timeline import refresh_edge
+
+# Частые мелкие записи. Функции не трогают request и current_user и не делают
+# commit, поэтому их можно выполнить и в запросе, и в потоке очереди записи
+# (см. write_queue.py). Возвращают простые значения, а не объекты сессии.
+
+
+def write_like_toggle(user_id, post_id):
+    """Ставит или снимает лайк; True, если пост теперь лайкнут."""
+    like = Like.query.filter_by(user_id=user_id, post_id=post_id).first()
+    if like:
+        db.session.delete(like)
+        increment(Post, post_id, Post.likes_count, -1)
+        retract(post_author_id(post_id), 'like', post_id)
+        return False
+
+    db.session.add(Like(user_id=user_id, post_id=post_id))
+    increment(Post, post_id, Post.likes_count)
+    notify(post_author_id(post_id), 'like', post_id, user_id)
+    return True
+
+
+def post_author_id(post_id):
+    return db.session.query(Post.author_id).filter(Post.id == post_id).scalar()
+
+
+def write_comment(user_id, post_id, content):
+    comment = Comment(content=content, user_id=user_id, post_id=post_id)
+    db.session.add(comment)
+    increment(Post, post_id, Post.comments_count)
+    notify(post_author_id(post_id), 'comment', post_id, user_id)
+    db.session.flush()
+    return comment.id
+
+
+def write_message(sender_id, receiver_id, content):
+    """Сохраняет сообщение и сводку диалога; возвращает данные для события 'message'."""
+    message = PrivateMessage(sender_id=sender_id, receiver_id=receiver_id, content=content)
+    db.session.add(message)
+    record_message(message)
+    # Сообщения от одного собеседника сворачиваются в одно уведомление
+    notify(receiver_id, 'message', sender_id, sender_id)
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def write_follow_toggle(follower_id, followed_id):
+    """Подписывает или отписывает; True, если подписка теперь есть."""
+    follow = Follow.query.filter_by(follower_id=follower_id, followed_id=followed_id).first()
+    if follow:
+        db.session.delete(follow)
+        increment(User, follower_id, User.following_count, -1)
+        increment(User, followed_id, User.followers_count, -1)
+        refresh_edge(follower_id, followed_id)
+        mark_graph_changed(follower_id, followed_id)
+        return False
+
+    db.session.add(Follow(follower_id=follower_id, followed_id=followed_id))
+    increment(User, follower_id, User.following_count)
+    increment(User, followed_id, User.followers_count)
+    db.session.flush()
+    refresh_edge(follower_id, followed_id)
+    mark_graph_changed(follower_id, followed_id)
+    return True